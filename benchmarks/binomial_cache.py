@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import binomial  # noqa: E402
+import frames  # noqa: E402
+import util  # noqa: E402
+from container import Header  # noqa: E402
+
+DEFAULT_WINDOW_SIZES = (1 << 10, 1 << 12, 1 << 14)
+DEFAULT_REPEATS = 5
+
+
+def reset_cache(enabled: bool):
+    """
+    Empties the shared binomial coefficient cache, and enables or disables it.
+
+    :param enabled: whether coefficients are to be cached (otherwise every lookup falls through to gmpy2.bincoef).
+    """
+    cache = binomial.shared_binomial
+    cache.rows.clear()
+    cache.row_bytes.clear()
+    cache.cache_bytes = cache.hits = cache.misses = cache.evictions = 0
+    cache.min_cached_k = binomial.MIN_CACHED_K if enabled else sys.maxsize
+
+
+def run(header: Header, input_bytes: bytes, repeats: int) -> dict:
+    """
+    Compresses and decompresses the supplied bytes in memory, with and without the cache and each time from a cold
+    cache, and keeps the fastest times. The two modes alternate, so that drift in the speed of the machine affects both.
+
+    :param header: the header describing the window size.
+    :param input_bytes: the bytes of interest.
+    :param repeats: the number of times to repeat each measurement.
+    :return: a dictionary from whether the cache is enabled to the compression seconds, decompression seconds and the
+    cache counters after decompression.
+    """
+    results = {enabled: [float('inf'), float('inf'), None] for enabled in (False, True)}
+    for _ in range(repeats):
+        for enabled, result in results.items():
+            reset_cache(enabled)
+            start = time.perf_counter()
+            records = frames.compress_windows(header, input_bytes, set())
+            result[0] = min(result[0], time.perf_counter() - start)
+            reset_cache(enabled)
+            start = time.perf_counter()
+            decompressed_bytes = frames.decompress_windows(header, records, 0, util.empty_bitarray(256))
+            result[1] = min(result[1], time.perf_counter() - start)
+            result[2] = binomial.shared_binomial.stats()
+            assert decompressed_bytes == input_bytes
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare end-to-end speed with and without the binomial coefficient '
+                                                 'cache')
+    parser.add_argument('file', help='the file to compress (a prefix is used if it is larger than --length)')
+    parser.add_argument('-l', '--length', type=int, default=1 << 18, help='number of bytes of the file to use')
+    parser.add_argument('-w', '--window-sizes', type=int, nargs='+', default=DEFAULT_WINDOW_SIZES,
+                        help='window sizes to benchmark')
+    parser.add_argument('-r', '--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='number of times to repeat each measurement (the fastest is kept)')
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as infile:
+        input_bytes = infile.read(args.length)
+    print(f'{len(input_bytes)} bytes of {args.file}')
+    print(f'{"window":>8} {"cache":>6} {"compress":>10} {"decompress":>11} {"hits":>8} {"misses":>8}')
+    for window_size in args.window_sizes:
+        header = Header(window_size)
+        for enabled, (compression_seconds, decompression_seconds, cache_stats) in \
+                run(header, input_bytes, args.repeats).items():
+            print(f'{window_size:>8} {"on" if enabled else "off":>6} {compression_seconds:>9.3f}s '
+                  f'{decompression_seconds:>10.3f}s {cache_stats["hits"]:>8} {cache_stats["misses"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+import argparse
+import bz2
+import json
+import lzma
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+from main import compress_file, decompress_file  # noqa: E402
+
+DEFAULT_LENGTH = 1 << 18
+DEFAULT_WINDOW_SIZES = (1 << 10, 1 << 12, 1 << 14, 1 << 16)
+DEFAULT_MAX_WHOLE_WINDOW_SIZE = 1 << 16
+STDLIB_LEVELS = {'zlib': (1, 6, 9), 'bz2': (1, 9), 'lzma': (0, 6, 9)}
+# Executables that are usually present, tried in turn until enough bytes are gathered.
+EXECUTABLE_CANDIDATES = ('python3', 'ls', 'cp', 'sh', 'bash', 'grep', 'tar', 'git')
+IMAGE_WIDTH = 512
+
+
+def text(length: int) -> bytes:
+    """
+    Generates English-like text: words of a seeded vocabulary with Zipf-like frequencies, in sentences and paragraphs.
+
+    :param length: the number of bytes required.
+    :return: the text.
+    """
+    vocabulary = [''.join(random.choices('etaoinshrdlucmfwypvbgkjqxz', k=random.randint(1, 9)))
+                  for _ in range(2000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    result = []
+    size = 0
+    while size < length:
+        words = random.choices(vocabulary, weights, k=random.randint(5, 20))
+        sentence = ' '.join(words).capitalize() + random.choice('.....?!') + random.choice('  \n')
+        result.append(sentence)
+        size += len(sentence)
+    return ''.join(result).encode()[:length]
+
+
+def logs(length: int) -> bytes:
+    """
+    Generates application log lines: timestamps, levels, components, messages and identifiers.
+
+    :param length: the number of bytes required.
+    :return: the log.
+    """
+    components = ('http', 'db', 'cache', 'auth', 'scheduler', 'worker')
+    messages = ('request served', 'connection opened', 'connection closed', 'cache miss', 'cache hit',
+                'retrying after timeout', 'job finished', 'token refreshed', 'slow query')
+    result = []
+    size = 0
+    millis = 0
+    while size < length:
+        millis += random.randint(0, 250)
+        seconds, ms = divmod(millis, 1000)
+        minutes, seconds = divmod(seconds, 60)
+        line = (f'2026-01-01T{minutes // 60:02d}:{minutes % 60:02d}:{seconds:02d}.{ms:03d}Z '
+                f'{random.choices(("INFO", "DEBUG", "WARN", "ERROR"), (70, 20, 8, 2))[0]:<5} '
+                f'[{random.choice(components)}] {random.choice(messages)} id={random.randint(0, 99999):05d} '
+                f'latency_ms={random.expovariate(0.05):.1f}\n')
+        result.append(line)
+        size += len(line)
+    return ''.join(result).encode()[:length]
+
+
+def csv(length: int) -> bytes:
+    """
+    Generates CSV rows of identifiers, dates, categories, integers and prices.
+
+    :param length: the number of bytes required.
+    :return: the CSV.
+    """
+    result = ['id,date,region,quantity,price\n']
+    size = len(result[0])
+    row_id = 0
+    while size < length:
+        row_id += 1
+        row = (f'{row_id},2026-{random.randint(1, 12):02d}-{random.randint(1, 28):02d},'
+               f'{random.choice(("north", "south", "east", "west"))},{random.randint(1, 500)},'
+               f'{random.uniform(0.5, 999.99):.2f}\n')
+        result.append(row)
+        size += len(row)
+    return ''.join(result).encode()[:length]
+
+
+def executables(length: int) -> bytes:
+    """
+    Concatenates executables copied from the system, so the bytes depend on the system but not on the seed.
+
+    :param length: the number of bytes required.
+    :return: the executable bytes (fewer than required if too few executables are found).
+    """
+    result = bytearray()
+    for name in EXECUTABLE_CANDIDATES:
+        path = shutil.which(name)
+        if path is None:
+            continue
+        with open(path, 'rb') as infile:
+            result += infile.read(length - len(result))
+        if len(result) >= length:
+            break
+    return bytes(result)
+
+
+def sparse_image(length: int) -> bytes:
+    """
+    Generates a sparse 8-bit greyscale image (as a PGM file): a black background with a few flat rectangles and
+    gradients.
+
+    :param length: the number of bytes required.
+    :return: the image.
+    """
+    height = max(1, length // IMAGE_WIDTH)
+    pixels = bytearray(IMAGE_WIDTH * height)
+    for _ in range(max(1, height // 32)):
+        x, y = random.randrange(IMAGE_WIDTH), random.randrange(height)
+        width, rows = random.randint(8, 96), random.randint(8, 96)
+        shade = random.randint(1, 255)
+        gradient = random.random() < 0.5
+        for row in range(y, min(height, y + rows)):
+            for column in range(x, min(IMAGE_WIDTH, x + width)):
+                pixels[row * IMAGE_WIDTH + column] = (shade + column - x) & 0xff if gradient else shade
+    return (f'P5 {IMAGE_WIDTH} {height} 255\n'.encode() + pixels)[:length]
+
+
+def random_bytes(length: int) -> bytes:
+    """
+    Generates incompressible bytes.
+
+    :param length: the number of bytes required.
+    :return: the bytes.
+    """
+    return random.randbytes(length)
+
+
+DATA_CLASSES = {'text': text, 'logs': logs, 'csv': csv, 'executables': executables, 'sparse_image': sparse_image,
+                'random': random_bytes}
+
+
+def build_corpus(corpus_dir: str, length: int, seed: int) -> dict:
+    """
+    Writes a file of each data class to the corpus directory. Every class is seeded separately, so the corpus is the
+    same whatever classes are built.
+
+    :param corpus_dir: the directory of interest.
+    :param length: the number of bytes per file.
+    :param seed: the seed of the generators.
+    :return: a dictionary of the path of each file with at least one byte, keyed by data class.
+    """
+    paths = {}
+    for name, generate in DATA_CLASSES.items():
+        random.seed(f'{seed}:{name}')
+        data = generate(length)
+        if data:
+            paths[name] = os.path.join(corpus_dir, name)
+            with open(paths[name], 'wb') as outfile:
+                outfile.write(data)
+    return paths
+
+
+def peak_rss_mib() -> float:
+    """
+    Gets the peak resident set size of this process.
+
+    :return: the peak RSS in MiB.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1 << 20) if sys.platform == 'darwin' else max_rss / (1 << 10)  # bytes on macOS, KiB elsewhere
+
+
+def run_binomial(path: str, window_size: int, block_bits: int) -> (int, float, float, float):
+    """
+    Compresses and decompresses a file with main.compress_file and main.decompress_file, checking the round trip.
+    This runs in a fresh worker process, so the peak RSS is that of this one run.
+
+    :param path: the path of the file of interest.
+    :param window_size: the number of bytes per processing window.
+    :param block_bits: the number of bits per block for block ranking (0 to rank each bitset as a whole).
+    :return: the number of compressed bytes, compression seconds, decompression seconds and peak RSS in MiB.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        compressed_path = os.path.join(work_dir, 'compressed')
+        decompressed_path = os.path.join(work_dir, 'decompressed')
+        start = time.perf_counter()
+        compress_file(path, compressed_path, window_size, block_bits=block_bits)
+        compression_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        decompress_file(compressed_path, decompressed_path)
+        decompression_seconds = time.perf_counter() - start
+        with open(path, 'rb') as infile, open(decompressed_path, 'rb') as decompressed_file:
+            assert infile.read() == decompressed_file.read()
+        return os.stat(compressed_path).st_size, compression_seconds, decompression_seconds, peak_rss_mib()
+
+
+def run_stdlib(path: str, engine: str, level: int) -> (int, float, float, float):
+    """
+    Compresses and decompresses a file in memory with a standard library codec, checking the round trip. This runs in a
+    fresh worker process, so the peak RSS is that of this one run.
+
+    :param path: the path of the file of interest.
+    :param engine: the codec of interest (zlib, bz2 or lzma).
+    :param level: the compression level (the preset for lzma).
+    :return: the number of compressed bytes, compression seconds, decompression seconds and peak RSS in MiB.
+    """
+    start = time.perf_counter()
+    with open(path, 'rb') as infile:
+        data = infile.read()
+    if engine == 'lzma':
+        compressed = lzma.compress(data, preset=level)
+    else:
+        compressed = {'zlib': zlib, 'bz2': bz2}[engine].compress(data, level)
+    compression_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    decompressed = {'zlib': zlib, 'bz2': bz2, 'lzma': lzma}[engine].decompress(compressed)
+    decompression_seconds = time.perf_counter() - start
+    assert decompressed == data
+    return len(compressed), compression_seconds, decompression_seconds, peak_rss_mib()
+
+
+def runs(args) -> iter:
+    """
+    Generates the engine runs selected by the command line arguments.
+
+    :param args: the parsed command line arguments.
+    :return: a generator of (engine, setting, function, extra arguments) tuples.
+    """
+    for window_size in args.window_sizes:
+        if not args.block_bits and window_size > args.max_whole_window_size:
+            continue
+        setting = f'w={window_size}' + (f' b={args.block_bits}' if args.block_bits else '')
+        yield 'binomial', setting, run_binomial, (window_size, args.block_bits)
+    for engine, levels in STDLIB_LEVELS.items():
+        if engine in args.engines:
+            for level in levels:
+                yield engine, f'level={level}', run_stdlib, (engine, level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the codec with zlib, bz2 and lzma on a local corpus of data '
+                                                 'classes, for throughput, peak RSS and compression ratio')
+    parser.add_argument('-c', '--classes', nargs='+', choices=tuple(DATA_CLASSES), default=tuple(DATA_CLASSES),
+                        help='data classes to benchmark (default all)')
+    parser.add_argument('-l', '--length', type=int, default=DEFAULT_LENGTH, help='number of bytes per corpus file')
+    parser.add_argument('-w', '--window-sizes', type=int, nargs='+', default=DEFAULT_WINDOW_SIZES,
+                        help='window sizes to benchmark')
+    parser.add_argument('-b', '--block-bits', type=int, default=0, help='number of bits per block for block ranking '
+                                                                        '(default 0, i.e., rank whole bitsets)')
+    parser.add_argument('-m', '--max-whole-window-size', type=int, default=DEFAULT_MAX_WHOLE_WINDOW_SIZE,
+                        help='largest window size for which whole bitsets are ranked')
+    parser.add_argument('-e', '--engines', nargs='+', choices=tuple(STDLIB_LEVELS), default=tuple(STDLIB_LEVELS),
+                        help='standard library codecs to compare with (default all)')
+    parser.add_argument('-d', '--corpus-dir', help='directory to write the corpus to (default a temporary directory)')
+    parser.add_argument('-s', '--seed', type=int, default=74, help='seed of the corpus generators')
+    parser.add_argument('-o', '--output', help='file to write the results to as JSON')
+    args = parser.parse_args()
+
+    # Each run gets a fresh (spawned, not forked) worker process, so its peak RSS is its own.
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_dir = args.corpus_dir or temp_dir
+        os.makedirs(corpus_dir, exist_ok=True)
+        paths = build_corpus(corpus_dir, args.length, args.seed)
+        print(f'{"class":<13} {"engine":<9} {"setting":<14} {"ratio":>7} {"compress":>14} {"decompress":>14} '
+              f'{"peak RSS":>10}')
+        for data_class in args.classes:
+            if data_class not in paths:
+                print(f'{data_class:<13} (no data)')
+                continue
+            num_bytes = os.stat(paths[data_class]).st_size
+            megabytes = num_bytes / (1 << 20)
+            for engine, setting, fn, fn_args in runs(args):
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    num_compressed_bytes, compression_seconds, decompression_seconds, peak_rss = \
+                        pool.apply(fn, (paths[data_class], *fn_args))
+                result = {'class': data_class, 'engine': engine, 'setting': setting, 'num_bytes': num_bytes,
+                          'num_compressed_bytes': num_compressed_bytes, 'ratio': num_bytes / num_compressed_bytes,
+                          'compress_mb_per_s': megabytes / compression_seconds,
+                          'decompress_mb_per_s': megabytes / decompression_seconds, 'peak_rss_mib': peak_rss}
+                results.append(result)
+                print(f'{data_class:<13} {engine:<9} {setting:<14} {result["ratio"]:>7.3f} '
+                      f'{result["compress_mb_per_s"]:>9.2f} MB/s {result["decompress_mb_per_s"]:>9.2f} MB/s '
+                      f'{peak_rss:>6.1f} MiB')
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'length': args.length, 'seed': args.seed, 'results': results}, outfile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
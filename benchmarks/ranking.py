@@ -0,0 +1,70 @@
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import window_compressor  # noqa: E402
+from window_compressor import index_set_to_compression_index_split  # noqa: E402
+
+DEFAULT_NUM_BITS = (1024, 4096, 16384)
+DEFAULT_K_VALS = (64, 256, 512, 768, 1024, 1536, 2048, 4096)
+
+
+def term_by_term(index_set: list):
+    """
+    Ranks the supplied index set term by term, whatever its size.
+
+    :param index_set: the index set of interest.
+    :return: the compression index.
+    """
+    min_split_k = window_compressor.MIN_SPLIT_K
+    window_compressor.MIN_SPLIT_K = len(index_set) + 1
+    try:
+        return window_compressor.index_set_to_compression_index(index_set)
+    finally:
+        window_compressor.MIN_SPLIT_K = min_split_k
+
+
+def time_per_call(fn, index_sets: list, repeat: int) -> float:
+    """
+    Times the supplied ranking function, taking the best of several repeats.
+
+    :param fn: the ranking function of interest.
+    :param index_sets: the index sets to rank.
+    :param repeat: the number of repeats.
+    :return: the best time per index set in microseconds.
+    """
+    best = min(timeit.repeat(lambda: [fn(index_set) for index_set in index_sets], number=1, repeat=repeat))
+    return 1e6 * best / len(index_sets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare term-by-term and split ranking of random index sets')
+    parser.add_argument('-n', '--num-bits', type=int, nargs='+', default=DEFAULT_NUM_BITS,
+                        help='bitset lengths N to benchmark')
+    parser.add_argument('-k', '--k-vals', type=int, nargs='+', default=DEFAULT_K_VALS,
+                        help='population counts k to benchmark')
+    parser.add_argument('-c', '--count', type=int, default=10, help='number of random index sets per (N, k)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timing repeats')
+    args = parser.parse_args()
+
+    random.seed(74)
+    print(f'{"N":>6} {"k":>6} {"term (us)":>12} {"split (us)":>12} {"speedup":>8} {"used":>6}')
+    for num_bits in args.num_bits:
+        for k in args.k_vals:
+            if k > num_bits:
+                continue
+            index_sets = [sorted(random.sample(range(num_bits), k)) for _ in range(args.count)]
+            term = time_per_call(term_by_term, index_sets, args.repeat)
+            split = time_per_call(index_set_to_compression_index_split, index_sets, args.repeat)
+            used = 'split' if k >= window_compressor.min_split_k(num_bits) else 'term'
+            print(f'{num_bits:>6} {k:>6} {term:>12.0f} {split:>12.0f} {term / split:>8.2f} {used:>6}')
+    print(f'(Split ranking is used automatically from k = max({window_compressor.MIN_SPLIT_K}, '
+          f'{window_compressor.SPLIT_K_PER_ROOT_N} * sqrt(N)), taking N as the highest position plus one.)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import os
+import random
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import util  # noqa: E402
+from window_compressor import reduced_index_sets  # noqa: E402
+
+DEFAULT_WINDOW_SIZES = (1024, 4096, 65536, 1 << 20)
+DEFAULT_ALPHABET_SIZES = (4, 16, 64, 256)
+
+
+def reduced_index_sets_with_masks(input_bytes: bytes) -> list:
+    """
+    Computes the reduced index sets of every byte value present, as WindowCompressor.process did before: one
+    full-length bitset per byte value, ORed into a running mask of removed positions, which is then deleted from it.
+
+    :param input_bytes: the bytes of the window.
+    :return: a list of index sets, one per byte value present.
+    """
+    num_bytes = len(input_bytes)
+    byte_positions = [[] for _ in range(256)]
+    for position, b in enumerate(input_bytes):
+        byte_positions[b].append(position)
+    index_sets = []
+    to_remove = util.empty_bitarray(num_bytes)
+    for positions in byte_positions:
+        if positions:
+            bitset = util.empty_bitarray(num_bytes)
+            bitset[positions] = 1
+            to_remove2 = to_remove | bitset
+            del bitset[to_remove]
+            to_remove = to_remove2
+            index_sets.append(util.get_index_set(bitset))
+    return index_sets
+
+
+def reduced_index_sets_vectorised(input_bytes: bytes) -> list:
+    """
+    Computes the reduced index sets of every byte value present with window_compressor.reduced_index_sets.
+
+    :param input_bytes: the bytes of the window.
+    :return: a list of index sets, one per byte value present.
+    """
+    window = np.frombuffer(input_bytes, dtype=np.uint8)
+    return reduced_index_sets(window, np.flatnonzero(np.bincount(window, minlength=256)).tolist())
+
+
+def time_per_call(fn, input_bytes: bytes, repeat: int) -> float:
+    """
+    Times the supplied reduction function, taking the best of several repeats.
+
+    :param fn: the reduction function of interest.
+    :param input_bytes: the bytes of the window.
+    :param repeat: the number of repeats.
+    :return: the best time per window in milliseconds.
+    """
+    number = max(1, (1 << 18) // len(input_bytes))
+    return 1e3 * min(timeit.repeat(lambda: fn(input_bytes), number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare mask-based and vectorised reduction of random windows')
+    parser.add_argument('-w', '--window-sizes', type=int, nargs='+', default=DEFAULT_WINDOW_SIZES,
+                        help='window sizes to benchmark')
+    parser.add_argument('-a', '--alphabet-sizes', type=int, nargs='+', default=DEFAULT_ALPHABET_SIZES,
+                        help='numbers of distinct byte values to benchmark (at most 256)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timing repeats')
+    args = parser.parse_args()
+
+    random.seed(74)
+    print(f'{"window":>8} {"alphabet":>8} {"masks (ms)":>11} {"vector (ms)":>12} {"speedup":>8}')
+    for window_size in args.window_sizes:
+        for alphabet_size in args.alphabet_sizes:
+            # Zipf-like byte frequencies, so the alphabet is skewed as in real data.
+            input_bytes = bytes(random.choices(range(alphabet_size), k=window_size,
+                                               weights=[1 / (rank + 1) for rank in range(alphabet_size)]))
+            assert reduced_index_sets_vectorised(input_bytes) == reduced_index_sets_with_masks(input_bytes)
+            masks = time_per_call(reduced_index_sets_with_masks, input_bytes, args.repeat)
+            vectorised = time_per_call(reduced_index_sets_vectorised, input_bytes, args.repeat)
+            print(f'{window_size:>8} {alphabet_size:>8} {masks:>11.2f} {vectorised:>12.2f} {masks / vectorised:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,450 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+
+import gmpy2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests'))
+
+import byte_util  # noqa: E402
+import util  # noqa: E402
+import window_decompressor  # noqa: E402
+from binomial import Binomial  # noqa: E402
+from ranking import term_by_term  # noqa: E402
+from reduction import reduced_index_sets_with_masks  # noqa: E402
+from window_compressor import (index_set_to_compression_index_alternative,  # noqa: E402
+                               index_set_to_compression_index_split, reduced_index_sets)
+from window_decompressor import compression_index_to_index_set  # noqa: E402
+
+DEFAULT_NUM_BITS = (1024, 4096, 16384)
+DEFAULT_K_VALS = (16, 128, 1024)
+DEFAULT_WINDOW_SIZES = (1024, 4096, 16384)
+DEFAULT_ALPHABET_SIZES = (4, 16, 64, 256)
+# Gosper's hack steps through every bitset of the same population count, so it is only timed for tiny bitsets.
+GOSPER_NUM_BITS = (16, 20)
+GOSPER_K_VALS = (2, 3)
+# The falling factorial ranking costs O(k^2) bignum multiplications, so it is only timed for small k.
+MAX_ALTERNATIVE_K = 128
+# Number of consecutive coefficients (N, k), (N-1, k), ... fetched per call when timing the binomial coefficients.
+BINOMIAL_ROW_LENGTH = 64
+DEFAULT_MIN_SECONDS = 0.05
+DEFAULT_TOLERANCE = 0.1
+
+
+def linear_unranking(index: int, k_val: int, num_bits: int) -> list:
+    """
+    Unranks the supplied compression index by walking down the binomial coefficients only, never estimating positions.
+
+    :param index: the compression index of interest.
+    :param k_val: the k parameter of interest.
+    :param num_bits: the number of bits of the decompressed bitset.
+    :return: the positions of the "on" bits of the decompressed bitset, in descending order.
+    """
+    max_linear_steps = window_decompressor.MAX_LINEAR_STEPS
+    window_decompressor.MAX_LINEAR_STEPS = num_bits
+    try:
+        return compression_index_to_index_set(index, k_val, num_bits)
+    finally:
+        window_decompressor.MAX_LINEAR_STEPS = max_linear_steps
+
+
+def rehydrate_vectorised(num_bytes: int, byte_index_sets: list) -> bytes:
+    """
+    Rehydrates a window from its reduced index sets as WindowDecompressor.process_into does.
+
+    :param num_bytes: the number of bytes of the window.
+    :param byte_index_sets: a list of (byte value, reduced index set) tuples, in byte value order.
+    :return: the bytes of the window.
+    """
+    unoccupied_positions = np.arange(num_bytes)
+    rehydrated_bytes = np.zeros(num_bytes, dtype=np.uint8)
+    for byte_val, index_set in byte_index_sets:
+        rehydrated_bytes[unoccupied_positions[index_set]] = byte_val
+        unoccupied_positions = np.delete(unoccupied_positions, index_set)
+    return rehydrated_bytes.tobytes()
+
+
+def rehydrate_original(num_bytes: int, byte_bitsets: list) -> bytes:
+    """
+    Rehydrates a window from its reduced bitsets with the original pure-Python loop: a walk over every position of the
+    window for each bitset, skipping the occupied ones.
+
+    :param num_bytes: the number of bytes of the window.
+    :param byte_bitsets: a list of (byte value, reduced bitset) tuples, in byte value order.
+    :return: the bytes of the window.
+    """
+    occupied_positions = util.empty_bitarray(num_bytes)
+    rehydrated_bytes = bytearray(num_bytes)
+    for byte_val, bitset in byte_bitsets:
+        inner_i = 0
+        for outer_i in range(num_bytes):
+            if occupied_positions[outer_i]:
+                continue
+            if bitset[inner_i]:
+                rehydrated_bytes[outer_i] = byte_val
+                occupied_positions[outer_i] = 1
+            inner_i += 1
+    return bytes(rehydrated_bytes)
+
+
+def rehydrate_alternative_1(num_bytes: int, byte_bitsets: list) -> bytes:
+    """
+    Rehydrates a window from its reduced bitsets with pure-Python alternative 1: a walk over the index set of the
+    unoccupied positions, stopping once every bit of the bitset is placed.
+
+    :param num_bytes: the number of bytes of the window.
+    :param byte_bitsets: a list of (byte value, reduced bitset) tuples, in byte value order.
+    :return: the bytes of the window.
+    """
+    unoccupied_positions = util.full_bitarray(num_bytes)
+    rehydrated_bytes = bytearray(num_bytes)
+    for byte_val, bitset in byte_bitsets:
+        bitset_count = bitset.count(1)
+        num_byte_assignments = 0
+        for inner_i, outer_i in enumerate(util.get_index_set(unoccupied_positions)):
+            if bitset[inner_i]:
+                num_byte_assignments += 1
+                rehydrated_bytes[outer_i] = byte_val
+                unoccupied_positions[outer_i] = 0
+                if num_byte_assignments == bitset_count:
+                    break
+    return bytes(rehydrated_bytes)
+
+
+def rehydrate_alternative_2(num_bytes: int, byte_bitsets: list) -> bytes:
+    """
+    Rehydrates a window from its reduced bitsets with pure-Python alternative 2: a full walk over the index set of the
+    unoccupied positions.
+
+    :param num_bytes: the number of bytes of the window.
+    :param byte_bitsets: a list of (byte value, reduced bitset) tuples, in byte value order.
+    :return: the bytes of the window.
+    """
+    occupied_positions = util.empty_bitarray(num_bytes)
+    rehydrated_bytes = bytearray(num_bytes)
+    for byte_val, bitset in byte_bitsets:
+        for inner_i, outer_i in enumerate(util.get_index_set(~occupied_positions)):
+            if bitset[inner_i]:
+                rehydrated_bytes[outer_i] = byte_val
+                occupied_positions[outer_i] = 1
+    return bytes(rehydrated_bytes)
+
+
+def rehydrate_alternative_3(num_bytes: int, byte_bitsets: list) -> bytes:
+    """
+    Rehydrates a window from its reduced bitsets with pure-Python alternative 3: each bitset is expanded to full length
+    by inserting the occupied positions, tracked as a bitset.
+
+    :param num_bytes: the number of bytes of the window.
+    :param byte_bitsets: a list of (byte value, reduced bitset) tuples, in byte value order.
+    :return: the bytes of the window.
+    """
+    prev_bitset = util.empty_bitarray(num_bytes)
+    rehydrated_bytes = bytearray(num_bytes)
+    for byte_val, bitset in byte_bitsets:
+        bitset = bitset.copy()
+        for i in util.get_index_set(prev_bitset):
+            bitset.insert(i, 0)
+        for i in util.get_index_set(bitset):
+            rehydrated_bytes[i] = byte_val
+        prev_bitset |= bitset
+    return bytes(rehydrated_bytes)
+
+
+def rehydrate_alternative_4(num_bytes: int, byte_bitsets: list) -> bytes:
+    """
+    Rehydrates a window from its reduced bitsets with pure-Python alternative 4: as alternative 3, but with the occupied
+    positions tracked as a sorted list.
+
+    :param num_bytes: the number of bytes of the window.
+    :param byte_bitsets: a list of (byte value, reduced bitset) tuples, in byte value order.
+    :return: the bytes of the window.
+    """
+    prev_index_set = []
+    rehydrated_bytes = bytearray(num_bytes)
+    for byte_val, bitset in byte_bitsets:
+        bitset = bitset.copy()
+        for i in prev_index_set:
+            bitset.insert(i, 0)
+        for i in util.get_index_set(bitset):
+            rehydrated_bytes[i] = byte_val
+        prev_index_set = sorted(prev_index_set + util.get_index_set(bitset))
+    return bytes(rehydrated_bytes)
+
+
+def ranking_cases(args) -> iter:
+    """
+    Generates the ranking cases: term by term, by binary splitting and by falling factorials.
+
+    :param args: the parsed command line arguments.
+    :return: a generator of (parameters, variants, whether the variants must agree) tuples.
+    """
+    for num_bits in args.num_bits:
+        for k in args.k_vals:
+            if k > num_bits:
+                continue
+            params = {'N': num_bits, 'k': k}
+            seed(args, 'ranking', params)
+            index_set = byte_util.random_index_set(num_bits, k)
+            variants = {'term': lambda: term_by_term(index_set),
+                        'split': lambda: index_set_to_compression_index_split(index_set)}
+            if k <= MAX_ALTERNATIVE_K:
+                variants['falling_factorial'] = lambda: index_set_to_compression_index_alternative(index_set)
+            yield params, variants, True
+
+
+def gosper_cases(args) -> iter:
+    """
+    Generates the cases comparing Gosper's hack with term-by-term ranking. Gosper's hack counts bitsets in another
+    order, so the ranks differ.
+
+    :param args: the parsed command line arguments.
+    :return: a generator of (parameters, variants, whether the variants must agree) tuples.
+    """
+    for num_bits in GOSPER_NUM_BITS:
+        for k in GOSPER_K_VALS:
+            params = {'N': num_bits, 'k': k}
+            seed(args, 'gosper', params)
+            index_set = byte_util.random_index_set(num_bits, k)
+            bitset = util.empty_bitarray(num_bits)
+            bitset[index_set] = 1
+            yield params, {'gosper': lambda: util.gosper_rank(bitset), 'term': lambda: term_by_term(index_set)}, False
+
+
+def unranking_cases(args) -> iter:
+    """
+    Generates the unranking cases: with coefficients from gmpy2.bincoef or a binomial coefficient cache, and without
+    estimating positions.
+
+    :param args: the parsed command line arguments.
+    :return: a generator of (parameters, variants, whether the variants must agree) tuples.
+    """
+    for num_bits in args.num_bits:
+        for k in args.k_vals:
+            if k > num_bits:
+                continue
+            params = {'N': num_bits, 'k': k}
+            seed(args, 'unranking', params)
+            index = index_set_to_compression_index_split(byte_util.random_index_set(num_bits, k))
+            binomial = Binomial()
+            yield params, {'bincoef': lambda: compression_index_to_index_set(index, k, num_bits),
+                           'cached': lambda: compression_index_to_index_set(index, k, num_bits, binomial),
+                           'linear': lambda: linear_unranking(index, k, num_bits)}, True
+
+
+def binomial_cases(args) -> iter:
+    """
+    Generates the binomial coefficient cases: a walk down a column of coefficients, as unranking takes, from
+    gmpy2.bincoef and from a (warm) binomial coefficient cache.
+
+    :param args: the parsed command line arguments.
+    :return: a generator of (parameters, variants, whether the variants must agree) tuples.
+    """
+    for num_bits in args.num_bits:
+        for k in args.k_vals:
+            if k + BINOMIAL_ROW_LENGTH > num_bits:
+                continue
+            params = {'N': num_bits, 'k': k}
+            rows = range(num_bits, num_bits - BINOMIAL_ROW_LENGTH, -1)
+            binomial = Binomial(min_cached_k=0)
+            yield params, {'bincoef': lambda: [gmpy2.bincoef(n, k) for n in rows],
+                           'cached': lambda: [binomial.get(n, k) for n in rows]}, True
+
+
+def reduction_cases(args) -> iter:
+    """
+    Generates the reduction cases: mask-based and vectorised reduction of a window to index sets.
+
+    :param args: the parsed command line arguments.
+    :return: a generator of (parameters, variants, whether the variants must agree) tuples.
+    """
+    for window_size in args.window_sizes:
+        for alphabet_size in args.alphabet_sizes:
+            params = {'N': window_size, 'alphabet': alphabet_size}
+            seed(args, 'reduction', params)
+            input_bytes = byte_util.skewed_bytes(window_size, alphabet_size)
+            window = np.frombuffer(input_bytes, dtype=np.uint8)
+            byte_vals = sorted(set(input_bytes))
+            yield params, {'masks': lambda: reduced_index_sets_with_masks(input_bytes),
+                           'vectorised': lambda: reduced_index_sets(window, byte_vals)}, True
+
+
+def rehydration_cases(args) -> iter:
+    """
+    Generates the rehydration cases: the original pure-Python loop, its alternatives and the vectorised scatter of the
+    decompressor.
+
+    :param args: the parsed command line arguments.
+    :return: a generator of (parameters, variants, whether the variants must agree) tuples.
+    """
+    for window_size in args.window_sizes:
+        for alphabet_size in args.alphabet_sizes:
+            params = {'N': window_size, 'alphabet': alphabet_size}
+            seed(args, 'rehydration', params)
+            input_bytes = byte_util.skewed_bytes(window_size, alphabet_size)
+            byte_vals = sorted(set(input_bytes))
+            index_sets = reduced_index_sets(np.frombuffer(input_bytes, dtype=np.uint8), byte_vals)
+            byte_index_sets = list(zip(byte_vals, index_sets))
+            byte_bitsets = []
+            num_unoccupied = window_size
+            for byte_val, index_set in byte_index_sets:
+                bitset = util.empty_bitarray(num_unoccupied)
+                bitset[index_set] = 1
+                byte_bitsets.append((byte_val, bitset))
+                num_unoccupied -= len(index_set)
+            variants = {f'alternative_{i}': lambda fn=fn: fn(window_size, byte_bitsets)
+                        for i, fn in enumerate((rehydrate_alternative_1, rehydrate_alternative_2,
+                                                rehydrate_alternative_3, rehydrate_alternative_4), 1)}
+            variants['original'] = lambda: rehydrate_original(window_size, byte_bitsets)
+            variants['vectorised'] = lambda: rehydrate_vectorised(window_size, byte_index_sets)
+            yield params, variants, True
+
+
+BENCHMARKS = {'ranking': ranking_cases, 'gosper': gosper_cases, 'unranking': unranking_cases,
+              'binomial': binomial_cases, 'reduction': reduction_cases, 'rehydration': rehydration_cases}
+
+
+def seed(args, benchmark: str, params: dict):
+    """
+    Seeds the random generator for one case, so every case gets the same inputs whichever benchmarks are run.
+
+    :param args: the parsed command line arguments.
+    :param benchmark: the name of the benchmark.
+    :param params: the parameters of the case.
+    """
+    random.seed(f'{args.seed}:{benchmark}:{format_params(params)}')
+
+
+def format_params(params: dict) -> str:
+    """
+    Formats the parameters of a case, e.g., N=1024 k=16.
+
+    :param params: the parameters of interest.
+    :return: the formatted parameters.
+    """
+    return ' '.join(f'{name}={val}' for name, val in params.items())
+
+
+def time_per_call(fn, repeat: int, min_seconds: float) -> (object, float):
+    """
+    Times the supplied function, taking the best of several repeats of enough calls to last at least min_seconds.
+
+    :param fn: the function of interest, taking no arguments.
+    :param repeat: the number of repeats.
+    :param min_seconds: the minimum duration of each repeat.
+    :return: the result of the function and the best time per call in seconds.
+    """
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    number = max(1, int(min_seconds / seconds)) if seconds else 1000
+    return result, min(seconds, min(timeit.repeat(fn, number=number, repeat=repeat)) / number)
+
+
+def run(args) -> list:
+    """
+    Runs the selected benchmarks, printing a line per variant and checking that variants agree where they should.
+
+    :param args: the parsed command line arguments.
+    :return: a list of result dictionaries (benchmark, variant, params and seconds per call).
+    """
+    results = []
+    print(f'{"benchmark":<12} {"params":<22} {"variant":<18} {"time (us)":>12}')
+    for benchmark in args.benchmarks:
+        for params, variants, must_agree in BENCHMARKS[benchmark](args):
+            expected = None
+            for variant, fn in variants.items():
+                result, seconds = time_per_call(fn, args.repeat, args.min_seconds)
+                if must_agree:
+                    if expected is None:
+                        expected = result
+                    assert result == expected, f'{benchmark} {variant} disagrees for {format_params(params)}'
+                print(f'{benchmark:<12} {format_params(params):<22} {variant:<18} {1e6 * seconds:>12.1f}')
+                results.append({'benchmark': benchmark, 'variant': variant, 'params': params, 'seconds': seconds})
+    return results
+
+
+def result_key(result: dict) -> tuple:
+    """
+    Gets the key by which a result is matched against a baseline.
+
+    :param result: the result dictionary of interest.
+    :return: the key.
+    """
+    return result['benchmark'], result['variant'], format_params(result['params'])
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """
+    Compares results with a baseline, printing the ratio of each time to its baseline time.
+
+    :param results: the result dictionaries of this run.
+    :param baseline: the result dictionaries of the baseline run.
+    :param tolerance: the fractional slowdown above which a result is flagged as a regression.
+    :return: the keys of the regressed results.
+    """
+    baseline_seconds = {result_key(result): result['seconds'] for result in baseline}
+    regressions = []
+    print(f'{"benchmark":<12} {"params":<22} {"variant":<18} {"ratio":>8}')
+    for result in results:
+        key = result_key(result)
+        if key not in baseline_seconds:
+            continue
+        ratio = result['seconds'] / baseline_seconds[key]
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = ' REGRESSION'
+        print(f'{key[0]:<12} {key[2]:<22} {key[1]:<18} {ratio:>8.2f}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the competing implementations of ranking, unranking, binomial '
+                                                 'coefficients, reduction and rehydration')
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS),
+                        help=f'benchmarks to run, from {", ".join(BENCHMARKS)} (default all)')
+    parser.add_argument('-n', '--num-bits', type=int, nargs='+', default=DEFAULT_NUM_BITS,
+                        help='bitset lengths N for ranking, unranking and binomial coefficients')
+    parser.add_argument('-k', '--k-vals', type=int, nargs='+', default=DEFAULT_K_VALS,
+                        help='population counts k for ranking, unranking and binomial coefficients')
+    parser.add_argument('-w', '--window-sizes', type=int, nargs='+', default=DEFAULT_WINDOW_SIZES,
+                        help='window sizes for reduction and rehydration')
+    parser.add_argument('-a', '--alphabet-sizes', type=int, nargs='+', default=DEFAULT_ALPHABET_SIZES,
+                        help='numbers of distinct byte values for reduction and rehydration (at most 256)')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='number of timing repeats')
+    parser.add_argument('-m', '--min-seconds', type=float, default=DEFAULT_MIN_SECONDS,
+                        help='minimum duration of each timing repeat')
+    parser.add_argument('-s', '--seed', type=int, default=74, help='seed of the input generators')
+    parser.add_argument('-o', '--output', help='file to write the results to as JSON')
+    parser.add_argument('-c', '--compare', metavar='BASELINE',
+                        help='JSON results to compare with; exits with status 1 if any variant regressed')
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'fractional slowdown flagged as a regression (default {DEFAULT_TOLERANCE})')
+    args = parser.parse_args()
+    if unknown := set(args.benchmarks) - set(BENCHMARKS):
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results},
+                      outfile, indent=2)
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regression(s) beyond {100 * args.tolerance:0.0f}%')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import block_ranking  # noqa: E402
+import frames  # noqa: E402
+import util  # noqa: E402
+from container import Header  # noqa: E402
+
+DEFAULT_WINDOW_SIZES = (1 << 10, 1 << 12, 1 << 14, 1 << 16, 1 << 18, 1 << 20)
+DEFAULT_MAX_WHOLE_WINDOW_SIZE = 1 << 16
+
+
+def run(header: Header, input_bytes: bytes) -> (int, float, float):
+    """
+    Compresses and decompresses the supplied bytes in memory, including record framing.
+
+    :param header: the header describing the window size and ranking mode.
+    :param input_bytes: the bytes of interest.
+    :return: the number of compressed bytes (header and records), compression seconds and decompression seconds.
+    """
+    start = time.perf_counter()
+    records = frames.compress_windows(header, input_bytes, set())
+    compression_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    decompressed_bytes = frames.decompress_windows(header, records, 0, util.empty_bitarray(256))
+    decompression_seconds = time.perf_counter() - start
+    assert decompressed_bytes == input_bytes
+    return len(records), compression_seconds, decompression_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep the window size end to end, for each ranking mode')
+    parser.add_argument('file', help='the file to compress (a prefix is used if it is larger than --length)')
+    parser.add_argument('-l', '--length', type=int, default=1 << 20, help='number of bytes of the file to use')
+    parser.add_argument('-w', '--window-sizes', type=int, nargs='+', default=DEFAULT_WINDOW_SIZES,
+                        help='window sizes to benchmark')
+    parser.add_argument('-b', '--block-bits', type=int, nargs='+', default=(0, *block_ranking.BLOCK_SIZES),
+                        help='ranking modes to benchmark (0 ranks whole bitsets)')
+    parser.add_argument('-m', '--max-whole-window-size', type=int, default=DEFAULT_MAX_WHOLE_WINDOW_SIZE,
+                        help='largest window size for which whole bitsets are ranked (their unranking cost grows '
+                             'with the product of window size and byte count)')
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as infile:
+        input_bytes = infile.read(args.length)
+    megabytes = len(input_bytes) / (1 << 20)
+    print(f'{len(input_bytes)} bytes of {args.file}')
+    print(f'{"window":>8} {"mode":>6} {"saving":>8} {"compress":>13} {"decompress":>13}')
+    for window_size in args.window_sizes:
+        for block_bits in args.block_bits:
+            if not block_bits and window_size > args.max_whole_window_size:
+                continue
+            header = Header(window_size, block_bits=block_bits)
+            num_compressed_bytes, compression_seconds, decompression_seconds = run(header, input_bytes)
+            saving = 100 * (1 - num_compressed_bytes / len(input_bytes))
+            mode = f'{block_bits}-bit' if block_bits else 'whole'
+            print(f'{window_size:>8} {mode:>6} {saving:>7.2f}% {megabytes / compression_seconds:>8.3f} MB/s '
+                  f'{megabytes / decompression_seconds:>8.3f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
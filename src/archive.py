@@ -0,0 +1,326 @@
+import mmap
+import os
+
+import codec
+import frames
+import util
+from bytes_analyser import BytesAnalyser
+from container import NUM_BYTES_FOR_OFFSETS
+
+ARCHIVE_MAGIC_BYTES = b'ajr74a'
+ARCHIVE_FORMAT_VERSION = 1
+
+
+class MemberTable:
+    """
+    The member table of an archive, persisted as a footer after the members. Member i is named by its path within the
+    archive (with '/' separators) and records the file offset and size of its compressed file and the number of its
+    original bytes. Each entry is a variable-length integer name length, the UTF-8 name, and variable-length integer
+    offset and sizes. The footer closes with the file offset of the table and the number of members.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.compressed_offsets = []
+        self.compressed_sizes = []
+        self.uncompressed_sizes = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, name: str, compressed_offset: int, compressed_size: int, uncompressed_size: int):
+        """
+        Adds the next member.
+
+        :param name: the path of the member within the archive.
+        :param compressed_offset: the file offset of the member's compressed file.
+        :param compressed_size: the number of bytes of the member's compressed file.
+        :param uncompressed_size: the number of original bytes of the member.
+        """
+        self.names.append(name)
+        self.compressed_offsets.append(compressed_offset)
+        self.compressed_sizes.append(compressed_size)
+        self.uncompressed_sizes.append(uncompressed_size)
+
+    def find(self, name: str) -> int:
+        """
+        Finds a member by name.
+
+        :param name: the path of the member within the archive.
+        :return: the number of the member.
+        :raises KeyError: if there is no such member.
+        """
+        try:
+            return self.names.index(name)
+        except ValueError:
+            raise KeyError(f'No such member: {name}') from None
+
+    def write(self, outfile, analyser: BytesAnalyser):
+        """
+        Writes the member table footer to the specified output file, at its current offset.
+
+        :param outfile: the output file to write to.
+        :param analyser: the bytes analyser to update (whose byte count gives the offset of the table).
+        """
+        table_offset = analyser.num_bytes
+        table = bytearray()
+        for name, compressed_offset, compressed_size, uncompressed_size in zip(self.names, self.compressed_offsets,
+                                                                              self.compressed_sizes,
+                                                                              self.uncompressed_sizes):
+            encoded_name = name.encode('utf-8')
+            table += util.encode_varint(len(encoded_name)) + encoded_name
+            table += util.encode_varint(compressed_offset)
+            table += util.encode_varint(compressed_size)
+            table += util.encode_varint(uncompressed_size)
+        table += table_offset.to_bytes(NUM_BYTES_FOR_OFFSETS, 'big')
+        table += len(self).to_bytes(NUM_BYTES_FOR_OFFSETS, 'big')
+        util.write_bytes(outfile, analyser, bytes(table))
+
+    @staticmethod
+    def read(infile) -> 'MemberTable':
+        """
+        Reads the member table footer from the end of the specified (seekable) archive, checking its magic bytes.
+
+        :param infile: the archive to read from.
+        :return: the member table.
+        :raises ValueError: if the input is not an archive or its member table is truncated or corrupt.
+        """
+        infile.seek(0)
+        if infile.read(len(ARCHIVE_MAGIC_BYTES)) != ARCHIVE_MAGIC_BYTES:
+            raise ValueError('Incorrect archive format!')
+        version = infile.read(1)
+        if not version or version[0] != ARCHIVE_FORMAT_VERSION:
+            raise ValueError(f'Unsupported archive version: {version.hex()}')
+        file_size = infile.seek(0, os.SEEK_END)
+        if file_size < archive_header_size() + 2 * NUM_BYTES_FOR_OFFSETS:
+            raise ValueError('Truncated archive!')
+        infile.seek(-2 * NUM_BYTES_FOR_OFFSETS, os.SEEK_END)
+        table_offset = int.from_bytes(infile.read(NUM_BYTES_FOR_OFFSETS), 'big')
+        num_members = int.from_bytes(infile.read(NUM_BYTES_FOR_OFFSETS), 'big')
+        table_end = file_size - 2 * NUM_BYTES_FOR_OFFSETS
+        if not archive_header_size() <= table_offset <= table_end:
+            raise ValueError('Truncated archive!')
+        infile.seek(table_offset)
+        table = infile.read(table_end - table_offset)
+        member_table = MemberTable()
+        start = 0
+        for _ in range(num_members):
+            name_size, start = util.decode_varint(table, start)
+            name = table[start:start + name_size].decode('utf-8')
+            start += name_size
+            compressed_offset, start = util.decode_varint(table, start)
+            compressed_size, start = util.decode_varint(table, start)
+            uncompressed_size, start = util.decode_varint(table, start)
+            member_table.add(name, compressed_offset, compressed_size, uncompressed_size)
+        return member_table
+
+
+def archive_header_size() -> int:
+    """
+    The number of bytes of the archive header: magic bytes and format version.
+
+    :return: the number of bytes of the header.
+    """
+    return len(ARCHIVE_MAGIC_BYTES) + 1
+
+
+def member_paths(paths) -> list:
+    """
+    Gets the files to archive for the supplied paths, with their names within the archive. A directory stands for
+    every file beneath it, in sorted order. Names are the paths as given (with '/' separators, and any leading '/' or
+    drive removed), so members extract to the same relative paths. A file named more than once (by the same or another
+    path) is archived once.
+
+    :param paths: the paths of the files and directories of interest.
+    :return: a list of (name, path) tuples.
+    :raises FileNotFoundError: if a path does not exist.
+    :raises ValueError: if two different files have the same name within the archive (e.g., 'a/x' and '../a/x').
+    """
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, file_names in os.walk(path):
+                subdirectories.sort()
+                file_paths.extend(os.path.join(directory, file_name) for file_name in sorted(file_names))
+        elif os.path.isfile(path):
+            file_paths.append(path)
+        else:
+            raise FileNotFoundError(f'{path} does not exist or is not a regular file or directory')
+    result = {}
+    real_paths = {}  # name -> real path of the file archived under it
+    for file_path in file_paths:
+        if os.path.isfile(file_path):
+            name = member_name(file_path)
+            real_path = os.path.realpath(file_path)
+            if name not in result:
+                result[name] = file_path
+                real_paths[name] = real_path
+            elif real_paths[name] != real_path:
+                raise ValueError(f'{result[name]} and {file_path} would both be archived as {name}')
+    return list(result.items())
+
+
+def member_name(path: str) -> str:
+    """
+    Gets the name within an archive of a file path: the normalised path, with '/' separators and no leading '/', drive
+    or '..' components (as tar does), so that it always extracts beneath the extraction directory.
+
+    :param path: the path of interest.
+    :return: the name.
+    """
+    parts = os.path.splitdrive(os.path.normpath(path))[1].replace(os.sep, '/').split('/')
+    return '/'.join(part for part in parts if part not in ('', '..'))
+
+
+def extraction_path(output_dir: str, name: str) -> str:
+    """
+    Gets the path to which a member extracts.
+
+    :param output_dir: the directory to extract into.
+    :param name: the name of the member.
+    :return: the path of the extracted file.
+    :raises ValueError: if the name is absolute or leaves the directory (e.g., through '..').
+    """
+    parts = name.split('/')
+    if not name or name.startswith('/') or any(part in ('', '.', '..') for part in parts):
+        raise ValueError(f'Unsafe member name: {name}')
+    return os.path.join(output_dir, *parts)
+
+
+def compress_member(path: str, options: dict) -> (bytes, int):
+    """
+    Compresses a file to a standalone compressed file in memory. This is the unit of work handed to a worker process,
+    so it must remain a picklable module-level function. Workers persist across members, so each keeps its shared
+    binomial coefficient cache warm from one member to the next.
+
+    :param path: the path of the file of interest.
+    :param options: keyword arguments of codec.compress (e.g., window_size).
+    :return: the compressed bytes and the number of original bytes.
+    """
+    with open(path, 'rb') as infile:
+        if not os.fstat(infile.fileno()).st_size:
+            return codec.compress(b'', **options), 0
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            return codec.compress(mapping, **options), len(mapping)
+
+
+def extract_member(archive_path: str, compressed_offset: int, compressed_size: int, uncompressed_size: int,
+                   output_path: str) -> int:
+    """
+    Decompresses a member of an archive straight into a preallocated buffer and writes it to a file, creating its
+    directory if need be. The member's digest is verified. This is the unit of work handed to a worker process, so it
+    must remain a picklable module-level function.
+
+    :param archive_path: the path of the archive.
+    :param compressed_offset: the file offset of the member's compressed file.
+    :param compressed_size: the number of bytes of the member's compressed file.
+    :param uncompressed_size: the number of original bytes of the member.
+    :param output_path: the path of the file to write.
+    :return: the number of bytes written.
+    :raises ValueError: if the member is corrupt or is not of the recorded size.
+    """
+    with open(archive_path, 'rb') as infile:
+        infile.seek(compressed_offset)
+        compressed_bytes = infile.read(compressed_size)
+    decompressed_bytes = bytearray(uncompressed_size)
+    if codec.decompress_into(compressed_bytes, decompressed_bytes) != uncompressed_size:
+        raise ValueError(f'Member size mismatch: {output_path}')
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, 'wb') as outfile:
+        outfile.write(decompressed_bytes)
+    return uncompressed_size
+
+
+def create_archive(archive_path: str, members, jobs: int = 1, options: dict = None, progress=None) -> MemberTable:
+    """
+    Compresses many files into one archive: a header, each member as a standalone compressed file (as written by
+    codec.compress with the supplied options), then the member table. Members are compressed in a single pool of
+    worker processes that persists across them, and written in order as they complete; at most 2 * jobs members are in
+    flight, bounding memory use. The archive is written sequentially, so the output is identical for any number of
+    jobs. Input files are never removed.
+
+    :param archive_path: the path of the archive to write.
+    :param members: the (name, path) tuples of the files to archive, e.g., from member_paths.
+    :param jobs: the number of worker processes.
+    :param options: keyword arguments of codec.compress for each member (e.g., window_size), if any.
+    :param progress: a function to call with the number of original bytes of each non-empty member once it is written,
+    if any.
+    :return: the member table.
+    """
+    options = options or {}
+    member_table = MemberTable()
+    analyser = BytesAnalyser(count_bytes=False)
+    tasks = ((path, options) for _, path in members)
+    with open(archive_path, 'wb') as outfile:
+        util.write_bytes(outfile, analyser, ARCHIVE_MAGIC_BYTES + bytes([ARCHIVE_FORMAT_VERSION]))
+        for (name, _), (_, (compressed_bytes, uncompressed_size)) in zip(
+                members, frames.ordered_map(compress_member, tasks, jobs)):
+            member_table.add(name, analyser.num_bytes, len(compressed_bytes), uncompressed_size)
+            util.write_bytes(outfile, analyser, compressed_bytes)
+            if progress is not None and uncompressed_size:
+                progress(uncompressed_size)
+        member_table.write(outfile, analyser)
+    return member_table
+
+
+def read_members(archive_path: str) -> MemberTable:
+    """
+    Reads the member table of an archive.
+
+    :param archive_path: the path of the archive.
+    :return: the member table.
+    :raises ValueError: if the input is not an archive or its member table is truncated.
+    """
+    with open(archive_path, 'rb') as infile:
+        return MemberTable.read(infile)
+
+
+def read_member(archive_path: str, name: str) -> bytes:
+    """
+    Decompresses a single member of an archive in memory, seeking straight to it.
+
+    :param archive_path: the path of the archive.
+    :param name: the name of the member.
+    :return: the original bytes of the member.
+    :raises KeyError: if there is no such member.
+    :raises ValueError: if the input is not an archive or the member is corrupt.
+    """
+    with open(archive_path, 'rb') as infile:
+        member_table = MemberTable.read(infile)
+        i = member_table.find(name)
+        infile.seek(member_table.compressed_offsets[i])
+        return codec.decompress(infile.read(member_table.compressed_sizes[i]))
+
+
+def extract_archive(archive_path: str, output_dir: str = '.', names=None, jobs: int = 1,
+                    progress=None) -> MemberTable:
+    """
+    Extracts the members of an archive, or only those named, beneath a directory. Members are decompressed in a pool of
+    worker processes, each reading its member straight from the archive and writing the extracted file itself, so
+    decompressed bytes never pass between processes.
+
+    :param archive_path: the path of the archive.
+    :param output_dir: the directory to extract into.
+    :param names: the names of the members to extract, or None for all of them.
+    :param jobs: the number of worker processes.
+    :param progress: a function to call with the number of original bytes of each non-empty member once it is written,
+    if any.
+    :return: the member table of the members extracted.
+    :raises KeyError: if a named member does not exist.
+    :raises ValueError: if the input is not an archive, a member is corrupt or a member name is unsafe.
+    """
+    member_table = read_members(archive_path)
+    numbers = range(len(member_table)) if names is None else [member_table.find(name) for name in names]
+    extracted = MemberTable()
+    for i in numbers:
+        extracted.add(member_table.names[i], member_table.compressed_offsets[i], member_table.compressed_sizes[i],
+                      member_table.uncompressed_sizes[i])
+    tasks = [(archive_path, extracted.compressed_offsets[i], extracted.compressed_sizes[i],
+              extracted.uncompressed_sizes[i], extraction_path(output_dir, extracted.names[i]))
+             for i in range(len(extracted))]
+    for _, num_bytes in frames.ordered_map(extract_member, tasks, jobs):
+        if progress is not None and num_bytes:
+            progress(num_bytes)
+    return extracted
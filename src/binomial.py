@@ -1,34 +1,93 @@
+from collections import OrderedDict
+
+import gmpy2
+
+DEFAULT_MAX_CACHE_BYTES = 64 << 20
+# Coefficients with a smaller (symmetric) k are cheaper to compute than to cache.
+MIN_CACHED_K = 128
+# Approximate bookkeeping cost of a cached coefficient (dictionary slot and integer header), in bytes.
+ENTRY_OVERHEAD_BYTES = 64
+
+
 class Binomial:
     """
-    A cache of pre-computed binomial coefficients.
+    A memory-bounded cache of binomial coefficients. Rows (coefficients sharing N) are built on demand and evicted least
+    recently used first once the cache exceeds its memory cap. A coefficient missing from a cached row is derived from a
+    neighbour in that row with the multiplicative recurrence where possible, rather than computed from scratch. (We only
+    store less than half of each row thanks to symmetry.)
     """
 
-    def __init__(self, max_n):
-        # Populate lookup table with Pascal's Rule. (We only need to store less than half thanks to symmetry.)
-        self.cache = []
-        self.half_n_vals = []
-        for n in range(2, max_n):
-            half_n = n // 2
-            self.half_n_vals.append(half_n)
-            row = []  # don't store k = 0 because we know the value is 1.
-            for k in range(1, half_n + 1):
-                nm1 = n-1
-                row.append(self.get(nm1, k-1) + self.get(nm1, k))
-            self.cache.append(row)
+    def __init__(self, max_cache_bytes: int = DEFAULT_MAX_CACHE_BYTES, min_cached_k: int = MIN_CACHED_K):
+        self.max_cache_bytes = max_cache_bytes
+        self.min_cached_k = min_cached_k
+        self.rows = OrderedDict()
+        self.row_bytes = {}
+        self.cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get(self, n: int, k: int) -> int:
         """
-        Fetches the (N, k) binomial coefficient from a precomputed cache.
+        Fetches the (N, k) binomial coefficient, computing and caching it if need be.
 
         :param n: the N parameter of interest.
         :param k: the k parameter of interest.
         :return: the binomial coefficient (N, k), or 0 if k > N.
         """
-        if k == 1:
-            return n
         if k > n:
             return 0
-        if k == 0 or n == k:
-            return 1
-        nm2 = n-2
-        return self.cache[nm2][n - k - 1 if k > self.half_n_vals[nm2] else k - 1]
+        if k > n - k:
+            k = n - k
+        if k < self.min_cached_k:
+            return gmpy2.bincoef(n, k)
+
+        row = self.rows.get(n)
+        if row is None:
+            row = self.rows[n] = {}
+            self.row_bytes[n] = 0
+        else:
+            self.rows.move_to_end(n)
+            value = row.get(k)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        if (value := row.get(k - 1)) is not None:
+            value = gmpy2.divexact(value * (n - k + 1), k)
+        elif (value := row.get(k + 1)) is not None:
+            value = gmpy2.divexact(value * (k + 1), n - k)
+        else:
+            value = gmpy2.bincoef(n, k)
+        row[k] = value
+        num_bytes = (value.bit_length() >> 3) + ENTRY_OVERHEAD_BYTES
+        self.row_bytes[n] += num_bytes
+        self.cache_bytes += num_bytes
+        while self.cache_bytes > self.max_cache_bytes and len(self.rows) > 1:
+            evicted_n, _ = self.rows.popitem(last=False)
+            self.cache_bytes -= self.row_bytes.pop(evicted_n)
+            self.evictions += 1
+        return value
+
+    def stats(self) -> dict:
+        """
+        Reports the cache counters.
+
+        :return: the numbers of hits, misses and row evictions, and the current numbers of rows and cached bytes.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'rows': len(self.rows),
+                'cache_bytes': self.cache_bytes}
+
+
+# A cache shared by the codecs within a process, so that it stays warm across windows and batches.
+shared_binomial = Binomial()
+
+
+def set_shared_max_cache_bytes(max_cache_bytes: int):
+    """
+    Sets the memory cap of the shared cache. Also usable as a worker process initialiser.
+
+    :param max_cache_bytes: the memory cap in bytes.
+    """
+    shared_binomial.max_cache_bytes = max_cache_bytes
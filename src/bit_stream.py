@@ -0,0 +1,89 @@
+class BitWriter:
+    """
+    Appends unsigned integers of arbitrary width to a big-endian bit stream. Bits are held in an integer accumulator,
+    and whole bytes are flushed to the output buffer after each write, so the accumulator never exceeds the width of
+    the field being written plus 7 bits.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.accumulator = 0
+        self.num_pending_bits = 0
+
+    def __len__(self) -> int:
+        return 8 * len(self.buffer) + self.num_pending_bits
+
+    def write(self, value: int, width: int):
+        """
+        Appends the supplied value as a field of the supplied number of bits.
+
+        :param value: the non-negative integer value to write; it must be representable in width bits.
+        :param width: the number of bits of the field.
+        """
+        if not width:
+            return
+        accumulator = (self.accumulator << width) | int(value)
+        num_pending_bits = self.num_pending_bits + width
+        num_bytes, num_pending_bits = divmod(num_pending_bits, 8)
+        if num_bytes:
+            self.buffer += (accumulator >> num_pending_bits).to_bytes(num_bytes, 'big')
+            accumulator &= (1 << num_pending_bits) - 1
+        self.accumulator = accumulator
+        self.num_pending_bits = num_pending_bits
+
+    def write_bit(self, bit: int):
+        """
+        Appends a single bit.
+
+        :param bit: the bit to write (0 or 1).
+        """
+        self.write(bit, 1)
+
+    def tobytes(self) -> bytes:
+        """
+        Gets the bytes written so far, with any trailing partial byte padded with 0 bits.
+
+        :return: the bytes written so far.
+        """
+        if not self.num_pending_bits:
+            return bytes(self.buffer)
+        return bytes(self.buffer) + bytes([self.accumulator << (8 - self.num_pending_bits)])
+
+
+class BitReader:
+    """
+    Extracts unsigned integers of arbitrary width from a big-endian bit stream. Each field is decoded from a zero-copy
+    view of the bytes that span it.
+    """
+
+    def __init__(self, input_bytes: bytes):
+        self.view = memoryview(input_bytes)
+        self.num_bits = 8 * len(input_bytes)
+        self.position = 0
+
+    def read(self, width: int) -> int:
+        """
+        Reads a field of the supplied number of bits.
+
+        :param width: the number of bits of the field.
+        :return: the unsigned integer value of the field.
+        :raises ValueError: if the field extends beyond the end of the stream.
+        """
+        if not width:
+            return 0
+        start = self.position
+        finish = start + width
+        if finish > self.num_bits:
+            raise ValueError('Truncated bit stream!')
+        self.position = finish
+        byte_finish = (finish + 7) >> 3
+        value = int.from_bytes(self.view[start >> 3:byte_finish], 'big') >> (8 * byte_finish - finish)
+        return value & ((1 << width) - 1) if start & 7 else value
+
+    def read_bit(self) -> int:
+        """
+        Reads a single bit.
+
+        :return: the bit read (0 or 1).
+        """
+        return self.read(1)
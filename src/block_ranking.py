@@ -0,0 +1,83 @@
+from bit_stream import BitReader, BitWriter
+
+# Supported numbers of bits per block.
+BLOCK_SIZES = (32, 64)
+MAX_BLOCK_SIZE = max(BLOCK_SIZES)
+
+# BINOMIALS[n][k] = (n, k) for 0 <= k, n <= MAX_BLOCK_SIZE. Every entry fits in a 64-bit machine integer.
+BINOMIALS = [[0] * (MAX_BLOCK_SIZE + 1) for _ in range(MAX_BLOCK_SIZE + 1)]
+for _n in range(MAX_BLOCK_SIZE + 1):
+    BINOMIALS[_n][0] = 1
+    for _k in range(1, _n + 1):
+        BINOMIALS[_n][_k] = BINOMIALS[_n - 1][_k - 1] + BINOMIALS[_n - 1][_k]
+# RANK_BITS[n][k] is the number of bits needed for a rank in [0, (n, k)), so no bits at all when (n, k) = 1.
+RANK_BITS = [[(val - 1).bit_length() if val else 0 for val in row] for row in BINOMIALS]
+
+
+def write_blocks(writer: BitWriter, index_set: list, num_bits: int, block_bits: int):
+    """
+    Writes a bitset as a succession of fixed-size blocks rather than as a single rank against (N, k). Each block is a
+    population count followed by the colexicographic rank of the block's positions, computed with machine integers
+    from a table of binomial coefficients. The population count of a block is written with just enough bits for the
+    positions still to be placed, the count of the final block is inferred, and no blocks are written once every
+    position has been placed. The reader must know the population count k of the whole bitset.
+
+    :param writer: the bit writer to append to.
+    :param index_set: the index set of the bitset (in ascending order).
+    :param num_bits: the length of the bitset.
+    :param block_bits: the number of bits per block.
+    """
+    remaining = len(index_set)
+    i = 0
+    for block_start in range(0, num_bits, block_bits):
+        if not remaining:
+            return
+        block_finish = min(block_start + block_bits, num_bits)
+        block_len = block_finish - block_start
+        rank = 0
+        count = 0
+        while i < len(index_set) and index_set[i] < block_finish:
+            count += 1
+            rank += BINOMIALS[index_set[i] - block_start][count]
+            i += 1
+        if block_finish < num_bits:
+            writer.write(count, min(block_len, remaining).bit_length())
+        writer.write(rank, RANK_BITS[block_len][count])
+        remaining -= count
+
+
+def read_blocks(reader: BitReader, num_bits: int, k: int, block_bits: int) -> list:
+    """
+    Reads a bitset written by write_blocks.
+
+    :param reader: the bit reader to read from.
+    :param num_bits: the length of the bitset.
+    :param k: the population count of the bitset.
+    :param block_bits: the number of bits per block.
+    :return: the index set of the bitset (positions in descending order within each block).
+    :raises ValueError: if a block's population count or rank is out of range (e.g., the record is corrupt).
+    """
+    result = []
+    remaining = k
+    for block_start in range(0, num_bits, block_bits):
+        if not remaining:
+            break
+        block_finish = min(block_start + block_bits, num_bits)
+        block_len = block_finish - block_start
+        count = reader.read(min(block_len, remaining).bit_length()) if block_finish < num_bits else remaining
+        if count > min(block_len, remaining):
+            raise ValueError('corrupt block')
+        rank = reader.read(RANK_BITS[block_len][count])
+        if rank >= BINOMIALS[block_len][count]:
+            raise ValueError('corrupt block')  # a valid rank places every position within the block
+        remaining -= count
+        position = block_len - 1
+        for j in range(count, 0, -1):
+            while BINOMIALS[position][j] > rank:
+                position -= 1
+            result.append(block_start + position)
+            rank -= BINOMIALS[position][j]
+            position -= 1
+    if remaining:
+        raise ValueError('corrupt block')  # more positions than the bitset holds
+    return result
@@ -1,15 +1,79 @@
 import hashlib
-import math
+import zlib
 
+import numpy as np
 
-class BytesAnalyser:
+# Supported integrity digests, in decreasing order of strength (and increasing order of throughput).
+DIGEST_MD5 = 'md5'
+DIGEST_BLAKE2B = 'blake2b'
+DIGEST_CRC32 = 'crc32'
+DEFAULT_DIGEST = DIGEST_MD5
+# The persisted identifier of each digest, as recorded in the header.
+DIGEST_IDS = {DIGEST_MD5: 0, DIGEST_BLAKE2B: 1, DIGEST_CRC32: 2}
+DIGEST_NAMES = {digest_id: name for name, digest_id in DIGEST_IDS.items()}
+BLAKE2B_DIGEST_SIZE = 16
+
+
+class Crc32:
     """
-    A bytes analyser for computing an MD5 hash and Shannon entropy value.
+    A CRC32 checksum with the interface of a hashlib hash object.
     """
 
+    digest_size = 4
+
     def __init__(self):
-        self.counts = [0] * 256
-        self.md5_digest = hashlib.md5()
+        self.value = 0
+
+    def update(self, _bytes: bytes):
+        self.value = zlib.crc32(_bytes, self.value)
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(self.digest_size, 'big')
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+def new_digest(name: str):
+    """
+    Creates a hash object for the named digest.
+
+    :param name: the name of the digest (md5, blake2b or crc32).
+    :return: the hash object.
+    :raises ValueError: if the digest is not supported.
+    """
+    if name == DIGEST_MD5:
+        return hashlib.md5()
+    if name == DIGEST_BLAKE2B:
+        return hashlib.blake2b(digest_size=BLAKE2B_DIGEST_SIZE)
+    if name == DIGEST_CRC32:
+        return Crc32()
+    raise ValueError(f'Unsupported digest: {name}')
+
+
+def digest_size(name: str) -> int:
+    """
+    Gets the number of bytes of the named digest.
+
+    :param name: the name of the digest (md5, blake2b or crc32).
+    :return: the number of bytes of the digest.
+    """
+    return new_digest(name).digest_size
+
+
+class BytesAnalyser:
+    """
+    A bytes analyser for computing a digest (MD5 by default) and Shannon entropy value.
+    """
+
+    def __init__(self, digest: str = DEFAULT_DIGEST, count_bytes: bool = True):
+        """
+        :param digest: the name of the digest to compute (md5, blake2b or crc32).
+        :param count_bytes: whether to count byte values, which is only needed for the Shannon entropy.
+        """
+        self.digest_name = digest
+        self.counts = np.zeros(256, dtype=np.int64) if count_bytes else None
+        self.digest = new_digest(digest)
         self.num_bytes = 0
 
     def update(self, _bytes: bytes):
@@ -18,9 +82,9 @@ class BytesAnalyser:
 
         :param _bytes: the bytes for the update.
         """
-        for b in _bytes:
-            self.counts[b] += 1
-        self.md5_digest.update(_bytes)
+        if self.counts is not None:
+            self.counts += np.bincount(np.frombuffer(_bytes, dtype=np.uint8), minlength=256)
+        self.digest.update(_bytes)
         self.num_bytes += len(_bytes)
 
     def compute_shannon_entropy(self) -> float:
@@ -28,30 +92,47 @@ class BytesAnalyser:
         Computes the Shannon entropy value for the accumulated bytes. A value in [0.0, 8.0].
 
         :return: the Shannon entropy value for the accumulated bytes.
+        :raises ValueError: if the analyser does not count byte values.
+        """
+        if self.counts is None:
+            raise ValueError('Byte values are not counted!')
+        p = self.counts[self.counts > 0] / self.counts.sum()
+        return abs(float(np.sum(p * np.log2(p))))
+
+    def compute_digest_bytes(self) -> bytes:
+        """
+        Computes the digest for the accumulated bytes.
+
+        :return: the digest for the accumulated bytes as bytes.
+        """
+        return self.digest.digest()
+
+    def compute_digest_hex(self) -> str:
+        """
+        Computes the digest for the accumulated bytes.
+
+        :return: the digest for the accumulated bytes as a hex string.
         """
-        n = 0
-        for c in self.counts:
-            n += c
-        ent = 0
-        n_inv = 1.0 / n
-        for c in self.counts:
-            if c > 0:
-                p = c * n_inv
-                ent += (p * math.log2(p))
-        return math.fabs(ent)
+        return self.digest.hexdigest()
 
     def compute_md5_bytes(self) -> bytes:
         """
         Computes the MD5 digest for the accumulated bytes.
 
         :return: the MD5 digest for the accumulated bytes as bytes.
+        :raises ValueError: if the analyser computes another digest.
         """
-        return self.md5_digest.digest()
+        if self.digest_name != DIGEST_MD5:
+            raise ValueError(f'The analyser computes {self.digest_name}, not MD5!')
+        return self.compute_digest_bytes()
 
     def compute_md5_hex(self) -> str:
         """
         Computes the MD5 digest for the accumulated bytes.
 
         :return: the MD5 digest for the accumulated bytes as a hex string.
+        :raises ValueError: if the analyser computes another digest.
         """
-        return self.md5_digest.hexdigest()
+        if self.digest_name != DIGEST_MD5:
+            raise ValueError(f'The analyser computes {self.digest_name}, not MD5!')
+        return self.compute_digest_hex()
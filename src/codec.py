@@ -0,0 +1,537 @@
+import io
+import os
+import time
+from collections import Counter
+
+import dedupe
+import frames
+import segmentation
+import util
+import window_kinds
+from bytes_analyser import BytesAnalyser, DEFAULT_DIGEST, new_digest
+from container import EXTENDED_MAGIC_BYTES, Header, NUM_BYTES_FOR_OFFSETS, SeekIndex
+from stats import STAGE_SEGMENTATION, Stats
+from window_compressor import WindowCompressor
+from window_decompressor import WindowDecompressor
+
+DEFAULT_WINDOW_SIZE = 1024
+# Number of compressed bytes requested from the underlying stream at a time.
+READ_CHUNK_SIZE = 1 << 16
+# The largest number of bytes of a record length.
+MAX_RECORD_PREFIX_SIZE = 10
+# The largest number of bytes of a header: magic bytes, version byte and up to seven variable-length fields.
+MAX_HEADER_SIZE = len(EXTENDED_MAGIC_BYTES) + 1 + 7 * MAX_RECORD_PREFIX_SIZE
+
+
+def compressed_pieces(data, window_size: int = DEFAULT_WINDOW_SIZE, windows_per_frame: int = 0,
+                      windows_per_checkpoint: int = 0, block_bits: int = 0, digest: str = DEFAULT_DIGEST,
+                      special_windows: bool = True, level: int = 0, densest_last: bool = True,
+                      dedupe_windows: int = 0):
+    """
+    Generates the successive pieces of a compressed file for the supplied bytes: the header, each window record, the
+    digest and any seek index footer. Windows are taken as memoryview slices of the input, so it is never copied. At a
+    level above 0, windows are segmented adaptively in runs of frames.DEFAULT_WINDOWS_PER_BATCH windows, as by
+    main.compress_file.
+
+    :param data: the bytes of interest (any object supporting the buffer protocol, e.g., bytes, memoryview or mmap).
+    :param window_size: the number of bytes per processing window.
+    :param windows_per_frame: the number of windows per independent frame (0 for no frames).
+    :param windows_per_checkpoint: the number of windows per seek index checkpoint (0 for no seek index).
+    :param block_bits: the number of bits per block for block ranking (0 to rank each bitset as a whole).
+    :param digest: the name of the integrity digest of the original bytes (md5, blake2b or crc32).
+    :param special_windows: whether windows may take special encodings (stored, run, zero or small alphabet).
+    :param level: the level of adaptive segmentation (0 for fixed windows; needs no frames).
+    :param densest_last: whether the most frequent byte value of each window, rather than the greatest, is inferred.
+    :param dedupe_windows: the number of distinct recent windows that repeated windows may refer back to (0 for no
+    back-references; needs fixed windows and special windows).
+    :return: a generator of bytes-like pieces.
+    :raises ValueError: if adaptive segmentation is combined with frames, or back-references with adaptive segmentation
+    or without special windows.
+    """
+    view = memoryview(data).cast('B')
+    header = Header(window_size, windows_per_frame, windows_per_checkpoint, block_bits, digest=digest,
+                    special_windows=special_windows, adaptive_windows=level > 0, densest_last=densest_last,
+                    dedupe_windows=dedupe_windows)
+    compressor = WindowCompressor(window_size, block_bits=block_bits, special_windows=special_windows,
+                                  densest_last=densest_last)
+    window_index = dedupe.WindowIndex(dedupe_windows) if dedupe_windows else None
+    seek_index = SeekIndex(windows_per_checkpoint) if windows_per_checkpoint else None
+    existence_index_set = set()
+    header_file = io.BytesIO()
+    header.write(header_file, BytesAnalyser(count_bytes=False))
+    num_compressed_bytes = header_file.tell()
+    yield header_file.getvalue()
+    run_size = window_size * frames.DEFAULT_WINDOWS_PER_BATCH if level else window_size
+    window_number = start = 0
+    for run_start in range(0, len(view), run_size):
+        run = view[run_start:run_start + run_size]
+        for length in segmentation.window_lengths(compressor, run, existence_index_set, level):
+            if header.is_frame_start(window_number):
+                existence_index_set.clear()
+            if seek_index is not None and window_number % windows_per_checkpoint == 0:
+                seek_index.add(num_compressed_bytes, start, existence_index_set)
+            window = view[start:start + length]
+            distance = None
+            if window_index is not None:
+                if header.is_dedupe_reset(window_number):
+                    window_index.clear()
+                distance = window_index.find(window)
+            if distance is not None:
+                record = header.frame_record(compressor.reference(window, distance, existence_index_set))
+            else:
+                record = header.frame_record(compressor.process(window, existence_index_set))
+            num_compressed_bytes += len(record)
+            yield record
+            start += length
+            window_number += 1
+    digest_object = new_digest(digest)
+    digest_object.update(view)
+    yield digest_object.digest()
+    if seek_index is not None:
+        seek_index.uncompressed_size = len(view)
+        footer_file = io.BytesIO()
+        seek_index.write(footer_file, BytesAnalyser(count_bytes=False))
+        yield footer_file.getvalue()
+
+
+def decompressed_windows(data, out=None):
+    """
+    Generates the decompressed windows of a compressed file held in memory. Records are read as memoryview slices of
+    the input, so it is never copied. The digest is verified once the last window has been generated.
+
+    :param data: the compressed bytes (any object supporting the buffer protocol).
+    :param out: if given, a writable buffer to decompress into, window after window from its start; the windows
+    generated are then views of it.
+    :return: a generator of bytes-like windows.
+    :raises ValueError: if the input is not in a recognised compression format, is truncated, fails its digest check or
+    (with out) does not fit.
+    """
+    view = memoryview(data).cast('B')
+    header_file = io.BytesIO(view[:MAX_HEADER_SIZE])
+    header = Header.read(header_file, BytesAnalyser(count_bytes=False))
+    payload_start = header_file.tell()
+    payload_end = len(view) - header.digest_size
+    if header.windows_per_checkpoint:
+        num_checkpoints = int.from_bytes(view[-NUM_BYTES_FOR_OFFSETS:], 'big')
+        payload_end -= num_checkpoints * SeekIndex.ENTRY_SIZE + 2 * NUM_BYTES_FOR_OFFSETS
+    if payload_end < payload_start:
+        raise ValueError('Truncated compressed stream!')
+    decompressor = WindowDecompressor(header.window_size, block_bits=header.block_bits,
+                                      special_windows=header.special_windows, densest_last=header.densest_last,
+                                      dedupe_windows=header.dedupe_windows)
+    existence_bitarray = util.empty_bitarray(256)
+    digest = new_digest(header.digest)
+    out_view = memoryview(out).cast('B') if out is not None else None
+    num_bytes = 0
+    window_number = 0
+    records = view[:payload_end]
+    finish = payload_start
+    while finish < payload_end:
+        start, finish = header.record_extent(records, finish)
+        if finish > payload_end:
+            raise ValueError('Truncated compressed stream!')
+        if header.is_frame_start(window_number):
+            existence_bitarray.setall(0)
+        if header.is_dedupe_reset(window_number):
+            decompressor.cache.clear()
+        if out_view is None:
+            window = decompressor.process(records[start:finish], existence_bitarray)
+        else:
+            window = out_view[num_bytes:]
+            window = window[:decompressor.process_into(records[start:finish], existence_bitarray, window)]
+        digest.update(window)
+        num_bytes += len(window)
+        window_number += 1
+        yield window
+    if digest.digest() != view[payload_end:payload_end + header.digest_size]:
+        raise ValueError('Digest mismatch!')
+
+
+def compress(data, window_size: int = DEFAULT_WINDOW_SIZE, windows_per_frame: int = 0, windows_per_checkpoint: int = 0,
+             block_bits: int = 0, digest: str = DEFAULT_DIGEST, special_windows: bool = True, level: int = 0,
+             densest_last: bool = True, dedupe_windows: int = 0) -> bytes:
+    """
+    Compresses the supplied bytes in memory, in the style of zlib.compress. The output is identical to that of
+    main.compress_file for the same options.
+
+    :param data: the bytes of interest (any object supporting the buffer protocol, e.g., bytes, memoryview or mmap).
+    :param window_size: the number of bytes per processing window.
+    :param windows_per_frame: the number of windows per independent frame (0 for no frames).
+    :param windows_per_checkpoint: the number of windows per seek index checkpoint (0 for no seek index).
+    :param block_bits: the number of bits per block for block ranking (0 to rank each bitset as a whole).
+    :param digest: the name of the integrity digest of the original bytes (md5, blake2b or crc32).
+    :param special_windows: whether windows may take special encodings (stored, run, zero or small alphabet).
+    :param level: the level of adaptive segmentation (0 for fixed windows; needs no frames).
+    :param densest_last: whether the most frequent byte value of each window, rather than the greatest, is inferred.
+    :param dedupe_windows: the number of distinct recent windows that repeated windows may refer back to (0 for no
+    back-references; needs fixed windows and special windows).
+    :return: the compressed bytes.
+    """
+    return b''.join(compressed_pieces(data, window_size, windows_per_frame, windows_per_checkpoint, block_bits, digest,
+                                      special_windows, level, densest_last, dedupe_windows))
+
+
+def compress_into(data, out, window_size: int = DEFAULT_WINDOW_SIZE, windows_per_frame: int = 0,
+                  windows_per_checkpoint: int = 0, block_bits: int = 0, digest: str = DEFAULT_DIGEST,
+                  special_windows: bool = True, level: int = 0, densest_last: bool = True,
+                  dedupe_windows: int = 0) -> int:
+    """
+    Compresses the supplied bytes into a caller-supplied buffer, without assembling the compressed bytes elsewhere.
+
+    :param data: the bytes of interest (any object supporting the buffer protocol, e.g., bytes, memoryview or mmap).
+    :param out: the writable buffer to write the compressed bytes to, from its start.
+    :param window_size: the number of bytes per processing window.
+    :param windows_per_frame: the number of windows per independent frame (0 for no frames).
+    :param windows_per_checkpoint: the number of windows per seek index checkpoint (0 for no seek index).
+    :param block_bits: the number of bits per block for block ranking (0 to rank each bitset as a whole).
+    :param digest: the name of the integrity digest of the original bytes (md5, blake2b or crc32).
+    :param special_windows: whether windows may take special encodings (stored, run, zero or small alphabet).
+    :param level: the level of adaptive segmentation (0 for fixed windows; needs no frames).
+    :param densest_last: whether the most frequent byte value of each window, rather than the greatest, is inferred.
+    :param dedupe_windows: the number of distinct recent windows that repeated windows may refer back to (0 for no
+    back-references; needs fixed windows and special windows).
+    :return: the number of compressed bytes written.
+    :raises ValueError: if the buffer is too small for the compressed bytes.
+    """
+    out_view = memoryview(out).cast('B')
+    num_bytes = 0
+    for piece in compressed_pieces(data, window_size, windows_per_frame, windows_per_checkpoint, block_bits, digest,
+                                   special_windows, level, densest_last, dedupe_windows):
+        finish = num_bytes + len(piece)
+        if finish > len(out_view):
+            raise ValueError('Output buffer too small!')
+        out_view[num_bytes:finish] = piece
+        num_bytes = finish
+    return num_bytes
+
+
+def decompress(data) -> bytes:
+    """
+    Decompresses the supplied compressed bytes in memory, in the style of zlib.decompress.
+
+    :param data: the compressed bytes (any object supporting the buffer protocol).
+    :return: the decompressed bytes.
+    :raises ValueError: if the input is not in a recognised compression format, is truncated or fails its digest check.
+    """
+    return b''.join(decompressed_windows(data))
+
+
+def decompress_into(data, out) -> int:
+    """
+    Decompresses the supplied compressed bytes straight into a caller-supplied (e.g., preallocated) buffer. Each window
+    is rehydrated in place, so the decompressed bytes are never copied.
+
+    :param data: the compressed bytes (any object supporting the buffer protocol).
+    :param out: the writable buffer to write the decompressed bytes to, from its start.
+    :return: the number of decompressed bytes written.
+    :raises ValueError: if the input is not in a recognised compression format, is truncated, fails its digest check or
+    does not fit the buffer.
+    """
+    return sum(len(window) for window in decompressed_windows(data, out))
+
+
+class BinomialWriter(io.BufferedIOBase):
+    """
+    A writable binary stream that compresses everything written to it, in the style of gzip.GzipFile. Bytes are
+    buffered until a whole window is available, so memory use is bounded by the window size whatever the size of each
+    write. The final (possibly partial) window, the digest and any seek index are written on close. Only complete
+    files are produced; no seeking is needed, so any binary stream will do (a pipe or socket included).
+    """
+
+    def __init__(self, fileobj, window_size: int = DEFAULT_WINDOW_SIZE, windows_per_frame: int = 0,
+                 windows_per_checkpoint: int = 0, block_bits: int = 0, digest: str = DEFAULT_DIGEST,
+                 count_bytes: bool = False, special_windows: bool = True, stats: Stats = None, level: int = 0,
+                 densest_last: bool = True, dedupe_windows: int = 0):
+        """
+        :param fileobj: the binary stream to write to, or the path of a file to create.
+        :param window_size: the number of bytes per processing window.
+        :param windows_per_frame: the number of windows per independent frame (0 for no frames).
+        :param windows_per_checkpoint: the number of windows per seek index checkpoint (0 for no seek index).
+        :param block_bits: the number of bits per block for block ranking (0 to rank each bitset as a whole).
+        :param digest: the name of the integrity digest of the original bytes (md5, blake2b or crc32).
+        :param special_windows: whether windows may take special encodings (stored, run, zero or small alphabet).
+        :param count_bytes: whether the bytes analysers count byte values (for the Shannon entropy).
+        :param stats: the Stats to update with the time per stage and the counters, if any.
+        :param level: the level of adaptive segmentation (0 for fixed windows; needs no frames). Windows are then
+        segmented in runs of frames.DEFAULT_WINDOWS_PER_BATCH windows, as by main.compress_file.
+        :param densest_last: whether the most frequent byte value of each window, rather than the greatest, is inferred.
+        :param dedupe_windows: the number of distinct recent windows that repeated windows may refer back to (0 for no
+        back-references; needs fixed windows and special windows).
+        :raises ValueError: if adaptive segmentation is combined with frames, or back-references with adaptive
+        segmentation or without special windows.
+        """
+        super().__init__()
+        self.header = Header(window_size, windows_per_frame, windows_per_checkpoint, block_bits, digest=digest,
+                             special_windows=special_windows, adaptive_windows=level > 0, densest_last=densest_last,
+                             dedupe_windows=dedupe_windows)
+        self.owns_fileobj = isinstance(fileobj, (str, bytes, os.PathLike))
+        self.fileobj = open(fileobj, 'wb') if self.owns_fileobj else fileobj
+        self.compressor = WindowCompressor(window_size, block_bits=block_bits, special_windows=special_windows,
+                                           densest_last=densest_last, stats=stats)
+        self.window_index = dedupe.WindowIndex(dedupe_windows) if dedupe_windows else None
+        self.seek_index = SeekIndex(windows_per_checkpoint) if windows_per_checkpoint else None
+        self.in_analyser = BytesAnalyser(digest, count_bytes)
+        self.out_analyser = BytesAnalyser(digest, count_bytes)
+        self.existence_index_set = set()
+        self.level = level
+        self.run_size = window_size * frames.DEFAULT_WINDOWS_PER_BATCH if level else window_size
+        self.window_number = 0
+        self.uncompressed_offset = 0
+        self.window_counts = Counter()
+        self.pending = bytearray()
+        self.header.write(self.fileobj, self.out_analyser)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        """
+        Compresses the supplied bytes, writing out every window that is complete.
+
+        :param data: the bytes (or bytes-like object) to compress.
+        :return: the number of bytes consumed, i.e., all of them.
+        """
+        if self.closed:
+            raise ValueError('write to closed file')
+        data = memoryview(data).cast('B')
+        self.in_analyser.update(data)
+        self.pending += data
+        run_size = self.run_size
+        if len(self.pending) >= run_size:
+            num_whole_bytes = len(self.pending) - len(self.pending) % run_size
+            for start in range(0, num_whole_bytes, run_size):
+                self._write_run(self.pending[start:start + run_size])
+            del self.pending[:num_whole_bytes]
+        return len(data)
+
+    def _write_run(self, run: bytes):
+        """
+        Splits a run of bytes into windows (of fixed or adaptive length) and writes them.
+
+        :param run: the run of interest, a window at level 0.
+        """
+        if not self.level:
+            self._write_window(run)
+            return
+        stats = self.compressor.stats
+        if stats is not None:
+            start = time.perf_counter()
+        lengths = segmentation.window_lengths(self.compressor, run, self.existence_index_set, self.level)
+        if stats is not None:
+            stats.time(STAGE_SEGMENTATION, start)
+        start = 0
+        for length in lengths:
+            self._write_window(run[start:start + length])
+            start += length
+
+    def _write_window(self, window: bytes):
+        """
+        Compresses one window (or refers back to an earlier copy of it) and writes its record, resetting the existence
+        state at frame starts and recording seek index checkpoints.
+
+        :param window: the window of interest.
+        """
+        if self.header.is_frame_start(self.window_number):
+            self.existence_index_set.clear()
+        if self.seek_index is not None and self.window_number % self.seek_index.windows_per_checkpoint == 0:
+            self.seek_index.add(self.out_analyser.num_bytes, self.uncompressed_offset, self.existence_index_set)
+        distance = None
+        if self.window_index is not None:
+            if self.header.is_dedupe_reset(self.window_number):
+                self.window_index.clear()
+            distance = self.window_index.find(window)
+        if distance is not None:
+            payload = self.compressor.reference(window, distance, self.existence_index_set)
+        else:
+            payload = self.compressor.process(bytes(window), self.existence_index_set)
+        self.window_counts[window_kinds.kind_name(payload, self.header.special_windows)] += 1
+        record = self.header.frame_record(payload)
+        util.write_bytes(self.fileobj, self.out_analyser, record)
+        self.window_number += 1
+        self.uncompressed_offset += len(window)
+
+    def flush(self):
+        if not self.closed:
+            self.fileobj.flush()
+
+    def close(self):
+        """
+        Writes the final window, the digest and any seek index, then closes the underlying stream if it was opened
+        here.
+        """
+        if self.closed:
+            return
+        try:
+            if self.pending:
+                self._write_run(self.pending)
+                self.pending.clear()
+            util.write_bytes(self.fileobj, self.out_analyser, self.in_analyser.compute_digest_bytes())
+            if self.seek_index is not None:
+                self.seek_index.uncompressed_size = self.in_analyser.num_bytes
+                self.seek_index.write(self.fileobj, self.out_analyser)
+            self.fileobj.flush()
+        finally:
+            if self.owns_fileobj:
+                self.fileobj.close()
+            super().close()
+
+
+class ByteRecorder:
+    """
+    A stand-in for a bytes analyser that only keeps the bytes it is updated with, e.g., to analyse them later with a
+    digest that is not yet known.
+    """
+
+    def __init__(self):
+        self.recorded = bytearray()
+        self.num_bytes = 0
+
+    def update(self, _bytes: bytes):
+        """
+        Records the bytes provided.
+
+        :param _bytes: the bytes for the update.
+        """
+        self.recorded += _bytes
+        self.num_bytes += len(_bytes)
+
+
+class BinomialReader(io.BufferedIOBase):
+    """
+    A readable binary stream that decompresses a compressed file, in the style of gzip.GzipFile. Windows are
+    decompressed on demand, so memory use is bounded by the size of each read plus a window. The underlying stream is
+    read sequentially and need not be seekable: the trailer (digest and any seek index footer) is recognised by
+    always holding enough compressed bytes in reserve to cover it. The digest is verified at the end of the stream.
+    The windows taking each encoding are counted in window_counts, keyed by the name of the encoding.
+    """
+
+    def __init__(self, fileobj, count_bytes: bool = False, stats: Stats = None):
+        """
+        :param fileobj: the binary stream to read from, or the path of a file to open.
+        :param count_bytes: whether the bytes analysers count byte values (for the Shannon entropy).
+        :param stats: the Stats to update with the time per stage and the counters, if any.
+        :raises ValueError: if the input is not in a recognised compression format.
+        """
+        super().__init__()
+        self.owns_fileobj = isinstance(fileobj, (str, bytes, os.PathLike))
+        self.fileobj = open(fileobj, 'rb') if self.owns_fileobj else fileobj
+        header_recorder = ByteRecorder()
+        try:
+            self.header = Header.read(self.fileobj, header_recorder)
+        except Exception:
+            if self.owns_fileobj:
+                self.fileobj.close()
+            raise
+        # The digest of the input is only known once the header has been read, so the header is analysed afterwards.
+        self.in_analyser = BytesAnalyser(self.header.digest, count_bytes)
+        self.in_analyser.update(bytes(header_recorder.recorded))
+        self.out_analyser = BytesAnalyser(self.header.digest, count_bytes)
+        self.decompressor = WindowDecompressor(self.header.window_size, block_bits=self.header.block_bits,
+                                               special_windows=self.header.special_windows,
+                                               densest_last=self.header.densest_last,
+                                               dedupe_windows=self.header.dedupe_windows, stats=stats)
+        self.existence_bitarray = util.empty_bitarray(256)
+        self.window_number = 0
+        self.window_counts = Counter()
+        self.compressed = bytearray()
+        self.decompressed = bytearray()
+        self.at_end_of_input = False
+        self.finished = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads and returns up to the supplied number of decompressed bytes (fewer only at the end of the stream).
+
+        :param size: the number of bytes to read, or -1 to read to the end of the stream.
+        :return: the decompressed bytes.
+        :raises ValueError: if the compressed stream is truncated or fails its digest check.
+        """
+        if self.closed:
+            raise ValueError('read from closed file')
+        if size is None or size < 0:
+            while self._decompress_window():
+                pass
+            size = len(self.decompressed)
+        else:
+            while len(self.decompressed) < size and self._decompress_window():
+                pass
+        result = bytes(self.decompressed[:size])
+        del self.decompressed[:size]
+        return result
+
+    def read1(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+    def _fill(self, num_bytes: int):
+        """
+        Reads from the underlying stream until the supplied number of compressed bytes are held (or the stream ends).
+
+        :param num_bytes: the number of compressed bytes required.
+        """
+        while len(self.compressed) < num_bytes and not self.at_end_of_input:
+            chunk = util.read_bytes(self.fileobj, self.in_analyser, max(READ_CHUNK_SIZE, num_bytes - len(self.compressed)))
+            if chunk:
+                self.compressed += chunk
+            else:
+                self.at_end_of_input = True
+
+    def _trailer_size(self) -> int:
+        """
+        The number of bytes that would follow the window records if the stream ended after the windows read so far.
+
+        :return: the number of bytes of the trailer.
+        """
+        windows_per_checkpoint = self.header.windows_per_checkpoint
+        if not windows_per_checkpoint:
+            return self.header.digest_size
+        num_checkpoints = -(-self.window_number // windows_per_checkpoint)
+        return self.header.digest_size + num_checkpoints * SeekIndex.ENTRY_SIZE + 2 * NUM_BYTES_FOR_OFFSETS
+
+    def _decompress_window(self) -> bool:
+        """
+        Decompresses the next window into the buffer of decompressed bytes, or verifies the trailer if there are no
+        more windows.
+
+        :return: True if a window was decompressed, False at the end of the stream.
+        """
+        if self.finished:
+            return False
+        trailer_size = self._trailer_size()
+        self._fill(trailer_size + 1)
+        if len(self.compressed) <= trailer_size:
+            if len(self.compressed) < trailer_size:
+                raise ValueError('Truncated compressed stream!')
+            if bytes(self.compressed[:self.header.digest_size]) != self.out_analyser.compute_digest_bytes():
+                raise ValueError('Digest mismatch!')
+            self.compressed.clear()
+            self.finished = True
+            return False
+        self._fill(trailer_size + MAX_RECORD_PREFIX_SIZE)
+        start, finish = self.header.record_extent(self.compressed, 0)
+        self._fill(finish + trailer_size)
+        if len(self.compressed) < finish + trailer_size:
+            raise ValueError('Truncated compressed stream!')
+        if self.header.is_frame_start(self.window_number):
+            self.existence_bitarray.setall(0)
+        if self.header.is_dedupe_reset(self.window_number):
+            self.decompressor.cache.clear()
+        payload = bytes(self.compressed[start:finish])
+        self.window_counts[window_kinds.kind_name(payload, self.header.special_windows)] += 1
+        window = self.decompressor.process(payload, self.existence_bitarray)
+        del self.compressed[:finish]
+        self.out_analyser.update(window)
+        self.decompressed += window
+        self.window_number += 1
+        return True
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.owns_fileobj:
+                self.fileobj.close()
+        finally:
+            super().close()
@@ -0,0 +1,350 @@
+import bisect
+import os
+
+from bitarray import bitarray
+
+import block_ranking
+import util
+from bytes_analyser import BytesAnalyser, DEFAULT_DIGEST, DIGEST_IDS, DIGEST_NAMES, digest_size
+
+MAGIC_BYTES = b'ajr74z'
+EXTENDED_MAGIC_BYTES = b'ajr74x'
+
+# Format versions. The legacy format has no version byte; version 1 has fixed 2-byte fields and record lengths;
+# version 2 has variable-length integer fields and record lengths. Only the legacy format and version 2 are written.
+LEGACY_FORMAT_VERSION = 0
+FIXED_WIDTH_FORMAT_VERSION = 1
+VARINT_FORMAT_VERSION = 2
+FORMAT_VERSION = VARINT_FORMAT_VERSION
+
+# Header flags for the extended format.
+FLAG_FRAMED = 1 << 0
+FLAG_INDEXED = 1 << 1
+FLAG_BLOCKED = 1 << 2
+FLAG_DIGEST = 1 << 3
+FLAG_SPECIAL_WINDOWS = 1 << 4
+FLAG_ADAPTIVE_WINDOWS = 1 << 5
+FLAG_DENSEST_LAST = 1 << 6
+FLAG_DEDUPE = 1 << 7
+
+# The largest window whose compressed records are sure to fit 2-byte record lengths.
+MAX_LEGACY_WINDOW_SIZE = 4096
+
+NUM_BYTES_FOR_OFFSETS = 8
+NUM_BYTES_FOR_EXISTENCE_STATE = 32
+
+
+class Header:
+    """
+    The header of a compressed file, which also determines how window records are framed. Files that use none of the
+    optional format features, with windows small enough for 2-byte record lengths, are written with the original
+    (legacy) header so that they remain readable by older versions; all others are written in the current version of
+    the extended format.
+    """
+
+    def __init__(self, window_size: int, windows_per_frame: int = 0, windows_per_checkpoint: int = 0,
+                 block_bits: int = 0, version: int = None, digest: str = DEFAULT_DIGEST,
+                 special_windows: bool = False, adaptive_windows: bool = False, densest_last: bool = False,
+                 dedupe_windows: int = 0):
+        if digest not in DIGEST_IDS:
+            raise ValueError(f'Unsupported digest: {digest}')
+        if adaptive_windows and windows_per_frame:
+            raise ValueError('Frames need fixed windows')
+        if dedupe_windows and (adaptive_windows or not special_windows):
+            raise ValueError('Back-references need fixed windows and special window encodings')
+        self.window_size = window_size
+        self.windows_per_frame = windows_per_frame
+        self.windows_per_checkpoint = windows_per_checkpoint
+        self.block_bits = block_bits
+        self.digest = digest  # the name of the integrity digest of the original bytes
+        self.special_windows = special_windows  # whether windows may take special encodings (see window_kinds)
+        # whether windows vary in length (up to window_size), so that window offsets follow only from the records
+        self.adaptive_windows = adaptive_windows
+        # whether the most frequent byte value of each window is inferred (see WindowCompressor.emission_order)
+        self.densest_last = densest_last
+        # the number of distinct recent windows that back-references may copy (see dedupe), or 0 for none
+        self.dedupe_windows = dedupe_windows
+        if version is None:
+            version = LEGACY_FORMAT_VERSION if not self.flags and window_size <= MAX_LEGACY_WINDOW_SIZE \
+                else FORMAT_VERSION
+        self.version = version
+
+    @property
+    def varint_framing(self) -> bool:
+        """
+        Whether header fields and record lengths are variable-length integers rather than fixed 2-byte values.
+
+        :return: True if header fields and record lengths are variable-length integers.
+        """
+        return self.version >= VARINT_FORMAT_VERSION
+
+    @property
+    def flags(self) -> int:
+        """
+        The flags describing the optional format features in use.
+
+        :return: the flags describing the optional format features in use.
+        """
+        flags = 0
+        if self.windows_per_frame:
+            flags |= FLAG_FRAMED
+        if self.windows_per_checkpoint:
+            flags |= FLAG_INDEXED
+        if self.block_bits:
+            flags |= FLAG_BLOCKED
+        if self.digest != DEFAULT_DIGEST:
+            flags |= FLAG_DIGEST
+        if self.special_windows:
+            flags |= FLAG_SPECIAL_WINDOWS
+        if self.adaptive_windows:
+            flags |= FLAG_ADAPTIVE_WINDOWS
+        if self.densest_last:
+            flags |= FLAG_DENSEST_LAST
+        if self.dedupe_windows:
+            flags |= FLAG_DEDUPE
+        return flags
+
+    @property
+    def digest_size(self) -> int:
+        """
+        The number of bytes of the integrity digest that follows the window records.
+
+        :return: the number of bytes of the digest.
+        """
+        return digest_size(self.digest)
+
+    def is_frame_start(self, window_number: int) -> bool:
+        """
+        Determines whether the window with the supplied (zero-based) number begins a new independent frame, i.e., whether
+        the existence state must be reset before it is processed.
+
+        :param window_number: the number of the window of interest.
+        :return: True if the window begins a new frame.
+        """
+        return self.windows_per_frame > 0 and window_number % self.windows_per_frame == 0
+
+    def is_dedupe_reset(self, window_number: int) -> bool:
+        """
+        Determines whether the window with the supplied (zero-based) number may not refer back past itself, i.e., whether
+        the caches of windows for back-references must be cleared before it is processed. This is so at frame starts
+        and checkpoints, from which decompression may begin.
+
+        :param window_number: the number of the window of interest.
+        :return: True if the caches of windows must be cleared.
+        """
+        return self.dedupe_windows > 0 and (self.is_frame_start(window_number) or (
+                self.windows_per_checkpoint > 0 and window_number % self.windows_per_checkpoint == 0))
+
+    def write(self, outfile, analyser: BytesAnalyser):
+        """
+        Writes the header to the specified output file.
+
+        :param outfile: the output file to write to.
+        :param analyser: the bytes analyser to update.
+        """
+        if self.version == LEGACY_FORMAT_VERSION:
+            util.write_bytes(outfile, analyser, MAGIC_BYTES)
+            util.write_val(outfile, analyser, self.window_size)
+            return
+        write_field = util.write_varint if self.varint_framing else util.write_val
+        flags = self.flags
+        util.write_bytes(outfile, analyser, EXTENDED_MAGIC_BYTES)
+        util.write_bytes(outfile, analyser, bytes([self.version]))
+        write_field(outfile, analyser, self.window_size)
+        write_field(outfile, analyser, flags)
+        if flags & FLAG_FRAMED:
+            write_field(outfile, analyser, self.windows_per_frame)
+        if flags & FLAG_INDEXED:
+            write_field(outfile, analyser, self.windows_per_checkpoint)
+        if flags & FLAG_BLOCKED:
+            write_field(outfile, analyser, self.block_bits)
+        if flags & FLAG_DIGEST:
+            write_field(outfile, analyser, DIGEST_IDS[self.digest])
+        if flags & FLAG_DEDUPE:
+            write_field(outfile, analyser, self.dedupe_windows)
+
+    def frame_record(self, payload: bytes) -> bytes:
+        """
+        Frames the supplied compressed window as a record: its length followed by the payload itself.
+
+        :param payload: the compressed window.
+        :return: the window record.
+        """
+        if self.varint_framing:
+            return util.encode_varint(len(payload)) + payload
+        return len(payload).to_bytes(util.NUM_BYTES_FOR_PERSISTED_PARAMETERS, 'big') + payload
+
+    def record_extent(self, records: bytes, start: int) -> (int, int):
+        """
+        Gets the offsets of the payload of the window record at the supplied offset.
+
+        :param records: the window records of interest.
+        :param start: the offset of the record.
+        :return: the (start, finish) offsets of the payload.
+        """
+        if self.varint_framing:
+            size, start = util.decode_varint(records, start)
+        else:
+            finish = start + util.NUM_BYTES_FOR_PERSISTED_PARAMETERS
+            size, start = int.from_bytes(records[start:finish], 'big'), finish
+        return start, start + size
+
+    def read_record(self, infile, analyser: BytesAnalyser) -> (int, bytes):
+        """
+        Reads a window record from the specified input file.
+
+        :param infile: the input file to read from.
+        :param analyser: the bytes analyser to update.
+        :return: the number of bytes of the record and its payload.
+        """
+        num_bytes = analyser.num_bytes
+        size = util.read_varint(infile, analyser) if self.varint_framing else util.read_val(infile, analyser)
+        payload = util.read_bytes(infile, analyser, size)
+        return analyser.num_bytes - num_bytes, payload
+
+    @staticmethod
+    def read(infile, analyser: BytesAnalyser) -> 'Header':
+        """
+        Reads a header from the specified input file.
+
+        :param infile: the input file to read from.
+        :param analyser: the bytes analyser to update.
+        :return: the header read from the input file.
+        :raises ValueError: if the input is not in a recognised compression format.
+        """
+        magic = util.read_bytes(infile, analyser, len(MAGIC_BYTES))
+        if magic == MAGIC_BYTES:
+            return Header(util.read_val(infile, analyser), version=LEGACY_FORMAT_VERSION)
+        if magic != EXTENDED_MAGIC_BYTES:
+            raise ValueError('Incorrect compression format!')
+        version = util.read_bytes(infile, analyser, 1)
+        if not version or version[0] not in (FIXED_WIDTH_FORMAT_VERSION, VARINT_FORMAT_VERSION):
+            raise ValueError(f'Unsupported format version: {version.hex()}')
+        version = version[0]
+        read_field = util.read_varint if version >= VARINT_FORMAT_VERSION else util.read_val
+        window_size = read_field(infile, analyser)
+        flags = read_field(infile, analyser)
+        windows_per_frame = read_field(infile, analyser) if flags & FLAG_FRAMED else 0
+        windows_per_checkpoint = read_field(infile, analyser) if flags & FLAG_INDEXED else 0
+        block_bits = read_field(infile, analyser) if flags & FLAG_BLOCKED else 0
+        digest_id = read_field(infile, analyser) if flags & FLAG_DIGEST else DIGEST_IDS[DEFAULT_DIGEST]
+        dedupe_windows = read_field(infile, analyser) if flags & FLAG_DEDUPE else 0
+        if not window_size:
+            raise ValueError('Invalid window size: 0')
+        if block_bits and block_bits not in block_ranking.BLOCK_SIZES:
+            raise ValueError(f'Unsupported number of bits per block: {block_bits}')
+        if digest_id not in DIGEST_NAMES:
+            raise ValueError(f'Unsupported digest: {digest_id}')
+        return Header(window_size, windows_per_frame, windows_per_checkpoint, block_bits, version,
+                      DIGEST_NAMES[digest_id], bool(flags & FLAG_SPECIAL_WINDOWS), bool(flags & FLAG_ADAPTIVE_WINDOWS),
+                      bool(flags & FLAG_DENSEST_LAST), dedupe_windows)
+
+
+class SeekIndex:
+    """
+    A seek index, persisted as a footer after the digest. Checkpoint i corresponds to window
+    i * windows_per_checkpoint and records the file offset of that window's record, the offset of the window within the
+    original bytes, and the existence state required to restart decompression at that window. The footer closes with
+    the number of original bytes and the number of checkpoints.
+    """
+
+    ENTRY_SIZE = 2 * NUM_BYTES_FOR_OFFSETS + NUM_BYTES_FOR_EXISTENCE_STATE
+
+    def __init__(self, windows_per_checkpoint: int):
+        self.windows_per_checkpoint = windows_per_checkpoint
+        self.compressed_offsets = []
+        self.uncompressed_offsets = []
+        self.existence_states = []
+        self.uncompressed_size = 0
+
+    def __len__(self) -> int:
+        return len(self.compressed_offsets)
+
+    @property
+    def footer_size(self) -> int:
+        """
+        The number of bytes of the persisted footer.
+
+        :return: the number of bytes of the persisted footer.
+        """
+        return len(self) * self.ENTRY_SIZE + 2 * NUM_BYTES_FOR_OFFSETS
+
+    def add(self, compressed_offset: int, uncompressed_offset: int, existence_index_set: set):
+        """
+        Adds a checkpoint for the next checkpointed window.
+
+        :param compressed_offset: the file offset of the window record.
+        :param uncompressed_offset: the offset of the window within the original bytes.
+        :param existence_index_set: the existence index set from the previous window (empty at a frame start).
+        """
+        existence_bitarray = util.empty_bitarray(256)
+        existence_bitarray[list(existence_index_set)] = 1
+        self.compressed_offsets.append(compressed_offset)
+        self.uncompressed_offsets.append(uncompressed_offset)
+        self.existence_states.append(existence_bitarray)
+
+    def compressed_extent(self, checkpoint: int, payload_end: int) -> (int, int):
+        """
+        Gets the file offsets of the window records spanned by the supplied checkpoint, i.e., up to the next checkpoint.
+
+        :param checkpoint: the number of the checkpoint of interest.
+        :param payload_end: the file offset of the end of the window records.
+        :return: the (start, finish) file offsets.
+        """
+        following = checkpoint + 1
+        return self.compressed_offsets[checkpoint], \
+            self.compressed_offsets[following] if following < len(self) else payload_end
+
+    def find(self, uncompressed_offset: int) -> int:
+        """
+        Finds the last checkpoint at or before the supplied offset within the original bytes.
+
+        :param uncompressed_offset: the offset of interest.
+        :return: the number of the checkpoint.
+        """
+        return max(0, bisect.bisect_right(self.uncompressed_offsets, uncompressed_offset) - 1)
+
+    def write(self, outfile, analyser: BytesAnalyser):
+        """
+        Writes the seek index footer to the specified output file.
+
+        :param outfile: the output file to write to.
+        :param analyser: the bytes analyser to update.
+        """
+        footer = bytearray()
+        for compressed_offset, uncompressed_offset, existence_bitarray in zip(self.compressed_offsets,
+                                                                              self.uncompressed_offsets,
+                                                                              self.existence_states):
+            footer += compressed_offset.to_bytes(NUM_BYTES_FOR_OFFSETS, 'big')
+            footer += uncompressed_offset.to_bytes(NUM_BYTES_FOR_OFFSETS, 'big')
+            footer += existence_bitarray.tobytes()
+        footer += self.uncompressed_size.to_bytes(NUM_BYTES_FOR_OFFSETS, 'big')
+        footer += len(self).to_bytes(NUM_BYTES_FOR_OFFSETS, 'big')
+        util.write_bytes(outfile, analyser, bytes(footer))
+
+    @staticmethod
+    def read(infile, windows_per_checkpoint: int) -> 'SeekIndex':
+        """
+        Reads the seek index footer from the end of the specified (seekable) input file. The file position is restored.
+
+        :param infile: the input file to read from.
+        :param windows_per_checkpoint: the number of windows per checkpoint, from the header.
+        :return: the seek index.
+        """
+        position = infile.tell()
+        infile.seek(-2 * NUM_BYTES_FOR_OFFSETS, os.SEEK_END)
+        index = SeekIndex(windows_per_checkpoint)
+        index.uncompressed_size = int.from_bytes(infile.read(NUM_BYTES_FOR_OFFSETS), 'big')
+        num_entries = int.from_bytes(infile.read(NUM_BYTES_FOR_OFFSETS), 'big')
+        infile.seek(-index.ENTRY_SIZE * num_entries - 2 * NUM_BYTES_FOR_OFFSETS, os.SEEK_END)
+        footer = infile.read(index.ENTRY_SIZE * num_entries)
+        for start in range(0, len(footer), index.ENTRY_SIZE):
+            finish = start + NUM_BYTES_FOR_OFFSETS
+            index.compressed_offsets.append(int.from_bytes(footer[start:finish], 'big'))
+            start, finish = finish, finish + NUM_BYTES_FOR_OFFSETS
+            index.uncompressed_offsets.append(int.from_bytes(footer[start:finish], 'big'))
+            existence_bitarray = bitarray()
+            existence_bitarray.frombytes(footer[finish:finish + NUM_BYTES_FOR_EXISTENCE_STATE])
+            index.existence_states.append(existence_bitarray)
+        infile.seek(position)
+        return index
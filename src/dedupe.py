@@ -0,0 +1,104 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Number of bytes of the hash that identifies the contents of a window.
+WINDOW_HASH_SIZE = 16
+
+
+class WindowIndex:
+    """
+    The compression side of window deduplication: a bounded index of the distinct windows seen recently, keyed by a
+    hash of their contents and evicted least recently used first. A window found in the index is encoded as a
+    back-reference to the number of the earlier window rather than compressed again. The index is kept in lockstep with
+    the WindowCache of the decompressor: both hold the same window numbers in the same order of use, so a window still
+    indexed here is still cached there.
+    """
+
+    def __init__(self, max_windows: int):
+        self.max_windows = max_windows
+        self.window_numbers = OrderedDict()  # hash -> number of the window, least recently used first
+        self.num_windows = 0
+
+    def clear(self):
+        """
+        Forgets every window, e.g., at a frame start or checkpoint, beyond which nothing may be referenced.
+        """
+        self.window_numbers.clear()
+
+    def find(self, window) -> int:
+        """
+        Looks up the next window, indexing it if it is new.
+
+        :param window: the bytes of the window (any object supporting the buffer protocol).
+        :return: the distance back to an earlier window with the same contents, in windows, or None if there is none.
+        """
+        key = hashlib.blake2b(window, digest_size=WINDOW_HASH_SIZE).digest()
+        window_number = self.window_numbers.get(key)
+        if window_number is not None:
+            self.window_numbers.move_to_end(key)
+            distance = self.num_windows - window_number
+        else:
+            distance = None
+            self.window_numbers[key] = self.num_windows
+            if len(self.window_numbers) > self.max_windows:
+                self.window_numbers.popitem(last=False)
+        self.num_windows += 1
+        return distance
+
+
+class WindowCache:
+    """
+    The decompression side of window deduplication: a bounded cache of the distinct windows decompressed recently, keyed
+    by window number and evicted least recently used first, from which back-references are copied. It mirrors the
+    WindowIndex of the compressor (see WindowIndex).
+    """
+
+    def __init__(self, max_windows: int):
+        self.max_windows = max_windows
+        self.windows = OrderedDict()  # number of the window -> its bytes, least recently used first
+        self.num_windows = 0
+
+    def clear(self):
+        """
+        Forgets every window, e.g., at a frame start or checkpoint, beyond which nothing may be referenced.
+        """
+        self.windows.clear()
+
+    def add(self, window):
+        """
+        Caches the next window, which was decompressed rather than referenced.
+
+        :param window: the bytes of the window (any object supporting the buffer protocol).
+        """
+        self.windows[self.num_windows] = bytes(window)
+        if len(self.windows) > self.max_windows:
+            self.windows.popitem(last=False)
+        self.num_windows += 1
+
+    def get(self, distance: int) -> bytes:
+        """
+        Gets the next window from a back-reference.
+
+        :param distance: the distance back to the referenced window, in windows.
+        :return: the bytes of the referenced window.
+        :raises ValueError: if the referenced window is not cached.
+        """
+        window_number = self.num_windows - distance
+        window = self.windows.get(window_number) if distance > 0 else None
+        if window is None:
+            raise ValueError(f'Invalid back-reference: {distance}')
+        self.windows.move_to_end(window_number)
+        self.num_windows += 1
+        return window
+
+
+def byte_values(window) -> list:
+    """
+    Gets the byte values present in a window, i.e., the existence state it leaves behind.
+
+    :param window: the bytes of the window (any object supporting the buffer protocol).
+    :return: the byte values, in ascending order.
+    """
+    return np.flatnonzero(np.bincount(np.frombuffer(window, dtype=np.uint8), minlength=256)).tolist()
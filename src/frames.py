@@ -0,0 +1,246 @@
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import os
+import time
+
+import dedupe
+import segmentation
+import window_kinds
+from binomial import set_shared_max_cache_bytes, shared_binomial
+from container import Header
+from stats import STAGE_READ, STAGE_SEGMENTATION, STAGE_WRITE, Stats
+from window_compressor import WindowCompressor
+from window_decompressor import WindowDecompressor
+
+# Number of windows handed to a worker at a time when the file is not framed.
+DEFAULT_WINDOWS_PER_BATCH = 64
+
+
+def compress_windows(header: Header, input_bytes: bytes, existence_index_set: set, level: int = 0,
+                     references: dict = None, stats: Stats = None) -> bytes:
+    """
+    Compresses a run of consecutive windows to length-prefixed window records. This is the unit of work handed to a
+    worker process, so it must remain a picklable module-level function. At a level above 0, the run is split into
+    windows of adaptive length (see segmentation.window_lengths).
+
+    :param header: the header of the compressed file.
+    :param input_bytes: the bytes of interest, a whole number of windows (bar the final run of a file).
+    :param existence_index_set: the existence index set from the window preceding the run (left unmodified).
+    :param level: the level of adaptive segmentation (0 for fixed windows).
+    :param references: the windows to encode as back-references, if any: the distance back, keyed by the number of the
+    window within the run (see compression_tasks).
+    :param stats: the Stats to update, if any.
+    :return: the concatenated window records.
+    """
+    compressor = WindowCompressor(header.window_size, block_bits=header.block_bits,
+                                  special_windows=header.special_windows, densest_last=header.densest_last,
+                                  stats=stats)
+    if stats is not None:
+        start = time.perf_counter()
+    lengths = segmentation.window_lengths(compressor, input_bytes, existence_index_set, level)
+    if stats is not None:
+        stats.time(STAGE_SEGMENTATION, start)
+    existence_index_set = set(existence_index_set)
+    records = bytearray()
+    start = 0
+    for i, length in enumerate(lengths):
+        window = input_bytes[start:start + length]
+        if references and i in references:
+            payload = compressor.reference(window, references[i], existence_index_set)
+        else:
+            payload = compressor.process(window, existence_index_set)
+        records += header.frame_record(payload)
+        start += length
+    return bytes(records)
+
+
+def compress_windows_with_stats(header: Header, input_bytes: bytes, existence_index_set: set, level: int = 0,
+                                references: dict = None) -> (bytes, Stats):
+    """
+    Compresses a run of consecutive windows as compress_windows does, also collecting Stats. Being a module-level
+    function, it can be handed to worker processes, which return their Stats along with the records.
+
+    :param header: the header of the compressed file.
+    :param input_bytes: the bytes of interest, a whole number of windows (bar the final run of a file).
+    :param existence_index_set: the existence index set from the window preceding the run (left unmodified).
+    :param level: the level of adaptive segmentation (0 for fixed windows).
+    :param references: the windows to encode as back-references, if any (see compress_windows).
+    :return: the concatenated window records and the Stats of compressing them.
+    """
+    stats = Stats()
+    return compress_windows(header, input_bytes, existence_index_set, level, references, stats), stats
+
+
+def decompress_windows(header: Header, records: bytes, first_window_number: int, existence_bitarray,
+                       max_num_bytes: int = None, window_counts=None, stats: Stats = None) -> bytes:
+    """
+    Decompresses a run of consecutive length-prefixed window records, resetting the existence state at frame starts.
+    The run must begin at a frame start or checkpoint if the file has back-references.
+
+    :param header: the header of the compressed file.
+    :param records: the window records of interest.
+    :param first_window_number: the (zero-based) number of the first window of the run.
+    :param existence_bitarray: the existence bitarray from the window preceding the run.
+    :param max_num_bytes: if given, stop once at least this many bytes have been decompressed.
+    :param window_counts: if given, a collections.Counter to update with the number of windows of each encoding.
+    :param stats: the Stats to update, if any.
+    :return: the decompressed bytes.
+    """
+    decompressor = WindowDecompressor(header.window_size, block_bits=header.block_bits,
+                                      special_windows=header.special_windows, densest_last=header.densest_last,
+                                      dedupe_windows=header.dedupe_windows, stats=stats)
+    result = bytearray()
+    window_number = first_window_number
+    for start, finish in record_offsets(header, records):
+        if max_num_bytes is not None and len(result) >= max_num_bytes:
+            break
+        if header.is_frame_start(window_number):
+            existence_bitarray.setall(0)
+        if header.is_dedupe_reset(window_number):
+            decompressor.cache.clear()
+        if window_counts is not None:
+            window_counts[window_kinds.kind_name(records[start:start + 1], header.special_windows)] += 1
+        result += decompressor.process(records[start:finish], existence_bitarray)
+        window_number += 1
+    return bytes(result)
+
+
+def decompress_segment(header: Header, d_input_path: str, compressed_start: int, compressed_finish: int,
+                       first_window_number: int, existence_bitarray, d_output_path: str,
+                       uncompressed_offset: int, collect_stats: bool = False) -> (int, Counter, Stats):
+    """
+    Decompresses the window records between two checkpoints of a seek index, writing the decompressed bytes at their
+    offset in a preallocated output file. The decompressed bytes never leave the (worker) process.
+
+    :param header: the header of the compressed file.
+    :param d_input_path: the path of the compressed file.
+    :param compressed_start: the file offset of the first window record.
+    :param compressed_finish: the file offset just past the last window record.
+    :param first_window_number: the (zero-based) number of the first window.
+    :param existence_bitarray: the existence bitarray restored from the checkpoint.
+    :param d_output_path: the path of the preallocated output file.
+    :param uncompressed_offset: the offset at which to write the decompressed bytes.
+    :param collect_stats: whether to collect Stats.
+    :return: the number of decompressed bytes, the number of windows of each encoding and the Stats (or None).
+    """
+    stats = Stats() if collect_stats else None
+    start = time.perf_counter()
+    with open(d_input_path, 'rb') as d_input_file:
+        d_input_file.seek(compressed_start)
+        records = d_input_file.read(compressed_finish - compressed_start)
+    if stats is not None:
+        stats.time(STAGE_READ, start)
+    window_counts = Counter()
+    decompressed_bytes = decompress_windows(header, records, first_window_number, existence_bitarray,
+                                            window_counts=window_counts, stats=stats)
+    start = time.perf_counter()
+    fd = os.open(d_output_path, os.O_WRONLY)
+    try:
+        num_bytes_written = 0
+        while num_bytes_written < len(decompressed_bytes):
+            num_bytes_written += os.pwrite(fd, decompressed_bytes[num_bytes_written:],
+                                           uncompressed_offset + num_bytes_written)
+    finally:
+        os.close(fd)
+    if stats is not None:
+        stats.time(STAGE_WRITE, start)
+    return len(decompressed_bytes), window_counts, stats
+
+
+def record_offsets(header: Header, records: bytes):
+    """
+    Generates the payload offsets of each length-prefixed window record.
+
+    :param header: the header of the compressed file.
+    :param records: the window records of interest.
+    :return: a generator of (start, finish) payload offsets.
+    """
+    finish = 0
+    while finish < len(records):
+        start, finish = header.record_extent(records, finish)
+        yield start, finish
+
+
+def count_records(header: Header, records: bytes) -> int:
+    """
+    Counts the length-prefixed window records of a run.
+
+    :param header: the header of the compressed file.
+    :param records: the window records of interest.
+    :return: the number of records.
+    """
+    return sum(1 for _ in record_offsets(header, records))
+
+
+def count_window_kinds(header: Header, records: bytes, window_counts):
+    """
+    Counts the windows of each encoding (ranked, stored, run, zero or small alphabet) among window records.
+
+    :param header: the header of the compressed file.
+    :param records: the window records of interest.
+    :param window_counts: the collections.Counter to update, keyed by the name of each encoding.
+    """
+    for start, _ in record_offsets(header, records):
+        window_counts[window_kinds.kind_name(records[start:start + 1], header.special_windows)] += 1
+
+
+def compression_tasks(batches, header: Header, level: int = 0):
+    """
+    Generates the arguments of compress_windows for each batch of input bytes. The existence index set left behind by
+    a window is simply the set of bytes it contains, so the seed of each batch can be derived from the last window of
+    the previous batch without compressing it first. Hence batches are independent units of work whether or not the
+    existence state is reset at batch boundaries. (Adaptive segmentation always ends a whole batch with a whole window,
+    so this holds at every level.) Likewise, back-references depend only on the bytes of earlier windows, so they are
+    found here, in window order, and handed to the workers with each batch.
+
+    :param batches: an iterable of batches of input bytes, one per frame if the file is framed.
+    :param header: the header of the compressed file.
+    :param level: the level of adaptive segmentation (0 for fixed windows).
+    :return: a generator of compress_windows argument tuples.
+    """
+    window_size = header.window_size
+    window_index = dedupe.WindowIndex(header.dedupe_windows) if header.dedupe_windows else None
+    window_number = 0
+    existence_index_set = set()
+    for batch in batches:
+        references = None
+        if window_index is not None:
+            references = {}
+            for i, start in enumerate(range(0, len(batch), window_size)):
+                if header.is_dedupe_reset(window_number + i):
+                    window_index.clear()
+                distance = window_index.find(batch[start:start + window_size])
+                if distance is not None:
+                    references[i] = distance
+        window_number += -(-len(batch) // window_size)
+        yield header, batch, set() if header.windows_per_frame else existence_index_set, level, references
+        existence_index_set = set(batch[-window_size:])
+
+
+def ordered_map(fn, tasks, jobs: int):
+    """
+    Applies a function to each task, in a pool of worker processes if more than one job is requested, yielding the
+    tasks and their results in task order. At most 2 * jobs tasks are in flight at any one time, bounding memory use.
+    Workers inherit the memory cap of this process's shared binomial coefficient cache.
+
+    :param fn: the (picklable) function to apply.
+    :param tasks: an iterable of argument tuples.
+    :param jobs: the number of worker processes.
+    :return: a generator of (task, result) tuples, in task order.
+    """
+    if jobs <= 1:
+        for task in tasks:
+            yield task, fn(*task)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_shared_max_cache_bytes,
+                             initargs=(shared_binomial.max_cache_bytes,)) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, pool.submit(fn, *task)))
+            if len(pending) >= 2 * jobs:
+                task, future = pending.popleft()
+                yield task, future.result()
+        while pending:
+            task, future = pending.popleft()
+            yield task, future.result()
@@ -1,107 +1,775 @@
 import argparse
+import contextlib
+import mmap
 import os
+import shutil
 import sys
+import time
+from collections import Counter
 
 from alive_progress import alive_bar
 
+import archive
+import binomial
+import block_ranking
+import frames
+import segmentation
 import util
-from bytes_analyser import BytesAnalyser
-from window_compressor import WindowCompressor
+import window_kinds
+from pipeline import DEFAULT_QUEUE_DEPTH, pipelined_input, pipelined_output
+from bytes_analyser import BytesAnalyser, DEFAULT_DIGEST, DIGEST_IDS
+from codec import BinomialReader, BinomialWriter
+from container import Header, SeekIndex
+from stats import STAGE_ANALYSIS, Stats
 from window_decompressor import WindowDecompressor
 
-MAGIC_BYTES = b'ajr74z'
 COMPRESSED_EXT = '.ajz'
 DEFAULT_WINDOW_SIZE = 1024
-MAX_WINDOW_SIZE = 4096
-MD5_DIGEST_SIZE = 16
+MAX_WINDOW_SIZE = 1 << 20
+ANALYSIS_CHUNK_SIZE = 1 << 20
+STREAM_CHUNK_SIZE = 1 << 16
+DEFAULT_BUFFER_SIZE = 1 << 20
+STDIO_PATH = '-'
+
+
+def compress_file(c_input_path: str, c_output_path: str, bytes_per_window: int, windows_per_frame: int = 0,
+                  jobs: int = 1, windows_per_checkpoint: int = 0, block_bits: int = 0,
+                  verbose: bool = False, digest: str = DEFAULT_DIGEST,
+                  special_windows: bool = True, window_counts: Counter = None, stats: Stats = None,
+                  buffer_size: int = DEFAULT_BUFFER_SIZE, queue_depth: int = DEFAULT_QUEUE_DEPTH,
+                  level: int = 0, densest_last: bool = True,
+                  dedupe_windows: int = 0) -> (BytesAnalyser, BytesAnalyser):
+    """
+    Compresses the specified file. The output is identical whatever the number of jobs. The input is memory-mapped and
+    handed out in batches of windows without copying (bar pickling them for worker processes), and the output is
+    written through a buffer of (at least) the supplied size by a writer thread, overlapping with compression.
+
+    :param c_input_path: the path of the file to compress.
+    :param c_output_path: the path of the compressed file to write.
+    :param bytes_per_window: the number of bytes per processing window.
+    :param windows_per_frame: the number of windows per independent frame (0 for no frames).
+    :param jobs: the number of worker processes.
+    :param windows_per_checkpoint: the number of windows per seek index checkpoint (0 for no seek index).
+    :param block_bits: the number of bits per block for block ranking (0 to rank each bitset as a whole).
+    :param verbose: whether to display progress (and count byte values for the Shannon entropy).
+    :param digest: the name of the integrity digest of the original bytes (md5, blake2b or crc32).
+    :param special_windows: whether windows may take special encodings (stored, run, zero or small alphabet).
+    :param window_counts: if given, a counter to update with the number of windows of each encoding.
+    :param stats: the Stats to update with the time per stage and the counters, if any.
+    :param buffer_size: the (minimum) number of bytes of the output buffer.
+    :param queue_depth: the maximum number of batches of records queued for the writer thread (0 for no thread).
+    :param level: the level of adaptive segmentation, which chooses the length of each window up to bytes_per_window
+    (0 for fixed windows; needs no frames).
+    :param densest_last: whether the most frequent byte value of each window, rather than the greatest, is inferred.
+    :param dedupe_windows: the number of distinct recent windows that repeated windows may refer back to (0 for no
+    back-references; needs fixed windows and special windows).
+    :return: the bytes analysers of the input and output files.
+    :raises ValueError: if adaptive segmentation is combined with frames, or back-references with adaptive segmentation
+    or without special windows.
+    """
+    start = time.perf_counter()
+    file_size = os.stat(c_input_path).st_size
+    c_in_analyser = BytesAnalyser(digest, count_bytes=verbose)
+    c_out_analyser = BytesAnalyser(digest, count_bytes=verbose)
+    header = Header(bytes_per_window, windows_per_frame, windows_per_checkpoint, block_bits, digest=digest,
+                    special_windows=special_windows, adaptive_windows=level > 0, densest_last=densest_last,
+                    dedupe_windows=dedupe_windows)
+    seek_index = SeekIndex(windows_per_checkpoint) if windows_per_checkpoint else None
+    window_sizer = WindowDecompressor(bytes_per_window, special_windows=special_windows)  # to locate checkpoints
+    bytes_per_batch = bytes_per_window * (windows_per_frame or frames.DEFAULT_WINDOWS_PER_BATCH)
+
+    with alive_bar(file_size, title='Compressed', enrich_print=False, max_cols=220, bar='circles',
+                   force_tty=True, unit='b', disable=not verbose) as bar, \
+            open(c_input_path, 'rb') as c_input_file, \
+            open(c_output_path, 'wb', buffering=max(buffer_size, bytes_per_window)) as c_raw_output_file, \
+            pipelined_output(c_raw_output_file, queue_depth, stats) as c_output_file:
+        header.write(c_output_file, c_out_analyser)
+        batches = mapped_batches(map_file(c_input_file), bytes_per_batch, c_in_analyser, jobs > 1, stats)
+        tasks = frames.compression_tasks(batches, header, level)
+        compress_windows = frames.compress_windows if stats is None else frames.compress_windows_with_stats
+        window_number = batch_start = 0
+        for (_, batch, existence_index_set, _, _), records in frames.ordered_map(compress_windows, tasks, jobs):
+            if stats is not None:
+                records, batch_stats = records
+                stats.merge(batch_stats)
+            if seek_index is not None:
+                record_start = window_start = previous_window_start = 0
+                for i, (payload_start, finish) in enumerate(frames.record_offsets(header, records)):
+                    if (window_number + i) % windows_per_checkpoint == 0:
+                        if i > 0:
+                            existence_index_set = set(batch[previous_window_start:window_start])
+                        seek_index.add(c_out_analyser.num_bytes + record_start, batch_start + window_start,
+                                       existence_index_set)
+                    previous_window_start = window_start
+                    window_start += window_sizer.window_length(records[payload_start:finish]) \
+                        if header.adaptive_windows else bytes_per_window
+                    record_start = finish
+            if window_counts is not None:
+                frames.count_window_kinds(header, records, window_counts)
+            window_number += frames.count_records(header, records) if header.adaptive_windows \
+                else -(-len(batch) // bytes_per_window)
+            batch_start += len(batch)
+            util.write_bytes(c_output_file, c_out_analyser, records, stats)
+            bar(len(batch))
+        util.write_bytes(c_output_file, c_out_analyser, c_in_analyser.compute_digest_bytes())
+        if seek_index is not None:
+            seek_index.uncompressed_size = c_in_analyser.num_bytes
+            seek_index.write(c_output_file, c_out_analyser)
+    if stats is not None:
+        stats.time('total', start)
+    return c_in_analyser, c_out_analyser
+
+
+def decompress_file(d_input_path: str, d_output_path: str, jobs: int = 1, verbose: bool = False,
+                    window_counts: Counter = None, stats: Stats = None,
+                    buffer_size: int = DEFAULT_BUFFER_SIZE,
+                    queue_depth: int = DEFAULT_QUEUE_DEPTH) -> (BytesAnalyser, BytesAnalyser):
+    """
+    Decompresses the specified file. Files with a seek index can be decompressed in parallel. Otherwise, the input is
+    memory-mapped and its window records are parsed in place, and windows are decompressed straight into an output
+    buffer of (at least) the supplied size, which is handed to a writer thread whenever it cannot hold another window.
+
+    :param d_input_path: the path of the compressed file.
+    :param d_output_path: the path of the decompressed file to write.
+    :param jobs: the number of worker processes (only used if the file has a seek index).
+    :param verbose: whether to display progress (and count byte values for the Shannon entropy).
+    :param window_counts: if given, a counter to update with the number of windows of each encoding.
+    :param stats: the Stats to update with the time per stage and the counters, if any.
+    :param buffer_size: the number of bytes of the output buffer (sequential decompression only).
+    :param queue_depth: the maximum number of output buffers queued for the writer thread (0 for no thread; sequential
+    decompression only).
+    :return: the bytes analysers of the input (None if decompressed in parallel and neither verbose nor given stats) and
+    output files.
+    :raises ValueError: if the input is not in a recognised compression format, is truncated or fails its digest.
+    """
+    start = time.perf_counter()
+    with open(d_input_path, 'rb') as d_input_file:
+        header = Header.read(d_input_file, BytesAnalyser(count_bytes=False))
+    if jobs > 1 and header.windows_per_checkpoint:
+        analysers = decompress_file_in_parallel(d_input_path, d_output_path, header, jobs, verbose, window_counts,
+                                                stats)
+        if stats is not None:
+            stats.time('total', start)
+        return analysers
+
+    file_size = os.stat(d_input_path).st_size
+    with alive_bar(file_size, title='Decompressed', enrich_print=False, max_cols=220, force_tty=True,
+                   bar='circles', unit='b', disable=not verbose) as bar, \
+            open(d_input_path, 'rb') as d_input_file:
+        d_in_analyser = BytesAnalyser(header.digest, count_bytes=verbose)
+        Header.read(d_input_file, d_in_analyser)
+        bar(d_in_analyser.num_bytes)
+        footer_size = SeekIndex.read(d_input_file, header.windows_per_checkpoint).footer_size \
+            if header.windows_per_checkpoint else 0
+        payload_end = file_size - header.digest_size - footer_size
+        decompressor = WindowDecompressor(header.window_size, block_bits=header.block_bits,
+                                          special_windows=header.special_windows, densest_last=header.densest_last,
+                                          dedupe_windows=header.dedupe_windows, stats=stats)
+        existence_bitarray = util.empty_bitarray(256)
+        d_out_analyser = BytesAnalyser(header.digest, count_bytes=verbose)
+        input_view = map_file(d_input_file)
+        output_buffer = bytearray(max(buffer_size, header.window_size))
+        output_view = memoryview(output_buffer)
+        num_buffered_bytes = 0
+        with open(d_output_path, 'wb', buffering=0) as d_raw_output_file, \
+                pipelined_output(d_raw_output_file, queue_depth, stats) as d_output_file:
+            window_number = 0
+            offset = num_analysed_bytes = d_in_analyser.num_bytes
+            while offset < payload_end:
+                payload_start, offset = header.record_extent(input_view, offset)
+                if offset > payload_end:
+                    raise ValueError('Truncated compressed file!')
+                if len(output_buffer) - num_buffered_bytes < header.window_size:
+                    flush_buffer(d_output_file, output_view[:num_buffered_bytes], d_out_analyser, stats)
+                    num_buffered_bytes = 0
+                    analyse_view(input_view[num_analysed_bytes:offset], d_in_analyser, stats)
+                    bar(offset - num_analysed_bytes)
+                    num_analysed_bytes = offset
+                if header.is_frame_start(window_number):
+                    existence_bitarray.setall(0)
+                if header.is_dedupe_reset(window_number):
+                    decompressor.cache.clear()
+                if window_counts is not None:
+                    window_counts[window_kinds.kind_name(input_view[payload_start:payload_start + 1],
+                                                         header.special_windows)] += 1
+                num_buffered_bytes += decompressor.process_into(input_view[payload_start:offset], existence_bitarray,
+                                                                output_view[num_buffered_bytes:])
+                window_number += 1
+            flush_buffer(d_output_file, output_view[:num_buffered_bytes], d_out_analyser, stats)
+            analyse_view(input_view[num_analysed_bytes:], d_in_analyser, stats)
+            bar(len(input_view) - num_analysed_bytes)
+            published_digest_bytes = bytes(input_view[payload_end:payload_end + header.digest_size])
+            computed_digest_bytes = d_out_analyser.compute_digest_bytes()
+        if computed_digest_bytes != published_digest_bytes:
+            raise ValueError('Digest mismatch!')
+    if stats is not None:
+        stats.time('total', start)
+    return d_in_analyser, d_out_analyser
+
+
+def decompress_file_in_parallel(d_input_path: str, d_output_path: str, header: Header, jobs: int,
+                                verbose: bool = False, window_counts: Counter = None,
+                                stats: Stats = None) -> (BytesAnalyser, BytesAnalyser):
+    """
+    Decompresses the specified file, which must have a seek index, in a pool of worker processes. The output file is
+    preallocated and each worker writes the segment between two checkpoints straight to its offset, so decompressed
+    bytes are never held by this process. The digest is verified with a sequential pass over the output file; the input
+    file is only read again for its digest if progress or stats are wanted.
+
+    :param d_input_path: the path of the compressed file.
+    :param d_output_path: the path of the decompressed file to write.
+    :param header: the header of the compressed file.
+    :param jobs: the number of worker processes.
+    :param verbose: whether to display progress (and count byte values for the Shannon entropy).
+    :param window_counts: if given, a counter to update with the number of windows of each encoding.
+    :param stats: the Stats to update with the time per stage and the counters, if any.
+    :return: the bytes analysers of the input (None unless verbose or given stats) and output files.
+    :raises ValueError: if the digest of the output does not match the published digest.
+    """
+    file_size = os.stat(d_input_path).st_size
+    with open(d_input_path, 'rb') as d_input_file:
+        seek_index = SeekIndex.read(d_input_file, header.windows_per_checkpoint)
+        payload_end = file_size - header.digest_size - seek_index.footer_size
+        d_input_file.seek(payload_end)
+        published_digest_bytes = d_input_file.read(header.digest_size)
+
+    with open(d_output_path, 'wb') as d_output_file:
+        if hasattr(os, 'posix_fallocate') and seek_index.uncompressed_size:
+            os.posix_fallocate(d_output_file.fileno(), 0, seek_index.uncompressed_size)
+        d_output_file.truncate(seek_index.uncompressed_size)
+
+    def tasks():
+        for checkpoint in range(len(seek_index)):
+            yield (header, d_input_path, *seek_index.compressed_extent(checkpoint, payload_end),
+                   checkpoint * header.windows_per_checkpoint, seek_index.existence_states[checkpoint], d_output_path,
+                   seek_index.uncompressed_offsets[checkpoint], stats is not None)
+
+    with alive_bar(file_size, title='Decompressed', enrich_print=False, max_cols=220, force_tty=True,
+                   bar='circles', unit='b', disable=not verbose) as bar:
+        bar(seek_index.compressed_offsets[0] if len(seek_index) else payload_end)
+        for task, (_, segment_window_counts, segment_stats) in frames.ordered_map(frames.decompress_segment, tasks(),
+                                                                                  jobs):
+            if window_counts is not None:
+                window_counts.update(segment_window_counts)
+            if stats is not None:
+                stats.merge(segment_stats)
+            bar(task[3] - task[2])
+        bar(file_size - payload_end)
+
+    d_in_analyser = None
+    if verbose or stats is not None:
+        d_in_analyser = BytesAnalyser(header.digest, count_bytes=verbose)
+        analyse_file(d_input_path, d_in_analyser, stats)
+    d_out_analyser = BytesAnalyser(header.digest, count_bytes=verbose)
+    analyse_file(d_output_path, d_out_analyser, stats)
+    if d_out_analyser.compute_digest_bytes() != published_digest_bytes:
+        raise ValueError('Digest mismatch!')
+    return d_in_analyser, d_out_analyser
+
+
+def map_file(infile) -> memoryview:
+    """
+    Memory-maps the whole of a file open for binary reading. The mapping is closed once the last view of it is released.
+
+    :param infile: the file of interest.
+    :return: a read-only view of the file's bytes (empty for an empty file, which cannot be mapped).
+    """
+    if not os.fstat(infile.fileno()).st_size:
+        return memoryview(b'')
+    mapping = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)  # read ahead aggressively, overlapping reads with compute
+    return memoryview(mapping)
+
+
+def mapped_batches(view: memoryview, bytes_per_batch: int, analyser: BytesAnalyser, as_bytes: bool = False,
+                   stats: Stats = None):
+    """
+    Generates consecutive batches of a view of a (memory-mapped) file, updating a bytes analyser with each.
+
+    :param view: the view of interest.
+    :param bytes_per_batch: the number of bytes per batch (bar the last).
+    :param analyser: the bytes analyser to update.
+    :param as_bytes: whether to copy each batch to bytes (for pickling to worker processes) rather than slice the view.
+    :param stats: the Stats to add the analysis time to, if any.
+    :return: a generator of batches.
+    """
+    for offset in range(0, len(view), bytes_per_batch):
+        batch = view[offset:offset + bytes_per_batch]
+        analyse_view(batch, analyser, stats)
+        yield bytes(batch) if as_bytes else batch
+
+
+def analyse_view(view: memoryview, analyser: BytesAnalyser, stats: Stats = None):
+    """
+    Updates a bytes analyser with a view of bytes.
+
+    :param view: the view of interest.
+    :param analyser: the bytes analyser to update.
+    :param stats: the Stats to add the analysis time to, if any.
+    """
+    if stats is None:
+        analyser.update(view)
+        return
+    start = time.perf_counter()
+    analyser.update(view)
+    stats.time(STAGE_ANALYSIS, start)
+
+
+def flush_buffer(outfile, view: memoryview, analyser: BytesAnalyser, stats: Stats = None):
+    """
+    Writes the buffered bytes of an output buffer in one call, updating a bytes analyser.
+
+    :param outfile: the file to write to.
+    :param view: the view of the buffered bytes.
+    :param analyser: the bytes analyser to update.
+    :param stats: the Stats to add the write and analysis times to, if any.
+    """
+    if view:
+        util.write_bytes(outfile, analyser, view, stats)
+
+
+def analyse_file(path: str, analyser: BytesAnalyser, stats: Stats = None):
+    """
+    Updates a bytes analyser with the entire contents of the specified file.
+
+    :param path: the path of the file of interest.
+    :param analyser: the bytes analyser to update.
+    :param stats: the Stats to add the read and analysis times to, if any.
+    """
+    with open(path, 'rb') as infile:
+        while util.read_bytes(infile, analyser, ANALYSIS_CHUNK_SIZE, stats):
+            pass
+
+
+def decompress_range(d_input_path: str, start: int, length: int) -> bytes:
+    """
+    Decompresses a range of the original bytes from the specified compressed file. If the file carries a seek index,
+    only the windows from the last checkpoint at or before the range are decompressed; otherwise decompression starts
+    at the first window.
+
+    :param d_input_path: the path of the compressed file.
+    :param start: the offset of the range within the original bytes.
+    :param length: the number of bytes of the range.
+    :return: the bytes of the range (fewer than requested if the range extends beyond the end of the original).
+    :raises ValueError: if the input is not in a recognised compression format.
+    """
+    if length <= 0:
+        return b''
+    file_size = os.stat(d_input_path).st_size
+    with open(d_input_path, 'rb') as d_input_file:
+        header = Header.read(d_input_file, BytesAnalyser(count_bytes=False))
+        compressed_start = d_input_file.tell()
+        payload_end = file_size - header.digest_size
+        uncompressed_start = 0
+        existence_bitarray = util.empty_bitarray(256)
+        first_window_number = 0
+        if header.windows_per_checkpoint:
+            seek_index = SeekIndex.read(d_input_file, header.windows_per_checkpoint)
+            payload_end -= seek_index.footer_size
+            if len(seek_index):
+                checkpoint = seek_index.find(start)
+                compressed_start = seek_index.compressed_offsets[checkpoint]
+                uncompressed_start = seek_index.uncompressed_offsets[checkpoint]
+                existence_bitarray = seek_index.existence_states[checkpoint]
+                first_window_number = checkpoint * header.windows_per_checkpoint
+                payload_end = seek_index.compressed_extent(seek_index.find(start + length - 1), payload_end)[1]
+        d_input_file.seek(compressed_start)
+        records = d_input_file.read(payload_end - compressed_start)
+    decompressed_bytes = frames.decompress_windows(header, records, first_window_number, existence_bitarray,
+                                                   start + length - uncompressed_start)
+    return decompressed_bytes[start - uncompressed_start:start - uncompressed_start + length]
+
+
+def compare_ranking_modes(c_input_path: str, bytes_per_window: int) -> list:
+    """
+    Compresses and decompresses the specified file in memory with each ranking mode (whole bitsets, then each supported
+    block size), timing both directions. Nothing is written to disk.
+
+    :param c_input_path: the path of the file of interest.
+    :param bytes_per_window: the number of bytes per processing window.
+    :return: a list of (block_bits, compressed size, compression seconds, decompression seconds) tuples, one per mode.
+    """
+    with open(c_input_path, 'rb') as c_input_file:
+        input_bytes = c_input_file.read()
+    results = []
+    for block_bits in (0, *block_ranking.BLOCK_SIZES):
+        start = time.perf_counter()
+        header = Header(bytes_per_window, block_bits=block_bits)
+        records = frames.compress_windows(header, input_bytes, set())
+        compression_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        decompressed_bytes = frames.decompress_windows(header, records, 0, util.empty_bitarray(256))
+        decompression_seconds = time.perf_counter() - start
+        assert decompressed_bytes == input_bytes
+        results.append((block_bits, len(records), compression_seconds, decompression_seconds))
+    return results
+
+
+def print_ranking_mode_comparison(c_input_path: str, bytes_per_window: int):
+    """
+    Prints the space saving and speed of each ranking mode for the specified file, relative to whole-bitset ranking.
+
+    :param c_input_path: the path of the file of interest.
+    :param bytes_per_window: the number of bytes per processing window.
+    """
+    num_bytes = os.stat(c_input_path).st_size
+    results = compare_ranking_modes(c_input_path, bytes_per_window)
+    _, _, base_compression_seconds, base_decompression_seconds = results[0]
+    print(f'{"Mode":<14} {"Space saving":>12} {"Compress":>14} {"Decompress":>14}')
+    for block_bits, num_compressed_bytes, compression_seconds, decompression_seconds in results:
+        mode = f'{block_bits}-bit blocks' if block_bits else 'whole bitsets'
+        saving = 100 * (1 - num_compressed_bytes / num_bytes) if num_bytes else 0
+        print(f'{mode:<14} {saving:>11.2f}% {compression_seconds:>7.2f}s ({base_compression_seconds / compression_seconds:0.2f}x) '
+              f'{decompression_seconds:>7.2f}s ({base_decompression_seconds / decompression_seconds:0.2f}x)')
+
+
+def print_binomial_cache_stats(file=None):
+    """
+    Prints the counters of this process's shared binomial coefficient cache. (Worker processes keep their own caches.)
+
+    :param file: the text stream to print to (stdout by default).
+    """
+    stats = binomial.shared_binomial.stats()
+    print(f'Binomial cache:: hits: {stats["hits"]}; misses: {stats["misses"]}; evictions: {stats["evictions"]}; '
+          f'rows: {stats["rows"]}; size: {stats["cache_bytes"] / (1 << 20):0.1f} MiB', file=file)
+
+
+def compress_stream(infile, outfile, bytes_per_window: int, windows_per_frame: int = 0,
+                    windows_per_checkpoint: int = 0, block_bits: int = 0, verbose: bool = False,
+                    digest: str = DEFAULT_DIGEST, special_windows: bool = True, window_counts: Counter = None,
+                    stats: Stats = None, buffer_size: int = STREAM_CHUNK_SIZE,
+                    queue_depth: int = DEFAULT_QUEUE_DEPTH, level: int = 0, densest_last: bool = True,
+                    dedupe_windows: int = 0) -> (BytesAnalyser, BytesAnalyser):
+    """
+    Compresses a binary stream to another, e.g., stdin to stdout. Neither stream need be seekable. The streams are read
+    and written by a reader and a writer thread connected to compression by bounded queues, so that I/O overlaps with
+    compression; the bytes analysers are updated by compression alone, in stream order.
+
+    :param infile: the binary stream to compress.
+    :param outfile: the binary stream to write the compressed bytes to.
+    :param bytes_per_window: the number of bytes per processing window.
+    :param windows_per_frame: the number of windows per independent frame (0 for no frames).
+    :param windows_per_checkpoint: the number of windows per seek index checkpoint (0 for no seek index).
+    :param block_bits: the number of bits per block for block ranking (0 to rank each bitset as a whole).
+    :param verbose: whether to count byte values for the Shannon entropy.
+    :param digest: the name of the integrity digest of the original bytes (md5, blake2b or crc32).
+    :param special_windows: whether windows may take special encodings (stored, run, zero or small alphabet).
+    :param window_counts: if given, a counter to update with the number of windows of each encoding.
+    :param stats: the Stats to update with the time per stage and the counters, if any.
+    :param buffer_size: the number of bytes per read and write of the streams.
+    :param queue_depth: the maximum number of chunks queued between each thread and the next (0 for no threads).
+    :param level: the level of adaptive segmentation, which chooses the length of each window up to bytes_per_window
+    (0 for fixed windows; needs no frames).
+    :param densest_last: whether the most frequent byte value of each window, rather than the greatest, is inferred.
+    :param dedupe_windows: the number of distinct recent windows that repeated windows may refer back to (0 for no
+    back-references; needs fixed windows and special windows).
+    :return: the bytes analysers of the input and output streams.
+    :raises ValueError: if adaptive segmentation is combined with frames, or back-references with adaptive segmentation
+    or without special windows.
+    """
+    start = time.perf_counter()
+    with pipelined_input(infile, buffer_size, queue_depth, stats) as source, \
+            pipelined_output(outfile, queue_depth, stats) as sink, \
+            BinomialWriter(sink, bytes_per_window, windows_per_frame, windows_per_checkpoint, block_bits, digest,
+                           count_bytes=verbose, special_windows=special_windows, stats=stats, level=level,
+                           densest_last=densest_last, dedupe_windows=dedupe_windows) as writer:
+        shutil.copyfileobj(source, writer, buffer_size)
+    if window_counts is not None:
+        window_counts.update(writer.window_counts)
+    if stats is not None:
+        stats.time('total', start)
+    return writer.in_analyser, writer.out_analyser
+
+
+def decompress_stream(infile, outfile, verbose: bool = False, window_counts: Counter = None,
+                      stats: Stats = None, buffer_size: int = STREAM_CHUNK_SIZE,
+                      queue_depth: int = DEFAULT_QUEUE_DEPTH) -> (BytesAnalyser, BytesAnalyser):
+    """
+    Decompresses a binary stream to another, e.g., stdin to stdout. Neither stream need be seekable. The streams are
+    read and written by a reader and a writer thread connected to decompression by bounded queues, so that I/O overlaps
+    with decompression; the bytes analysers are updated by decompression alone, in stream order.
+
+    :param infile: the binary stream to decompress.
+    :param outfile: the binary stream to write the decompressed bytes to.
+    :param verbose: whether to count byte values for the Shannon entropy.
+    :param window_counts: if given, a counter to update with the number of windows of each encoding.
+    :param stats: the Stats to update with the time per stage and the counters, if any.
+    :param buffer_size: the number of bytes per read and write of the streams.
+    :param queue_depth: the maximum number of chunks queued between each thread and the next (0 for no threads).
+    :return: the bytes analysers of the input and output streams.
+    :raises ValueError: if the input is not in a recognised compression format, is truncated or fails its digest check.
+    """
+    start = time.perf_counter()
+    with pipelined_input(infile, buffer_size, queue_depth, stats) as source, \
+            pipelined_output(outfile, queue_depth, stats) as sink, \
+            BinomialReader(source, count_bytes=verbose, stats=stats) as reader:
+        shutil.copyfileobj(reader, sink, buffer_size)
+    if window_counts is not None:
+        window_counts.update(reader.window_counts)
+    if stats is not None:
+        stats.time('total', start)
+    return reader.in_analyser, reader.out_analyser
+
+
+def print_analysis(label: str, analyser: BytesAnalyser, file=None):
+    """
+    Prints the digest and Shannon entropy of the bytes seen by a bytes analyser (which must count byte values).
+
+    :param label: the label of the bytes, e.g., Input.
+    :param analyser: the bytes analyser of interest.
+    :param file: the text stream to print to (stdout by default).
+    """
+    print(f'{label}:: {analyser.digest_name.upper()}: {analyser.compute_digest_hex()}; '
+          f'Shannon entropy: {analyser.compute_shannon_entropy():0.6f}', file=file)
+
+
+def print_window_counts(window_counts: Counter, file=None):
+    """
+    Prints the number of windows of each encoding.
+
+    :param window_counts: the number of windows of each encoding, keyed by the name of the encoding.
+    :param file: the text stream to print to (stdout by default).
+    """
+    names = (window_kinds.RANKED, *window_kinds.KIND_NAMES.values())
+    print('Windows:: ' + '; '.join(f'{name}: {window_counts[name]}' for name in names), file=file)
+
+
+def write_stats(path: str, stats: Stats, in_analyser: BytesAnalyser, out_analyser: BytesAnalyser,
+                window_counts: Counter):
+    """
+    Writes the Stats of a job to a file as JSON, along with its byte counts, the number of windows of each encoding
+    (and the share of them that refer back to earlier windows) and the counters of the shared binomial coefficient
+    cache.
+
+    :param path: the path of the file to write.
+    :param stats: the Stats of the job.
+    :param in_analyser: the bytes analyser of the input.
+    :param out_analyser: the bytes analyser of the output.
+    :param window_counts: the number of windows of each encoding.
+    """
+    num_windows = sum(window_counts.values())
+    num_references = window_counts[window_kinds.KIND_NAMES[window_kinds.KIND_REFERENCE]]
+    stats.write(path, {'num_input_bytes': in_analyser.num_bytes, 'num_output_bytes': out_analyser.num_bytes,
+                       'window_kinds': dict(window_counts),
+                       'dedupe_hit_rate': num_references / num_windows if num_windows else 0.0,
+                       'binomial_cache': binomial.shared_binomial.stats()})
+
+
+def open_input(path: str):
+    """
+    Opens the specified file for binary reading, or stdin if the path is '-'.
+
+    :param path: the path of the file of interest, or '-'.
+    :return: a context manager for the binary stream.
+    """
+    return contextlib.nullcontext(sys.stdin.buffer) if path == STDIO_PATH else open(path, 'rb')
+
+
+def parse_range(text: str) -> tuple:
+    """
+    Parses a range of the original bytes given on the command line.
+
+    :param text: the range, as START:LENGTH.
+    :return: the offset and number of bytes of the range.
+    :raises argparse.ArgumentTypeError: if the range is not two non-negative integers separated by a colon.
+    """
+    try:
+        start, length = (int(val) for val in text.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{text} is not of the form START:LENGTH') from None
+    if start < 0 or length < 0:
+        raise argparse.ArgumentTypeError(f'{text} has a negative START or LENGTH')
+    return start, length
 
 
 def main():
     parser = argparse.ArgumentParser(description='Compress/decompress a file')
-    parser.add_argument('file', help='the file to process')
+    parser.add_argument('file', help=f'the file to process ({STDIO_PATH} for stdin, written to stdout)')
+    parser.add_argument('members', nargs='*',
+                        help='with -a, the files and directories to archive, or with -d the members to extract '
+                             '(default all)')
+    parser.add_argument('-a', '--archive', action='store_true',
+                        help='treat the file as an archive of many files: create it from MEMBERS, or with -d extract '
+                             'its members into the current directory (inputs are retained)')
+    parser.add_argument('-b', '--block', type=int, choices=(0, *block_ranking.BLOCK_SIZES),
+                        help='number of bits per block for block ranking (default 0, i.e., rank whole bitsets)', default=0)
+    parser.add_argument('--buffer-size', type=int, metavar='KIB', default=DEFAULT_BUFFER_SIZE >> 10,
+                        help=f'size in KiB of the output buffer for files and of each read and write for streams '
+                             f'(default {DEFAULT_BUFFER_SIZE >> 10})')
+    parser.add_argument('-c', '--stdout', action='store_true', help='write to stdout and retain the input file')
     parser.add_argument('-d', '--decompress', action='store_true', help='run in decompression mode')
+    parser.add_argument('-f', '--frame', type=int, help='number of windows per independent frame (default 0, i.e., no frames)',
+                        default=0)
+    parser.add_argument('-g', '--digest', choices=tuple(DIGEST_IDS), default=DEFAULT_DIGEST,
+                        help=f'integrity digest of the original bytes (default {DEFAULT_DIGEST})')
+    parser.add_argument('-i', '--index', type=int, help='number of windows per seek index checkpoint (default 0, i.e., no seek index)',
+                        default=0)
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes for files (default 1; decompression needs a seek index)', default=1)
     parser.add_argument('-k', '--keep', action='store_true', help='retain files')
+    parser.add_argument('-l', '--level', type=int, choices=range(segmentation.MAX_LEVEL + 1), default=0,
+                        help='effort of adaptive segmentation, which picks each window\'s length from SIZE and up to '
+                             'LEVEL halvings of it (default 0, i.e., fixed windows; needs no frames)')
+    parser.add_argument('-m', '--memory', type=int, help=f'memory cap in MiB for the binomial coefficient cache (default {binomial.DEFAULT_MAX_CACHE_BYTES >> 20})',
+                        default=binomial.DEFAULT_MAX_CACHE_BYTES >> 20)
+    parser.add_argument('-n', '--rank-all', action='store_true',
+                        help='rank every window, rather than using special encodings for incompressible, single-valued '
+                             'and small-alphabet windows')
+    parser.add_argument('-o', '--value-order', action='store_true',
+                        help='infer the bitset of the greatest byte value of each window, rather than of the most '
+                             'frequent')
+    parser.add_argument('-q', '--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help=f'number of chunks queued between the reader, compute and writer threads (default '
+                             f'{DEFAULT_QUEUE_DEPTH}; 0 for no I/O threads)')
+    parser.add_argument('-r', '--range', type=parse_range, metavar='START:LENGTH',
+                        help='decompress only the range START:LENGTH of the original bytes to stdout')
     parser.add_argument('-s', '--size', type=int, help=f'number of bytes per processing window (default {DEFAULT_WINDOW_SIZE}, max {MAX_WINDOW_SIZE})',
                         default=DEFAULT_WINDOW_SIZE)
+    parser.add_argument('--stats', metavar='FILE',
+                        help='write the time per stage, counters and histograms of k and rank widths to FILE as JSON')
+    parser.add_argument('-t', '--trial', action='store_true',
+                        help='report the space saving and speed of each ranking mode for the file, without writing files')
     parser.add_argument('-v', '--verbose', action='store_true', help='run verbosely')
+    parser.add_argument('-w', '--dedupe', type=int, metavar='WINDOWS', default=0,
+                        help='encode a window seen among the last WINDOWS distinct windows as a back-reference to it '
+                             '(default 0, i.e., no back-references; needs fixed, special windows)')
     args = parser.parse_args()
 
-    if not os.path.exists(args.file) or not os.path.isfile(args.file):
+    to_stdout = args.stdout or args.file == STDIO_PATH
+    if args.archive:
+        if to_stdout or args.trial or args.range:
+            parser.error('--archive needs a regular file, so cannot be combined with -c, --trial or --range')
+        if not args.decompress and not args.members:
+            parser.error('--archive needs the files and directories to archive')
+    elif args.members:
+        parser.error('only --archive takes more than one file')
+    elif args.file == STDIO_PATH:
+        if args.trial or args.range:
+            parser.error('--trial and --range need a regular file')
+    elif not os.path.exists(args.file) or not os.path.isfile(args.file):
         raise FileNotFoundError(f'{args.file} does not exist or is not a regular file')
+    binomial.set_shared_max_cache_bytes(max(0, args.memory) << 20)
+    log = sys.stderr if to_stdout else sys.stdout  # keep reports out of the compressed/decompressed stream
 
-    if args.decompress:
-        d_input_path = args.file
-        d_output_path = d_input_path.removesuffix(COMPRESSED_EXT)
-        file_size = os.stat(d_input_path).st_size
-        file_size_minus_md5_digest_size = file_size - MD5_DIGEST_SIZE
-        with alive_bar(file_size, title='Decompressed', enrich_print=False, max_cols=220, force_tty=True,
-                       bar='circles', unit='b', disable=not args.verbose) as bar, \
-                open(d_input_path, 'rb') as d_input_file:
-            d_in_analyser = BytesAnalyser()
-            magic = util.read_bytes(d_input_file, d_in_analyser, len(MAGIC_BYTES))
-            bar(len(magic))
-            if magic == MAGIC_BYTES:
-                bytes_per_window = util.read_val(d_input_file, d_in_analyser)
-                bar(util.NUM_BYTES_FOR_PERSISTED_PARAMETERS)
-                decompressor = WindowDecompressor(bytes_per_window)
-                existence_bitarray = util.empty_bitarray(256)
-                d_out_analyser = BytesAnalyser()
-                with open(d_output_path, 'wb') as d_output_file:
-                    size = util.read_val(d_input_file, d_in_analyser)
-                    while size:
-                        bar(util.NUM_BYTES_FOR_PERSISTED_PARAMETERS)
-                        payload_bytes = util.read_bytes(d_input_file, d_in_analyser, size)
-                        bar(len(payload_bytes))
-                        decompressed_bytes = decompressor.process(payload_bytes, existence_bitarray)
-                        util.write_bytes(d_output_file, d_out_analyser, decompressed_bytes)
-                        if d_in_analyser.num_bytes == file_size_minus_md5_digest_size:
-                            published_digest_bytes = util.read_bytes(d_input_file, d_in_analyser, MD5_DIGEST_SIZE)
-                            bar(len(published_digest_bytes))
-                        size = util.read_val(d_input_file, d_in_analyser)
-                    computed_digest_bytes = d_out_analyser.compute_md5_bytes()
-                assert computed_digest_bytes == published_digest_bytes
+    bytes_per_window = args.size if 0 < args.size <= MAX_WINDOW_SIZE else DEFAULT_WINDOW_SIZE
+    buffer_size = max(1, args.buffer_size) << 10
+    # Framed and indexed files have varint header fields, so any number of windows fits.
+    windows_per_frame = max(0, args.frame)
+    windows_per_checkpoint = max(0, args.index)
+    dedupe_windows = max(0, args.dedupe)
+    if not (args.decompress or args.trial or args.range):
+        if args.level and windows_per_frame:
+            parser.error('--level needs fixed windows, so cannot be combined with --frame')
+        if dedupe_windows and (args.level or args.rank_all):
+            parser.error('--dedupe needs fixed, special windows, so cannot be combined with --level or --rank-all')
+
+    if args.trial:
+        print_ranking_mode_comparison(args.file, bytes_per_window)
+
+    elif args.range:
+        start, length = args.range
+        try:
+            sys.stdout.buffer.write(decompress_range(args.file, start, length))
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+
+    elif args.archive and args.decompress:
+        try:
+            member_table = archive.read_members(args.file)
+            with alive_bar(sum(member_table.uncompressed_sizes), title='Extracted', enrich_print=False, max_cols=220,
+                           force_tty=True, bar='circles', unit='b', disable=not args.verbose) as bar:
+                extracted = archive.extract_archive(args.file, '.', args.members or None, max(1, args.jobs), bar)
+        except KeyError as e:
+            print(e.args[0], file=log)
+            sys.exit(1)
+        except ValueError as e:
+            print(e, file=log)
+            sys.exit(1)
+        if args.verbose:
+            print(f'Members:: {len(extracted)} extracted of {len(member_table)}', file=log)
 
+    elif args.archive:
+        try:
+            members = archive.member_paths(args.members)
+        except ValueError as e:
+            print(e, file=log)
+            sys.exit(1)
+        options = {'window_size': bytes_per_window, 'windows_per_frame': windows_per_frame,
+                   'windows_per_checkpoint': windows_per_checkpoint, 'block_bits': args.block, 'digest': args.digest,
+                   'special_windows': not args.rank_all, 'level': args.level, 'densest_last': not args.value_order,
+                   'dedupe_windows': dedupe_windows}
+        with alive_bar(sum(os.path.getsize(path) for _, path in members), title='Archived', enrich_print=False,
+                       max_cols=220, bar='circles', force_tty=True, unit='b', disable=not args.verbose) as bar:
+            member_table = archive.create_archive(args.file, members, max(1, args.jobs), options, bar)
+        if args.verbose:
+            num_input_bytes = sum(member_table.uncompressed_sizes)
+            print(f'Members:: {len(member_table)} archived', file=log)
+            if num_input_bytes:
+                print(f'Space saving: {100 * (1 - os.path.getsize(args.file) / num_input_bytes):0.2f}%', file=log)
+
+    elif args.decompress:
+        d_input_path = args.file
+        window_counts = Counter()
+        stats = Stats() if args.stats else None
+        try:
+            if to_stdout:
+                with open_input(d_input_path) as d_input_file:
+                    d_in_analyser, d_out_analyser = decompress_stream(d_input_file, sys.stdout.buffer, args.verbose,
+                                                                      window_counts, stats, buffer_size,
+                                                                      args.queue_depth)
             else:
-                print(f'Incorrect compression format!')
-                sys.exit(1)
+                if args.jobs > 1:
+                    with open(d_input_path, 'rb') as d_input_file:
+                        if not Header.read(d_input_file, BytesAnalyser(count_bytes=False)).windows_per_checkpoint:
+                            print('Note: parallel decompression needs a seek index (-i when compressing), so '
+                                  'decompressing sequentially', file=sys.stderr)
+                d_in_analyser, d_out_analyser = decompress_file(d_input_path, d_input_path.removesuffix(COMPRESSED_EXT),
+                                                                max(1, args.jobs), args.verbose, window_counts, stats,
+                                                                buffer_size, args.queue_depth)
+        except ValueError as e:
+            print(e, file=log)
+            sys.exit(1)
 
         if args.verbose:
-            print(f'Input:: MD5: {d_in_analyser.compute_md5_hex()}; Shannon entropy: {d_in_analyser.compute_shannon_entropy():0.6f}')
-            print(f'Output:: MD5: {d_out_analyser.compute_md5_hex()}; Shannon entropy: {d_out_analyser.compute_shannon_entropy():0.6f}')
-        if not args.keep:
+            print_analysis('Input', d_in_analyser, log)
+            print_analysis('Output', d_out_analyser, log)
+            print_window_counts(window_counts, log)
+            print_binomial_cache_stats(log)
+        if stats is not None:
+            write_stats(args.stats, stats, d_in_analyser, d_out_analyser, window_counts)
+        if not args.keep and not to_stdout:
             os.remove(d_input_path)
 
     else:
-        bytes_per_window = args.size if 0 < args.size < MAX_WINDOW_SIZE else DEFAULT_WINDOW_SIZE
-
         c_input_path = args.file
-        file_size = os.stat(c_input_path).st_size
-        c_output_path = c_input_path + COMPRESSED_EXT
-        c_in_analyser = BytesAnalyser()
-        c_out_analyser = BytesAnalyser()
-        compressor = WindowCompressor(bytes_per_window)
-        existence_index_set = set()
-
-        with alive_bar(file_size, title='Compressed', enrich_print=False, max_cols=220, bar='circles',
-                       force_tty=True, unit='b', disable=not args.verbose) as bar, \
-                open(c_input_path, 'rb') as c_input_file, open(c_output_path, 'wb') as c_output_file:
-            util.write_bytes(c_output_file, c_out_analyser, MAGIC_BYTES)
-            util.write_val(c_output_file, c_out_analyser, bytes_per_window)
-            in_buffer_bytes = util.read_bytes(c_input_file, c_in_analyser, bytes_per_window)
-            while in_buffer_bytes:
-                bar(len(in_buffer_bytes))
-                compressed_bytes = compressor.process(in_buffer_bytes, existence_index_set)
-                util.write_val(c_output_file, c_out_analyser, len(compressed_bytes))
-                util.write_bytes(c_output_file, c_out_analyser, compressed_bytes)
-                in_buffer_bytes = util.read_bytes(c_input_file, c_in_analyser, bytes_per_window)
-            util.write_bytes(c_output_file, c_out_analyser, c_in_analyser.compute_md5_bytes())
+        window_counts = Counter()
+        stats = Stats() if args.stats else None
+        if to_stdout:
+            with open_input(c_input_path) as c_input_file:
+                c_in_analyser, c_out_analyser = compress_stream(c_input_file, sys.stdout.buffer, bytes_per_window,
+                                                                windows_per_frame, windows_per_checkpoint, args.block,
+                                                                args.verbose, args.digest, not args.rank_all,
+                                                                window_counts, stats, buffer_size, args.queue_depth,
+                                                                args.level, not args.value_order, dedupe_windows)
+        else:
+            c_in_analyser, c_out_analyser = compress_file(c_input_path, c_input_path + COMPRESSED_EXT, bytes_per_window,
+                                                          windows_per_frame, max(1, args.jobs), windows_per_checkpoint,
+                                                          args.block, args.verbose, args.digest, not args.rank_all,
+                                                          window_counts, stats, buffer_size, args.queue_depth,
+                                                          args.level, not args.value_order, dedupe_windows)
 
         if args.verbose:
-            print(f'Input:: MD5: {c_in_analyser.compute_md5_hex()}; Shannon entropy: {c_in_analyser.compute_shannon_entropy():0.6f}')
-            print(f'Output:: MD5: {c_out_analyser.compute_md5_hex()}; Shannon entropy: {c_out_analyser.compute_shannon_entropy():0.6f}')
-            print(f'Space saving: {100 * (1 - c_out_analyser.num_bytes / c_in_analyser.num_bytes):0.2f}%')
+            print_analysis('Input', c_in_analyser, log)
+            print_analysis('Output', c_out_analyser, log)
+            if c_in_analyser.num_bytes:
+                print(f'Space saving: {100 * (1 - c_out_analyser.num_bytes / c_in_analyser.num_bytes):0.2f}%', file=log)
+            print_window_counts(window_counts, log)
+            print_binomial_cache_stats(log)
+        if stats is not None:
+            write_stats(args.stats, stats, c_in_analyser, c_out_analyser, window_counts)
 
-        if not args.keep:
+        if not args.keep and not to_stdout:
             os.remove(c_input_path)
 
 
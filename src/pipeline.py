@@ -0,0 +1,277 @@
+import contextlib
+import io
+import queue
+import threading
+import time
+
+from stats import (STAGE_COMPUTE_BLOCKED_ON_INPUT, STAGE_COMPUTE_BLOCKED_ON_OUTPUT, STAGE_READER_BLOCKED,
+                   STAGE_READER_READ, STAGE_WRITER_BLOCKED, STAGE_WRITER_WRITE, Stats)
+
+DEFAULT_QUEUE_DEPTH = 4
+# How often (in seconds) a stage blocked on a queue checks whether the pipeline has been closed.
+POLL_SECONDS = 0.1
+# Marks the end of a queue.
+END = None
+
+
+class PipelinedReader(io.RawIOBase):
+    """
+    A readable binary stream fed by a reader thread, which reads chunks from an underlying stream into a bounded queue
+    ahead of the consumer, so that the latency of the underlying stream (a pipe, socket or network filesystem)
+    overlaps with computation. Chunks are consumed in the order they were read. Exceptions raised by the underlying
+    stream are re-raised by read.
+
+    Blocked time is added to the Stats, if any: 'reader_blocked' while the queue is full, 'reader_read' while reading
+    and 'compute_blocked_on_input' while the consumer waits for a chunk.
+    """
+
+    def __init__(self, fileobj, chunk_size: int, queue_depth: int = DEFAULT_QUEUE_DEPTH, stats: Stats = None):
+        """
+        :param fileobj: the binary stream to read from (left open).
+        :param chunk_size: the number of bytes per read of the underlying stream.
+        :param queue_depth: the maximum number of chunks read ahead.
+        :param stats: the Stats to add blocked times to, if any.
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.stats = stats
+        self.chunks = queue.Queue(max(1, queue_depth))
+        self.pending = memoryview(b'')
+        self.at_end = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='pipelined-reader', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Reads chunks until the end of the underlying stream (or an exception, which is queued in place of a chunk).
+        """
+        stats = self.stats
+        try:
+            while True:
+                if stats is not None:
+                    start = time.perf_counter()
+                chunk = self.fileobj.read(self.chunk_size)
+                if stats is not None:
+                    stats.time(STAGE_READER_READ, start)
+                if not self.put(chunk or END):
+                    return
+                if not chunk:
+                    return
+        except BaseException as e:
+            self.put(e)
+
+    def put(self, item) -> bool:
+        """
+        Queues an item, waiting while the queue is full.
+
+        :param item: the chunk, END or exception of interest.
+        :return: False if the pipeline was closed while waiting.
+        """
+        if self.stats is not None:
+            start = time.perf_counter()
+        while not self.stopping.is_set():
+            try:
+                self.chunks.put(item, timeout=POLL_SECONDS)
+                break
+            except queue.Full:
+                pass
+        if self.stats is not None:
+            self.stats.time(STAGE_READER_BLOCKED, start)
+        return not self.stopping.is_set()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        """
+        Reads up to len(buffer) bytes into the supplied buffer, from the next queued chunk.
+
+        :param buffer: the writable buffer of interest.
+        :return: the number of bytes read (0 at the end of the stream).
+        """
+        if not self.pending:
+            if self.at_end:
+                return 0
+            if self.stats is not None:
+                start = time.perf_counter()
+            item = self.chunks.get()
+            if self.stats is not None:
+                self.stats.time(STAGE_COMPUTE_BLOCKED_ON_INPUT, start)
+            if isinstance(item, BaseException):
+                self.at_end = True
+                raise item
+            if item is END:
+                self.at_end = True
+                return 0
+            self.pending = memoryview(item)
+        num_bytes = min(len(buffer), len(self.pending))
+        buffer[:num_bytes] = self.pending[:num_bytes]
+        self.pending = self.pending[num_bytes:]
+        return num_bytes
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads up to the supplied number of bytes, fewer only at the end of the stream (unlike a raw stream).
+
+        :param size: the number of bytes to read, or -1 to read to the end of the stream.
+        :return: the bytes read.
+        """
+        if size is None or size < 0:
+            return self.readall()
+        result = bytearray(size)
+        num_bytes = 0
+        with memoryview(result) as view:
+            while num_bytes < size:
+                num_read = self.readinto(view[num_bytes:])
+                if not num_read:
+                    break
+                num_bytes += num_read
+        del result[num_bytes:]
+        return bytes(result)
+
+    def close(self):
+        """
+        Stops the reader thread (without closing the underlying stream). If the stream was not read to its end, the
+        thread is not waited for, as it may be blocked reading the underlying stream; it exits once that read returns.
+        """
+        if self.closed:
+            return
+        self.stopping.set()
+        if self.at_end:
+            self.thread.join()
+        super().close()
+
+
+class PipelinedWriter(io.RawIOBase):
+    """
+    A writable binary stream drained by a writer thread, which writes queued chunks to an underlying stream in order,
+    so that the latency of the underlying stream overlaps with computation. Each write is copied, so the caller may
+    reuse its buffer at once. An exception raised by the underlying stream is re-raised by the next write, flush or
+    close.
+
+    Blocked time is added to the Stats, if any: 'compute_blocked_on_output' while the queue is full, 'writer_blocked'
+    while the writer waits for a chunk and 'writer_write' while it writes.
+    """
+
+    def __init__(self, fileobj, queue_depth: int = DEFAULT_QUEUE_DEPTH, stats: Stats = None):
+        """
+        :param fileobj: the binary stream to write to (left open, but flushed on close).
+        :param queue_depth: the maximum number of chunks queued.
+        :param stats: the Stats to add blocked times to, if any.
+        """
+        super().__init__()
+        self.fileobj = fileobj
+        self.stats = stats
+        self.chunks = queue.Queue(max(1, queue_depth))
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='pipelined-writer', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Writes queued chunks until END. After an exception, chunks are drained without being written, so the producer
+        never blocks.
+        """
+        stats = self.stats
+        while True:
+            if stats is not None:
+                start = time.perf_counter()
+            chunk = self.chunks.get()
+            if stats is not None:
+                start = stats.time(STAGE_WRITER_BLOCKED, start)
+            try:
+                if chunk is END:
+                    if self.error is None:
+                        self.fileobj.flush()
+                    return
+                if self.error is None:
+                    self.fileobj.write(chunk)
+                    if stats is not None:
+                        stats.time(STAGE_WRITER_WRITE, start)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.chunks.task_done()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        """
+        Queues a copy of the supplied bytes for writing, waiting while the queue is full.
+
+        :param data: the bytes (or bytes-like object) to write.
+        :return: the number of bytes queued, i.e., all of them.
+        """
+        self.raise_error()
+        chunk = bytes(data)
+        if not chunk:
+            return 0
+        if self.stats is not None:
+            start = time.perf_counter()
+        self.chunks.put(chunk)
+        if self.stats is not None:
+            self.stats.time(STAGE_COMPUTE_BLOCKED_ON_OUTPUT, start)
+        return len(chunk)
+
+    def flush(self):
+        """
+        Waits until every queued chunk is written, then flushes the underlying stream.
+        """
+        if self.closed:
+            return
+        self.chunks.join()
+        self.raise_error()
+        self.fileobj.flush()
+
+    def close(self):
+        """
+        Writes every queued chunk, flushes the underlying stream and stops the writer thread (without closing the
+        underlying stream).
+        """
+        if self.closed:
+            return
+        try:
+            self.chunks.put(END)
+            self.thread.join()
+            self.raise_error()
+        finally:
+            super().close()
+
+    def raise_error(self):
+        """
+        Re-raises the exception of the underlying stream, if any.
+        """
+        if self.error is not None:
+            raise self.error
+
+
+def pipelined_input(fileobj, chunk_size: int, queue_depth: int = DEFAULT_QUEUE_DEPTH, stats: Stats = None):
+    """
+    Reads a binary stream through a reader thread, unless the queue depth is 0.
+
+    :param fileobj: the binary stream of interest (left open).
+    :param chunk_size: the number of bytes per read of the stream.
+    :param queue_depth: the maximum number of chunks read ahead (0 to read the stream directly).
+    :param stats: the Stats to add blocked times to, if any.
+    :return: a context manager for the (pipelined) stream.
+    """
+    if queue_depth <= 0:
+        return contextlib.nullcontext(fileobj)
+    return PipelinedReader(fileobj, chunk_size, queue_depth, stats)
+
+
+def pipelined_output(fileobj, queue_depth: int = DEFAULT_QUEUE_DEPTH, stats: Stats = None):
+    """
+    Writes a binary stream through a writer thread, unless the queue depth is 0.
+
+    :param fileobj: the binary stream of interest (left open, but flushed on exit).
+    :param queue_depth: the maximum number of chunks queued (0 to write the stream directly).
+    :param stats: the Stats to add blocked times to, if any.
+    :return: a context manager for the (pipelined) stream.
+    """
+    if queue_depth <= 0:
+        return contextlib.nullcontext(fileobj)
+    return PipelinedWriter(fileobj, queue_depth, stats)
@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+
+import util
+from window_compressor import WindowCompressor
+
+# The most thorough level of adaptive segmentation.
+MAX_LEVEL = 6
+# The smallest window length considered by adaptive segmentation.
+MIN_WINDOW_SIZE = 16
+
+
+def candidate_sizes(window_size: int, level: int) -> list:
+    """
+    Gets the window lengths considered by adaptive segmentation at the supplied level: the window size and up to level
+    successive halvings of it, as long as each divides the window size and is at least MIN_WINDOW_SIZE.
+
+    :param window_size: the (largest) number of bytes per window.
+    :param level: the level of interest (0 for fixed windows).
+    :return: the candidate lengths, in ascending order.
+    """
+    sizes = [window_size]
+    for shift in range(1, level + 1):
+        size = window_size >> shift
+        if size < MIN_WINDOW_SIZE or window_size % size:
+            break
+        sizes.append(size)
+    return sorted(sizes)
+
+
+def window_lengths(compressor: WindowCompressor, input_bytes: bytes, existence_index_set: set,
+                   level: int = 0) -> list:
+    """
+    Splits a run of bytes into windows, choosing each window's length from the candidate sizes of the level so as to
+    minimise the estimated size of the window records. Window sizes are estimated from byte counts alone, with
+    WindowCompressor.estimate_window_bits, so no window is ranked. The estimates are minimised over every segmentation
+    into candidate sizes by dynamic programming on a grid of the smallest size, taking the existence state of each
+    window to be that of the best segmentation up to its start. The search costs O(level * n / smallest size)
+    estimates, so each level roughly doubles the effort of the last.
+
+    Where the run is a whole number of (largest) windows, its last window is always a whole one, so the existence state
+    after the run is that of its last window_size bytes whatever the level.
+
+    :param compressor: the compressor of the windows.
+    :param input_bytes: the bytes of interest.
+    :param existence_index_set: the existence index set from the window preceding the run (left unmodified).
+    :param level: the level of effort (0 for fixed windows of the compressor's window size).
+    :return: the lengths of the windows, in order.
+    """
+    window_size = compressor.window_size
+    num_bytes = len(input_bytes)
+    sizes = candidate_sizes(window_size, level)
+    if len(sizes) == 1 or num_bytes <= sizes[0]:
+        return [min(window_size, num_bytes - start) for start in range(0, num_bytes, window_size)]
+    last_whole = num_bytes >= window_size and not num_bytes % window_size
+    span = num_bytes - window_size if last_whole else num_bytes
+    if not span:
+        return [window_size]
+
+    grid = sizes[0]
+    window = np.frombuffer(input_bytes, dtype=np.uint8, count=span)
+    num_cells = -(-span // grid)
+    cells = np.repeat(np.arange(num_cells) << 8, grid)[:span] + window
+    cumulative_counts = np.zeros((num_cells + 1, 256), dtype=np.int64)
+    np.cumsum(np.bincount(cells, minlength=num_cells << 8).reshape(num_cells, 256), axis=0,
+              out=cumulative_counts[1:])
+    points = [min(span, i * grid) for i in range(num_cells + 1)]
+
+    costs = [0] + [math.inf] * num_cells
+    previous = [0] * (num_cells + 1)
+    existence_sets = [set(existence_index_set)] + [None] * num_cells
+    for j in range(1, num_cells + 1):
+        starts = [j - size // grid for size in sizes if size // grid <= j]
+        if j == num_cells and span % grid:
+            starts = range(max(0, j - window_size // grid), j)  # the final window may have any length
+        for i in starts:
+            if costs[i] + 8 >= costs[j]:
+                continue
+            byte_counts = cumulative_counts[j] - cumulative_counts[i]
+            byte_vals = np.flatnonzero(byte_counts).tolist()
+            num_bits = compressor.estimate_window_bits(byte_counts, byte_vals, existence_sets[i])
+            num_bits += 8 * len(util.encode_varint(-(-num_bits // 8)))  # the record length
+            if costs[i] + num_bits < costs[j]:
+                costs[j] = costs[i] + num_bits
+                previous[j] = i
+                existence_sets[j] = set(byte_vals)
+
+    lengths = [window_size] if last_whole else []
+    j = num_cells
+    while j:
+        lengths.append(points[j] - points[previous[j]])
+        j = previous[j]
+    lengths.reverse()
+    return lengths
@@ -0,0 +1,101 @@
+import json
+import time
+from collections import Counter, defaultdict
+
+# Stages of compression, in pipeline order.
+STAGE_READ = 'read'
+STAGE_ANALYSIS = 'analysis'
+STAGE_SEGMENTATION = 'segmentation'
+STAGE_BUCKETING = 'bucketing'
+STAGE_SPECIAL = 'special'
+STAGE_REDUCTION = 'reduction'
+STAGE_RANKING = 'ranking'
+STAGE_PACKING = 'packing'
+STAGE_WRITE = 'write'
+# Stages of decompression only.
+STAGE_UNPACKING = 'unpacking'
+STAGE_UNRANKING = 'unranking'
+STAGE_REHYDRATION = 'rehydration'
+# Stages of the pipelined drivers, each timed by a single thread: the reader and writer threads, and the compute
+# thread between them (whose own 'write' time then only covers queueing).
+STAGE_READER_READ = 'reader_read'
+STAGE_READER_BLOCKED = 'reader_blocked'
+STAGE_COMPUTE_BLOCKED_ON_INPUT = 'compute_blocked_on_input'
+STAGE_COMPUTE_BLOCKED_ON_OUTPUT = 'compute_blocked_on_output'
+STAGE_WRITER_BLOCKED = 'writer_blocked'
+STAGE_WRITER_WRITE = 'writer_write'
+
+
+class Stats:
+    """
+    Cumulative time per stage, counters and histograms of a compression or decompression job. Instrumented code takes
+    an optional Stats and skips all timing if it is None, so instrumentation costs nothing when disabled. Time spent in
+    worker processes is summed over the workers, so stage times can exceed the wall-clock time of the job.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = Counter()
+        self.histograms = defaultdict(Counter)
+
+    def time(self, stage: str, start: float) -> float:
+        """
+        Adds the time elapsed since the supplied start to a stage.
+
+        :param stage: the stage of interest.
+        :param start: the time.perf_counter() value at the start of the stage.
+        :return: the time.perf_counter() value at the end of the stage, i.e., the start of the next.
+        """
+        now = time.perf_counter()
+        self.seconds[stage] += now - start
+        return now
+
+    def count(self, name: str, num: int = 1):
+        """
+        Increments a counter.
+
+        :param name: the name of the counter.
+        :param num: the increment.
+        """
+        self.counts[name] += num
+
+    def observe(self, name: str, value: int):
+        """
+        Adds a non-negative value to a histogram of power-of-two buckets, keyed by the bit length of the value. So bucket
+        b holds values in [2^(b-1), 2^b), and bucket 0 holds zeros.
+
+        :param name: the name of the histogram.
+        :param value: the value of interest.
+        """
+        self.histograms[name][int(value).bit_length()] += 1
+
+    def merge(self, other: 'Stats'):
+        """
+        Adds the times, counters and histograms of another Stats (e.g., from a worker process) to these.
+
+        :param other: the Stats of interest.
+        """
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] += seconds
+        self.counts.update(other.counts)
+        for name, histogram in other.histograms.items():
+            self.histograms[name].update(histogram)
+
+    def to_dict(self) -> dict:
+        """
+        Gets the times, counters and histograms as plain dictionaries.
+
+        :return: a dictionary with the seconds per stage, the counters and the histograms (by bucket).
+        """
+        return {'seconds': dict(self.seconds), 'counts': dict(self.counts),
+                'histograms': {name: dict(sorted(histogram.items())) for name, histogram in self.histograms.items()}}
+
+    def write(self, path: str, extra: dict = None):
+        """
+        Writes the times, counters and histograms to a file as JSON.
+
+        :param path: the path of the file to write.
+        :param extra: further entries to include, if any.
+        """
+        with open(path, 'w') as outfile:
+            json.dump({**self.to_dict(), **(extra or {})}, outfile, indent=2)
@@ -1,13 +1,16 @@
 import math
+import time
 
 import gmpy2
 from bitarray import bitarray
 from bitarray import util as ba_util
 
 from bytes_analyser import BytesAnalyser
+from stats import STAGE_ANALYSIS, STAGE_READ, STAGE_WRITE
 
 NUM_BYTES_FOR_PERSISTED_PARAMETERS = 2
 MAX_PERSISTABLE_PARAMETER_VAL = (1 << (NUM_BYTES_FOR_PERSISTED_PARAMETERS * 8)) - 1
+LN_2 = math.log(2)
 
 
 def write_val(_outfile, _analyser: BytesAnalyser, _val: int):
@@ -21,16 +24,24 @@ def write_val(_outfile, _analyser: BytesAnalyser, _val: int):
     write_bytes(_outfile, _analyser, _val.to_bytes(NUM_BYTES_FOR_PERSISTED_PARAMETERS, 'big'))
 
 
-def write_bytes(_outfile, _analyser: BytesAnalyser, _bytes: bytes):
+def write_bytes(_outfile, _analyser: BytesAnalyser, _bytes: bytes, _stats=None):
     """
     Write the supplied bytes to the specified output file.
 
     :param _outfile: the output file to write to.
     :param _analyser: the bytes analyser to update.
     :param _bytes: the bytes to write.
+    :param _stats: the Stats to add the write and analysis times to, if any.
     """
+    if _stats is None:
+        _outfile.write(_bytes)
+        _analyser.update(_bytes)
+        return
+    _start = time.perf_counter()
     _outfile.write(_bytes)
+    _start = _stats.time(STAGE_WRITE, _start)
     _analyser.update(_bytes)
+    _stats.time(STAGE_ANALYSIS, _start)
 
 
 def read_val(_infile, _analyser: BytesAnalyser) -> int:
@@ -45,17 +56,91 @@ def read_val(_infile, _analyser: BytesAnalyser) -> int:
     return int.from_bytes(_result, 'big')
 
 
-def read_bytes(_infile, _bytes_analyser: BytesAnalyser, _num_bytes_to_read: int) -> bytes:
+def encode_varint(_val: int) -> bytes:
+    """
+    Encode the supplied non-negative integer value as a variable-length integer: 7 bits per byte, least significant
+    group first, with the high bit of each byte set if more bytes follow (unsigned LEB128).
+
+    :param _val: the non-negative integer value to encode.
+    :return: the encoded bytes.
+    """
+    _result = bytearray()
+    while _val > 0x7f:
+        _result.append((_val & 0x7f) | 0x80)
+        _val >>= 7
+    _result.append(_val)
+    return bytes(_result)
+
+
+def decode_varint(_buffer: bytes, _start: int) -> (int, int):
+    """
+    Decode a variable-length integer from the supplied buffer.
+
+    :param _buffer: the buffer of interest.
+    :param _start: the offset of the variable-length integer within the buffer.
+    :return: the decoded value and the offset just past it.
+    :raises ValueError: if the buffer ends within the variable-length integer.
+    """
+    _result = 0
+    _shift = 0
+    for _finish in range(_start, len(_buffer)):
+        _byte = _buffer[_finish]
+        _result |= (_byte & 0x7f) << _shift
+        if not _byte & 0x80:
+            return _result, _finish + 1
+        _shift += 7
+    raise ValueError('Truncated variable-length integer!')
+
+
+def write_varint(_outfile, _analyser: BytesAnalyser, _val: int):
+    """
+    Write the supplied non-negative integer value to the specified output file as a variable-length integer.
+
+    :param _outfile: the output file to write to.
+    :param _analyser: the bytes analyser to update.
+    :param _val: the non-negative integer value to write.
+    """
+    write_bytes(_outfile, _analyser, encode_varint(_val))
+
+
+def read_varint(_infile, _analyser: BytesAnalyser) -> int:
+    """
+    Read a variable-length integer from the specified input file.
+
+    :param _infile: the input file to read from.
+    :param _analyser: the bytes analyser to update.
+    :return: the integer value read from the input file.
+    :raises ValueError: if the input file ends within the variable-length integer.
+    """
+    _encoded = bytearray()
+    while True:
+        _byte = read_bytes(_infile, _analyser, 1)
+        if not _byte:
+            raise ValueError('Truncated variable-length integer!')
+        _encoded += _byte
+        if not _byte[0] & 0x80:
+            return decode_varint(_encoded, 0)[0]
+
+
+def read_bytes(_infile, _bytes_analyser: BytesAnalyser, _num_bytes_to_read: int, _stats=None) -> bytes:
     """
     Read bytes from the specified input file.
 
     :param _infile: the input file to read from.
     :param _bytes_analyser: the bytes analyser to update.
     :param _num_bytes_to_read: the number of bytes to read.
+    :param _stats: the Stats to add the read and analysis times to, if any.
     :return: the bytes read from the input file.
     """
+    if _stats is None:
+        _result = _infile.read(_num_bytes_to_read)
+        _bytes_analyser.update(_result)
+        return _result
+    _start = time.perf_counter()
     _result = _infile.read(_num_bytes_to_read)
+    _start = _stats.time(STAGE_READ, _start)
     _bytes_analyser.update(_result)
+    _stats.time(STAGE_ANALYSIS, _start)
     return _result
 
 
@@ -73,6 +158,40 @@ def num_bits_required_to_represent(value: int) -> int:
     return 1 if value == 0 else value.bit_length()
 
 
+def natural_log(value: int) -> float:
+    """
+    Computes the natural logarithm of the supplied positive integer, which may be too large to convert to a float.
+
+    :param value: the positive integer value of interest.
+    :return: the natural logarithm of the supplied value.
+    """
+    shift = max(0, value.bit_length() - 64)
+    return math.log(int(value >> shift)) + shift * LN_2
+
+
+def log_binomial(n: float, k: int) -> float:
+    """
+    Approximates the natural logarithm of the binomial coefficient (N, k) with the log-gamma function. N need not be an
+    integer.
+
+    :param n: the N parameter of interest.
+    :param k: the k parameter of interest.
+    :return: the approximate natural logarithm of (N, k).
+    """
+    return math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+
+
+def num_bits_for_index(num_values: int) -> int:
+    """
+    Computes the number of bits of an index into a list of the supplied number of values, which is 0 for a list of one
+    value (or none).
+
+    :param num_values: the number of values of interest.
+    :return: the number of bits of an index.
+    """
+    return (num_values - 1).bit_length() if num_values > 1 else 0
+
+
 def get_index_set(bitset: bitarray) -> list:
     """
     Gets the index set of the supplied bitarray object. (A list of positions of "on" bits of the bitarray.)
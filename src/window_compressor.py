@@ -1,23 +1,100 @@
+import math
+import time
+
 import gmpy2
-from bitarray import bitarray
+import numpy as np
 
+import block_ranking
+import dedupe
 import util
+import window_kinds
+from binomial import Binomial, shared_binomial
+from bit_stream import BitWriter
+from stats import STAGE_BUCKETING, STAGE_PACKING, STAGE_RANKING, STAGE_REDUCTION, STAGE_SPECIAL, Stats
+
+# Number of positions below which compression indices are always computed term by term rather than by recursive
+# splitting. Above it, splitting pays from SPLIT_K_PER_ROOT_N * sqrt(N) positions, as the cost of the terms grows with
+# k and that of the products of positions with N / k (see benchmarks/ranking.py).
+MIN_SPLIT_K = 512
+SPLIT_K_PER_ROOT_N = 10
+# Number of consecutive terms combined with native integers at the leaves of the recursive split.
+SPLIT_LEAF_SIZE = 16
+
+
+def min_split_k(num_bits: int) -> int:
+    """
+    Gets the number of positions from which the compression index of a bitset is computed by recursive splitting.
+
+    :param num_bits: the length of the bitset.
+    :return: the least number of positions that is ranked by splitting.
+    """
+    return max(MIN_SPLIT_K, SPLIT_K_PER_ROOT_N * math.isqrt(num_bits))
 
 
 def index_set_to_compression_index(index_set: list) -> gmpy2.xmpz:
     """
-    Compute a compression index for the index set of a bitarray.
+    Compute a compression index for the index set of a bitarray. Each term (p(b,j), j) is needed once per bitset and
+    seldom recurs, so the terms are computed with gmpy2.bincoef rather than looked up in a binomial coefficient cache.
     :param index_set: the index set of interest.
     :return: a compression index for the supplied index set.
     """
+    if len(index_set) >= MIN_SPLIT_K and len(index_set) >= min_split_k(index_set[-1] + 1):
+        return index_set_to_compression_index_split(index_set)
+    bincoef = gmpy2.bincoef
     compression_index = gmpy2.xmpz()
     for j, position in enumerate(index_set, 1):
-        compression_index += gmpy2.bincoef(position, j)
+        compression_index += bincoef(position, j)
     # Slightly slower:
     # compression_index = sum(gmpy2.bincoef(position, j) for j, position in enumerate(index_set, 1))
     return compression_index
 
 
+def index_set_to_compression_index_split(index_set: list) -> gmpy2.mpz:
+    """
+    Compute a compression index for the index set of a bitarray by binary splitting. Consecutive terms of the sum are
+    related by T(j+1) = T(j) * P(j) / Q(j), where, for positions p = p(b,j) and q = p(b,j+1),
+    P(j) = (p+1)...q and Q(j) = (j+1) * (p-j+1)...(q-j-1). Adjacent runs of terms are merged pairwise as
+    (P1 * P2, Q1 * Q2, T1 * Q2 + P1 * T2), so the work is dominated by a logarithmic number of levels of balanced
+    bignum multiplications rather than by k separate binomial coefficients. Only the first non-zero term is computed
+    from scratch.
+
+    :param index_set: the index set of interest.
+    :return: a compression index for the supplied index set.
+    """
+    k = len(index_set)
+    j = 0
+    while j < k and index_set[j] == j:  # (j, j+1) = 0 for the lowest positions
+        j += 1
+    if j == k:
+        return gmpy2.mpz()
+    first = gmpy2.bincoef(index_set[j], j + 1)
+    if j == k - 1:
+        return first
+
+    prod = math.prod
+    nodes = []
+    for start in range(j, k - 1, SPLIT_LEAF_SIZE):
+        p_run = q_run = 1
+        t_run = 0
+        for m in range(min(start + SPLIT_LEAF_SIZE, k - 1) - 1, start - 1, -1):
+            p = index_set[m]
+            q = index_set[m + 1]
+            p_m = prod(range(p + 1, q + 1))
+            q_m = prod(range(p - m, q - m - 1)) * (m + 2)
+            t_run = q_m * q_run + p_m * t_run if t_run else q_m
+            p_run *= p_m
+            q_run *= q_m
+        nodes.append((gmpy2.mpz(p_run), gmpy2.mpz(q_run), gmpy2.mpz(t_run)))
+    while len(nodes) > 1:
+        merged = [(p_1 * p_2, q_1 * q_2, t_1 * q_2 + p_1 * t_2)
+                  for (p_1, q_1, t_1), (p_2, q_2, t_2) in zip(nodes[::2], nodes[1::2])]
+        if len(nodes) & 1:
+            merged.append(nodes[-1])
+        nodes = merged
+    p_all, q_all, t_all = nodes[0]
+    return gmpy2.divexact(first * (t_all + p_all), q_all)
+
+
 def index_set_to_compression_index_alternative(index_set: list) -> gmpy2.xmpz:
     """
     Compute a compression index for the index set of a bitarray. No calls to gmpy2.bincoef, instead falling factorials.
@@ -36,72 +113,259 @@ def index_set_to_compression_index_alternative(index_set: list) -> gmpy2.xmpz:
     return compression_index // denom
 
 
+def reduced_index_sets(window: np.ndarray, byte_vals: list) -> list:
+    """
+    Computes the reduced index sets of the supplied byte values, in ascending order of byte value. The reduced index set
+    of a byte value holds the positions of that value within the window after the positions of all smaller byte values
+    have been removed. Bytes not yet claimed are kept as one array that shrinks as each byte value claims its positions,
+    so each byte value costs a single vectorised comparison over the bytes that remain rather than operations on
+    full-length bitsets.
+
+    :param window: the bytes of the window.
+    :param byte_vals: the byte values of interest, in ascending order.
+    :return: a list of index sets, one per byte value.
+    """
+    index_sets = []
+    unclaimed = window
+    for b in byte_vals:
+        claimed = unclaimed == b
+        index_sets.append(np.flatnonzero(claimed).tolist())
+        unclaimed = unclaimed[~claimed]
+    return index_sets
+
+
 class WindowCompressor:
     """
     A compressor for a window of arbitrary bytes.
     """
 
-    def __init__(self, num_bytes_for_uncompressed_window: int):
+    def __init__(self, num_bytes_for_uncompressed_window: int, binomial: Binomial = None, block_bits: int = 0,
+                 special_windows: bool = False, densest_last: bool = False, stats: Stats = None):
         self.window_size = num_bytes_for_uncompressed_window
+        self.binomial = binomial if binomial is not None else shared_binomial
+        self.block_bits = block_bits  # 0 to rank each bitset as a whole; otherwise the number of bits per block
+        self.special_windows = special_windows  # whether windows may take special encodings (see window_kinds)
+        # whether the most frequent byte value, rather than the greatest, is emitted last (so inferred, not ranked)
+        self.densest_last = densest_last
+        # log2(n!) for 0 <= n <= window size, from which the widths of ranks are estimated in bulk (built on first use).
+        self.log2_factorials = None
+        self.stats = stats  # None to skip instrumentation
+
+    def emission_order(self, byte_counts: np.ndarray, byte_vals: list) -> (list, int):
+        """
+        Gets the order in which the bitsets of the byte values present in a window are emitted. The last is inferred
+        rather than ranked. In ascending order of byte value by default; with densest_last, the most frequent byte value
+        (the costliest to rank) is moved to the end, and its index among the present byte values is recorded in the
+        window.
+
+        :param byte_counts: the number of occurrences of each byte value in the window.
+        :param byte_vals: the byte values present in the window, in ascending order.
+        :return: the byte values in emission order, and the index of the last among byte_vals (None if not recorded).
+        """
+        if not self.densest_last or len(byte_vals) < 2:
+            return byte_vals, None
+        densest = int(np.argmax(byte_counts[byte_vals]))
+        return byte_vals[:densest] + byte_vals[densest + 1:] + [byte_vals[densest]], densest
+
+    def estimate_num_bits(self, byte_counts: np.ndarray, byte_vals: list, existence_index_set: set) -> int:
+        """
+        Estimates the number of bits of a ranked window from its byte counts alone, before any ranking. Every field has a
+        width that follows from the counts; only the widths of the ranks, log2 (N, k), are approximated, all at once from
+        a table of log2(n!) rather than from bignum binomial coefficients. With block ranking the estimate is that of
+        whole bitsets, which block ranking never beats.
+
+        :param byte_counts: the number of occurrences of each byte value in the window.
+        :param byte_vals: the byte values present in the window, in ascending order.
+        :param existence_index_set: the existence index set from the previous window.
+        :return: the estimated number of bits.
+        """
+        if self.log2_factorials is None:
+            self.log2_factorials = np.concatenate(([0.0], np.cumsum(np.log2(np.arange(1, self.window_size + 1)))))
+        num_bytes = int(byte_counts.sum())
+        num_bits = 2 if num_bytes == self.window_size else 2 + util.num_bits_required_to_represent(self.window_size)
+        existence_count = len(existence_index_set.symmetric_difference(byte_vals))
+        num_bits += 9 + util.num_bits_required_to_represent(gmpy2.bincoef(256, existence_count))
+        ordered_vals, densest = self.emission_order(byte_counts, byte_vals)
+        k_vals = byte_counts[ordered_vals[:-1]]
+        if densest is None:
+            num_bits_for_k = util.num_bits_required_to_represent(int(byte_counts.max()) if num_bytes else 0)
+        else:
+            num_bits += util.num_bits_for_index(len(byte_vals))
+            num_bits_for_k = util.num_bits_required_to_represent(int(k_vals.max()))
+        num_bits += util.num_bits_required_to_represent(num_bytes)
+        n_payloads = num_bytes - np.cumsum(k_vals) + k_vals
+        log2_binomials = self.log2_factorials[n_payloads] - self.log2_factorials[k_vals] - \
+            self.log2_factorials[n_payloads - k_vals]
+        return num_bits + len(k_vals) * (num_bits_for_k + 1) + int(np.floor(log2_binomials).sum())
+
+    def estimate_window_bits(self, byte_counts: np.ndarray, byte_vals: list, existence_index_set: set) -> int:
+        """
+        Estimates the number of bits of a compressed window from its byte counts alone, taking the encoding that process
+        would choose: a run, a small alphabet, stored or ranked (as estimated by estimate_num_bits).
+
+        :param byte_counts: the number of occurrences of each byte value in the window.
+        :param byte_vals: the byte values present in the window, in ascending order.
+        :param existence_index_set: the existence index set from the previous window.
+        :return: the estimated number of bits.
+        """
+        num_bytes = int(byte_counts.sum())
+        if self.special_windows and len(byte_vals) == 1:
+            return 8 * len(window_kinds.encode_run(num_bytes, byte_vals[0]))
+        estimated_num_bits = self.estimate_num_bits(byte_counts, byte_vals, existence_index_set)
+        if not self.special_windows:
+            return estimated_num_bits - 1  # no leading bit to tell special windows apart
+        if len(byte_vals) <= window_kinds.MAX_SMALL_ALPHABET_SIZE:
+            estimated_num_bits = min(estimated_num_bits,
+                                     8 * window_kinds.small_alphabet_size(num_bytes, len(byte_vals)))
+        return min(estimated_num_bits, 8 * (1 + num_bytes))
 
     def process(self, input_bytes: bytes, existence_index_set: set) -> bytes:
         """
-        Compresses the supplied bytes.
+        Compresses the supplied bytes. If special windows are enabled, a window of a single byte value is encoded as a
+        run (or zero) window, and a window of a few byte values as a small-alphabet window if that is no larger than
+        the estimated size of ranking it. A window that ranking would not make smaller, whether by estimate or in fact,
+        is stored raw.
 
         :param input_bytes: the bytes of interest.
         :param existence_index_set: the existence index set from the previous window.
         :return: the compressed bytes.
         """
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+            stats.count('windows')
         num_bytes = len(input_bytes)
         num_bits_for_num_bytes = util.num_bits_required_to_represent(num_bytes)
 
+        window = np.frombuffer(input_bytes, dtype=np.uint8)
+        byte_counts = np.bincount(window, minlength=256)
+        byte_vals = np.flatnonzero(byte_counts).tolist()
+        if stats is not None:
+            start = stats.time(STAGE_BUCKETING, start)
+        if self.special_windows:
+            payload = None
+            if len(byte_vals) == 1:
+                payload = window_kinds.encode_run(num_bytes, byte_vals[0])
+            else:
+                estimated_num_bits = self.estimate_num_bits(byte_counts, byte_vals, existence_index_set)
+                if len(byte_vals) <= window_kinds.MAX_SMALL_ALPHABET_SIZE and \
+                        8 * window_kinds.small_alphabet_size(num_bytes, len(byte_vals)) <= estimated_num_bits:
+                    payload = window_kinds.encode_small_alphabet(window, byte_vals)
+                elif estimated_num_bits >= 8 * num_bytes:
+                    payload = window_kinds.encode_stored(input_bytes)
+            if stats is not None:
+                start = stats.time(STAGE_SPECIAL, start)
+            if payload is not None:
+                if stats is not None:
+                    stats.count('special_windows')
+                return self.special(payload, byte_vals, existence_index_set)
+
+        result = BitWriter()
+        if self.special_windows:
+            result.write_bit(0)
         if num_bytes == self.window_size:
-            result = bitarray('1')
+            result.write_bit(1)
         else:
-            result = bitarray('0') + util.int_to_bitarray(num_bytes, util.num_bits_required_to_represent(self.window_size))
-
-        byte_positions = [[] for _ in range(256)]
-        for position, b in enumerate(input_bytes):
-            byte_positions[b].append(position)
-
-        existence_index_list = list(existence_index_set)
-        max_byte_count = 0
-        index_sets = []
-        to_remove = util.empty_bitarray(num_bytes)
-        for b, positions in enumerate(byte_positions):
-            if positions:
-                if b in existence_index_set:
-                    existence_index_list.remove(b)
-                else:
-                    existence_index_list.append(b)
-                existence_index_set.add(b)
-                max_byte_count = util.fast_max(max_byte_count, len(positions))
-                bitset = util.empty_bitarray(num_bytes)
-                bitset[positions] = 1
-                to_remove2 = to_remove | bitset
-                del bitset[to_remove]
-                to_remove = to_remove2
-                index_sets.append(util.get_index_set(bitset))
-            else:
-                existence_index_set.discard(b)
+            result.write_bit(0)
+            result.write(num_bytes, util.num_bits_required_to_represent(self.window_size))
+
+        ordered_vals, densest = self.emission_order(byte_counts, byte_vals)
+        if densest is None:
+            max_byte_count = int(byte_counts.max()) if num_bytes else 0
+        else:
+            max_byte_count = int(byte_counts[ordered_vals[:-1]].max())
+        index_sets = reduced_index_sets(window, ordered_vals[:-1])  # last element can be handled by inference
+
+        existence_index_list = sorted(existence_index_set.symmetric_difference(byte_vals))
+        existence_index_set.clear()
+        existence_index_set.update(byte_vals)
+        if stats is not None:
+            start = stats.time(STAGE_REDUCTION, start)
 
         existence_index_list.sort()
         existence_count = len(existence_index_list)
         max_compression_index_bits = util.num_bits_required_to_represent(gmpy2.bincoef(256, existence_count))
         existence_compression_index = index_set_to_compression_index(existence_index_list)
+        if stats is not None:
+            start = stats.time(STAGE_RANKING, start)
         # 9 bits to cover the inclusive range [0, 256] for existence_bitarray_count
-        result.extend(util.int_to_bitstring(existence_count, 9) +
-                      util.int_to_bitstring(existence_compression_index, max_compression_index_bits))
+        result.write(existence_count, 9)
+        result.write(existence_compression_index, max_compression_index_bits)
+        if densest is not None:
+            result.write(densest, util.num_bits_for_index(len(byte_vals)))
 
         num_bits_for_k = util.num_bits_required_to_represent(max_byte_count)
-        num_bits_for_k_bitstring = util.int_to_bitstring(num_bits_for_k, num_bits_for_num_bytes)
-        result.extend(num_bits_for_k_bitstring)
+        result.write(num_bits_for_k, num_bits_for_num_bytes)
+        if stats is not None:
+            start = stats.time(STAGE_PACKING, start)
 
         n_payload = num_bytes
-        for index_set in index_sets[:-1]:  # last element can be handled by inference
-            compression_index = index_set_to_compression_index(index_set)
+        for index_set in index_sets:
             k = len(index_set)
-            max_payload_bits = util.num_bits_required_to_represent(gmpy2.bincoef(n_payload, k))
-            result.extend(util.int_to_bitstring(k, num_bits_for_k) + util.int_to_bitstring(compression_index, max_payload_bits))
+            result.write(k, num_bits_for_k)
+            if self.block_bits:
+                num_bits_before = len(result)
+                block_ranking.write_blocks(result, index_set, n_payload, self.block_bits)
+                if stats is not None:
+                    start = self.observe(stats, k, len(result) - num_bits_before, start)
+            else:
+                compression_index = index_set_to_compression_index(index_set)
+                max_payload_bits = util.num_bits_required_to_represent(self.binomial.get(n_payload, k))
+                if stats is not None:
+                    start = self.observe(stats, k, max_payload_bits, start)
+                result.write(compression_index, max_payload_bits)
+                if stats is not None:
+                    start = stats.time(STAGE_PACKING, start)
             n_payload -= k
+        if self.special_windows and len(result) >= 8 * num_bytes:
+            if stats is not None:
+                stats.count('stored_after_ranking')
+            return window_kinds.encode_stored(input_bytes)  # the existence state is already up to date
         return result.tobytes()
+
+    @staticmethod
+    def observe(stats: Stats, k: int, num_rank_bits: int, start: float) -> float:
+        """
+        Records the ranking of a bitset: its population count, the width of its rank (or blocks) and the time taken.
+
+        :param stats: the Stats to update.
+        :param k: the population count of the bitset.
+        :param num_rank_bits: the number of bits of the rank (or blocks).
+        :param start: the time.perf_counter() value at the start of the ranking.
+        :return: the time.perf_counter() value at the end of the ranking.
+        """
+        stats.count('bitsets')
+        stats.count('rank_bits', num_rank_bits)
+        stats.observe('k', k)
+        stats.observe('rank_bits', num_rank_bits)
+        return stats.time(STAGE_RANKING, start)
+
+    def reference(self, input_bytes: bytes, distance: int, existence_index_set: set) -> bytes:
+        """
+        Encodes a window as a back-reference to an earlier window with the same bytes (see dedupe.WindowIndex), leaving
+        the existence state as a ranked window would.
+
+        :param input_bytes: the bytes of interest.
+        :param distance: the distance back to the earlier window, in windows.
+        :param existence_index_set: the existence index set from the previous window.
+        :return: the encoded back-reference.
+        """
+        if self.stats is not None:
+            self.stats.count('windows')
+            self.stats.count('references')
+        return self.special(window_kinds.encode_reference(distance), dedupe.byte_values(input_bytes),
+                            existence_index_set)
+
+    @staticmethod
+    def special(payload: bytes, byte_vals: list, existence_index_set: set) -> bytes:
+        """
+        Passes on a special window, leaving the existence state as a ranked window would.
+
+        :param payload: the encoded special window.
+        :param byte_vals: the byte values present in the window, in ascending order.
+        :param existence_index_set: the existence index set from the previous window.
+        :return: the encoded special window.
+        """
+        existence_index_set.clear()
+        existence_index_set.update(byte_vals)
+        return payload
@@ -1,64 +1,122 @@
+import math
+import time
+
 import gmpy2
+import numpy as np
 from bitarray import bitarray
 
+import block_ranking
+import dedupe
 import util
+import window_kinds
+from binomial import Binomial, shared_binomial
+from bit_stream import BitReader
+from stats import STAGE_REHYDRATION, STAGE_SPECIAL, STAGE_UNPACKING, STAGE_UNRANKING, Stats
+
+# Number of downward steps taken through the binomial coefficients before estimating the position instead.
+MAX_LINEAR_STEPS = 8
+# Number of refining Newton steps (in floating point) when estimating a position.
+MAX_NEWTON_STEPS = 4
 
 
-def compression_index_to_bitarray(index: int, k_val: int, num_bits: int) -> bitarray:
+def compression_index_to_bitarray(index: int, k_val: int, num_bits: int, binomial: Binomial = None) -> bitarray:
     """
     Converts the supplied compression index to a decompressed bitarray.
 
     :param index: the index value of interest.
     :param k_val: the k parameter of interest.
     :param num_bits: the number of bits for the resultant bitarray.
+    :param binomial: the binomial coefficient cache to consult for the first coefficient, if any (see
+    compression_index_to_index_set).
     :return: the decompressed index as a bitarray.
     """
     result = util.empty_bitarray(num_bits)
-
-    if k_val == 1:
-        result[index] = 1
-        return result
-
-    target = index
-    start = num_bits - 1
-    for i in range(k_val, 0, -1):
-        for j in range(start, -1, -1):
-            if (b := gmpy2.bincoef(j, i)) <= target:
-                result[j] = 1
-                start = j - 1
-                target -= b
-                break
+    result[compression_index_to_index_set(index, k_val, num_bits, binomial)] = 1
     return result
 
 
-def compression_index_to_bitarray_experimental(index: int, k_val: int, num_bits: int) -> bitarray:
+def compression_index_to_index_set(index: int, k_val: int, num_bits: int, binomial: Binomial = None) -> list:
     """
-    Converts the supplied compression index to a decompressed bitarray. Uses a generator for binomial coefficients.
+    Converts the supplied compression index to the index set of the decompressed bitset. Each position p(b,i) is the
+    largest j for which (j, i) <= target. Only one binomial coefficient is computed from scratch; its neighbours are
+    derived with the multiplicative recurrences (j-1, i) = (j, i) * (j-i) / j and (j-1, i-1) = (j, i) * i / j. Small
+    gaps between positions are walked; larger gaps are jumped with Newton steps on ln (j, i), followed by a short exact
+    correction.
 
     :param index: the index value of interest.
     :param k_val: the k parameter of interest.
-    :param num_bits: the number of bits for the resultant bitarray.
-    :return: the decompressed index as a bitarray.
+    :param num_bits: the number of bits of the decompressed bitset.
+    :param binomial: the binomial coefficient cache to consult for the first coefficient (N-1, k), which recurs across
+    bitsets of the same N and k, if any. The coefficients after jumps seldom recur, so they come from gmpy2.bincoef.
+    :return: the positions of the "on" bits of the decompressed bitset, in descending order.
+    :raises ValueError: if the compression index is not a valid rank of k_val positions among num_bits (e.g., it is
+    corrupt or truncated).
     """
-    result = util.empty_bitarray(num_bits)
-
-    if k_val == 1:
-        result[index] = 1
+    result = []
+    if not k_val:
         return result
+    if k_val > num_bits:
+        raise ValueError('corrupt rank')
 
-    target = index
-    start = num_bits - 1
-    for i in range(k_val, 0, -1):
-        j_plus_1 = start + 1
-        b = int(gmpy2.bincoef(j_plus_1, i))
-        for j in range(start, -1, -1):
-            if (b := ((j_plus_1-i) * b) // j_plus_1) <= target:
-                result[j] = 1
-                start = j - 1
-                target -= b
-                break
-            j_plus_1 = j
-    return result
+    target = gmpy2.mpz(index)
+    i = k_val
+    j = num_bits - 1
+    b = binomial.get(j, i) if binomial is not None else gmpy2.bincoef(j, i)
+    while True:
+        if not target:
+            result.extend(range(i - 1, -1, -1))  # (j, i) > 0 for all j >= i, so the remaining positions must be the lowest
+            return result
+        if i == 1:
+            if target > j:
+                raise ValueError('corrupt rank')
+            result.append(int(target))
+            return result
+        num_steps = 0
+        while b > target:
+            # A valid rank always leaves (j, i) <= target for some j >= i, so no step divides by zero.
+            if j <= i:
+                raise ValueError('corrupt rank')
+            if num_steps == MAX_LINEAR_STEPS:
+                j = estimate_position(b, target, i, j)
+                b = gmpy2.bincoef(j, i)
+                while (b_next := gmpy2.divexact(b * (j + 1), j + 1 - i)) <= target:
+                    b = b_next
+                    j += 1
+            else:
+                b = gmpy2.divexact(b * (j - i), j)
+                j -= 1
+            num_steps += 1
+        if j < i:
+            raise ValueError('corrupt rank')
+        result.append(j)
+        target -= b
+        b = gmpy2.divexact(b * i, j)
+        i -= 1
+        j -= 1
+
+
+def estimate_position(b: int, target: int, i: int, j: int) -> int:
+    """
+    Estimates the largest position x <= j for which (x, i) <= target, given b = (j, i) > target. Since ln (x, i) is
+    concave in x, a Newton step from the right using the backward difference ln(j / (j-i)) never overshoots the
+    position, and Newton steps from the left using the forward difference approach it from below.
+
+    :param b: the binomial coefficient (j, i).
+    :param target: the target value of interest.
+    :param i: the i parameter of interest.
+    :param j: the position from which to step.
+    :return: an estimate of the position, no less than i.
+    """
+    log_target = util.natural_log(target)
+    x = j - (util.natural_log(b) - log_target) / math.log(j / (j - i))
+    for _ in range(MAX_NEWTON_STEPS):
+        if x <= i:
+            return i
+        step = (log_target - util.log_binomial(x, i)) / math.log((x + 1) / (x + 1 - i))
+        x += step
+        if step < 1:
+            break
+    return max(i, int(x))
 
 
 class WindowDecompressor:
@@ -66,8 +124,32 @@ class WindowDecompressor:
     A decompressor for a window of compressed bytes.
     """
 
-    def __init__(self, num_bytes_for_uncompressed_window: int):
+    def __init__(self, num_bytes_for_uncompressed_window: int, binomial: Binomial = None, block_bits: int = 0,
+                 special_windows: bool = False, densest_last: bool = False, dedupe_windows: int = 0,
+                 stats: Stats = None):
         self.window_size = num_bytes_for_uncompressed_window
+        self.binomial = binomial if binomial is not None else shared_binomial
+        self.block_bits = block_bits  # 0 if each bitset was ranked as a whole; otherwise the number of bits per block
+        self.special_windows = special_windows  # whether windows may take special encodings (see window_kinds)
+        # whether each window records which byte value is emitted last (see WindowCompressor.emission_order)
+        self.densest_last = densest_last
+        # the recent windows that back-references copy (see dedupe), or None if there are no back-references
+        self.cache = dedupe.WindowCache(dedupe_windows) if dedupe_windows else None
+        self.stats = stats  # None to skip instrumentation
+
+    def window_length(self, input_bytes: bytes) -> int:
+        """
+        Gets the number of bytes of a compressed window from its leading fields, without decompressing it.
+
+        :param input_bytes: the compressed window.
+        :return: the number of bytes of the window.
+        """
+        input_bits = BitReader(input_bytes)
+        if self.special_windows and input_bits.read_bit():
+            return window_kinds.window_length(input_bytes)
+        if input_bits.read_bit():
+            return self.window_size
+        return input_bits.read(util.num_bits_required_to_represent(self.window_size))
 
     def process(self, input_bytes: bytes, existence_bitarray: bitarray) -> bytes:
         """
@@ -77,117 +159,132 @@ class WindowDecompressor:
         :param existence_bitarray: the existence bitarray from the previous window.
         :return: the decompressed bytes.
         """
-        input_bits = bitarray()
-        input_bits.frombytes(input_bytes)
+        result = bytearray(self.window_size)
+        del result[self.process_into(input_bytes, existence_bitarray, result):]
+        return result
+
+    def process_into(self, input_bytes: bytes, existence_bitarray: bitarray, out) -> int:
+        """
+        Decompresses the supplied bytes straight into a caller-supplied buffer, without an intermediate copy.
+
+        :param input_bytes: the bytes of interest.
+        :param existence_bitarray: the existence bitarray from the previous window.
+        :param out: the writable buffer (bytearray, memoryview, mmap, ...) to write the window to, from its start.
+        :return: the number of decompressed bytes written.
+        :raises ValueError: if the buffer is too small for the window, or the window is corrupt.
+        """
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+            stats.count('windows')
+        input_bits = BitReader(input_bytes)
+        if self.special_windows and input_bits.read_bit():
+            num_window_bytes = self.process_special(input_bytes, existence_bitarray, out)
+            if stats is not None:
+                stats.count('special_windows')
+                stats.time(STAGE_SPECIAL, start)
+            return num_window_bytes
 
-        start = 0
-        finish = 1
-        if util.bitarray_to_int(input_bits[start:finish]):
+        if input_bits.read_bit():
             num_window_bytes = self.window_size
         else:
-            start = finish
-            finish += util.num_bits_required_to_represent(self.window_size)
-            num_window_bytes = util.bitarray_to_int(input_bits[start:finish])
+            num_window_bytes = input_bits.read(util.num_bits_required_to_represent(self.window_size))
+        if len(out) < num_window_bytes:
+            raise ValueError('Output buffer too small!')
         num_bits_for_max_k = util.num_bits_required_to_represent(num_window_bytes)
 
-        start = finish
-        finish += 9  # 9 bits to cover the inclusive range [0, 256]
-        existence_bitarray_count = util.bitarray_to_int(input_bits[start:finish])
-
-        start = finish
-        finish += util.num_bits_required_to_represent(gmpy2.bincoef(256, existence_bitarray_count))
-        existence_bitarray_compression_index = util.bitarray_to_int(input_bits[start:finish])
-        existence_bitarray ^= compression_index_to_bitarray(existence_bitarray_compression_index, existence_bitarray_count, 256)
+        existence_bitarray_count = input_bits.read(9)  # 9 bits to cover the inclusive range [0, 256]
+        existence_bitarray_compression_index = input_bits.read(
+            util.num_bits_required_to_represent(gmpy2.bincoef(256, existence_bitarray_count)))
+        if stats is not None:
+            start = stats.time(STAGE_UNPACKING, start)
+        existence_bitarray ^= compression_index_to_bitarray(existence_bitarray_compression_index, existence_bitarray_count, 256,
+                                                          self.binomial)
         existence_bitarray_count = existence_bitarray.count(1)
+        if stats is not None:
+            start = stats.time(STAGE_UNRANKING, start)
+        byte_vals = list(util.get_index_set(existence_bitarray))
+        if self.densest_last and existence_bitarray_count > 1:
+            densest = input_bits.read(util.num_bits_for_index(existence_bitarray_count))
+            if densest >= existence_bitarray_count:
+                raise ValueError('Invalid densest byte value index!')
+            byte_vals.append(byte_vals.pop(densest))
 
-        start = finish
-        finish += num_bits_for_max_k
-        num_bits_for_each_k_val = util.bitarray_to_int(input_bits[start:finish])
+        num_bits_for_each_k_val = input_bits.read(num_bits_for_max_k)
 
-        byte_bitsets = []
+        byte_index_sets = []
         k_cum = 0
 
         counter = 1
-        for byte_val in util.get_index_set(existence_bitarray):
+        for byte_val in byte_vals:
             if counter < existence_bitarray_count:
-                # read k
-                start = finish
-                finish += num_bits_for_each_k_val
-                k = util.bitarray_to_int(input_bits[start:finish])
-                max_payload_bits = util.num_bits_required_to_represent(gmpy2.bincoef(num_window_bytes - k_cum, k))
-                # read compression index
-                start = finish
-                finish += max_payload_bits
-                compression_index = util.bitarray_to_int(input_bits[start:finish])
-                result = compression_index_to_bitarray(compression_index, k, num_window_bytes - k_cum)
-                byte_bitsets.append((byte_val, result))
+                k = input_bits.read(num_bits_for_each_k_val)
+                if k > num_window_bytes - k_cum:
+                    raise ValueError('corrupt window')  # more positions than are left unoccupied
+                if self.block_bits:
+                    index_set = block_ranking.read_blocks(input_bits, num_window_bytes - k_cum, k, self.block_bits)
+                else:
+                    max_payload_bits = util.num_bits_required_to_represent(self.binomial.get(num_window_bytes - k_cum, k))
+                    compression_index = input_bits.read(max_payload_bits)
+                    if stats is not None:
+                        start = stats.time(STAGE_UNPACKING, start)
+                    index_set = compression_index_to_index_set(compression_index, k, num_window_bytes - k_cum,
+                                                               self.binomial)
+                if stats is not None:
+                    stats.count('bitsets')
+                    start = stats.time(STAGE_UNRANKING, start)
+                byte_index_sets.append((byte_val, index_set))
                 k_cum += k
             else:
                 # final part can be inferred
-                k_last = num_window_bytes - k_cum
-                result = bitarray(k_last)
-                result.setall(1)
-                byte_bitsets.append((byte_val, result))
-                k_cum += k_last
+                if k_cum >= num_window_bytes:
+                    raise ValueError('corrupt window')  # no positions are left for the final byte value
+                byte_index_sets.append((byte_val, None))
+                k_cum = num_window_bytes
             counter += 1
-        assert k_cum == num_window_bytes
-
-        # Original::
-        #occupied_positions = util.empty_bitarray(num_window_bytes)
-        #rehydrated_bytes = bytearray(num_window_bytes)
-        #for byte_val, bitset in byte_bitsets:
-        #    inner_i = 0
-        #    for outer_i in range(num_window_bytes):
-        #        if occupied_positions[outer_i]:
-        #            continue
-        #        if bitset[inner_i]:
-        #            rehydrated_bytes[outer_i] = byte_val
-        #            occupied_positions[outer_i] = 1
-        #        inner_i += 1
-
-        # Alternative 1 (fastest)::
-        unoccupied_positions = util.full_bitarray(num_window_bytes)
-        rehydrated_bytes = bytearray(num_window_bytes)
-        for byte_val, bitset in byte_bitsets:
-            bitset_count = bitset.count(1)
-            num_byte_assignments = 0
-            for inner_i, outer_i in enumerate(util.get_index_set(unoccupied_positions)):
-                if bitset[inner_i]:
-                    num_byte_assignments += 1
-                    rehydrated_bytes[outer_i] = byte_val
-                    unoccupied_positions[outer_i] = 0
-                    if num_byte_assignments == bitset_count:
-                        break
-
-        # Alternative 2 (fast)::
-        #occupied_positions = util.empty_bitarray(num_window_bytes)
-        #rehydrated_bytes = bytearray(num_window_bytes)
-        #for byte_val, bitset in byte_bitsets:
-        #    for inner_i, outer_i in enumerate(util.get_index_set(~occupied_positions)):
-        #        if bitset[inner_i]:
-        #            rehydrated_bytes[outer_i] = byte_val
-        #            occupied_positions[outer_i] = 1
-
-
-        # Alternative 3 (slowest)::
-        #prev_bitset = util.empty_bitarray(num_window_bytes)
-        #rehydrated_bytes = bytearray(num_window_bytes)
-        #for byte_val, bitset in byte_bitsets:
-        #    for i in util.get_index_set(prev_bitset):
-        #        bitset.insert(i, 0)
-        #    for i in util.get_index_set(bitset):
-        #        rehydrated_bytes[i] = byte_val
-        #    prev_bitset |= bitset
-
-
-        # Alternative 4 (slow)::
-        #prev_index_set = []
-        #rehydrated_bytes = bytearray(num_window_bytes)
-        #for byte_val, bitset in byte_bitsets:
-        #    for i in prev_index_set:
-        #        bitset.insert(i, 0)
-        #    for i in util.get_index_set(bitset):
-        #        rehydrated_bytes[i] = byte_val
-        #        bisect.insort(prev_index_set, i)
-
-        return rehydrated_bytes
+        if k_cum != num_window_bytes:
+            raise ValueError('corrupt window')  # no byte values at all
+
+        # Vectorised (fastest): each index set holds positions among the positions still unoccupied, so it selects
+        # absolute positions from them in bulk; the byte value is then scattered to those positions in one assignment.
+        unoccupied_positions = np.arange(num_window_bytes)
+        rehydrated_bytes = np.frombuffer(out, dtype=np.uint8, count=num_window_bytes)
+        for byte_val, index_set in byte_index_sets:
+            if index_set is None:
+                rehydrated_bytes[unoccupied_positions] = byte_val
+                break
+            rehydrated_bytes[unoccupied_positions[index_set]] = byte_val
+            unoccupied_positions = np.delete(unoccupied_positions, index_set)
+        if self.cache is not None:
+            self.cache.add(out[:num_window_bytes])
+        if stats is not None:
+            stats.time(STAGE_REHYDRATION, start)
+        return num_window_bytes
+
+    def process_special(self, input_bytes: bytes, existence_bitarray: bitarray, out) -> int:
+        """
+        Decodes a special window (stored, run, zero, small alphabet or back-reference) straight into the buffer with
+        bulk copies and fills, updating the existence state as a ranked window would.
+
+        :param input_bytes: the special window.
+        :param existence_bitarray: the existence bitarray from the previous window.
+        :param out: the writable buffer to write the window to, from its start.
+        :return: the number of bytes written.
+        :raises ValueError: if the buffer is too small for the window, or a back-reference is invalid.
+        """
+        if window_kinds.is_reference(input_bytes):
+            if self.cache is None:
+                raise ValueError('Back-reference without back-references enabled!')
+            window = self.cache.get(window_kinds.decode_reference(input_bytes))
+            num_window_bytes = len(window)
+            window_kinds.output_array(out, num_window_bytes)[:] = np.frombuffer(window, dtype=np.uint8)
+            byte_vals = dedupe.byte_values(window)
+            if self.stats is not None:
+                self.stats.count('references')
+        else:
+            num_window_bytes, byte_vals = window_kinds.decode(input_bytes, out)
+            if self.cache is not None:
+                self.cache.add(out[:num_window_bytes])
+        existence_bitarray.setall(0)
+        existence_bitarray[byte_vals] = 1
+        return num_window_bytes
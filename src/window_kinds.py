@@ -0,0 +1,199 @@
+import numpy as np
+
+import util
+
+# Special window encodings. When they are enabled, the leading bit of every window is set if the window is not ranked;
+# the rest of its first byte is then its kind, and the encoding of the kind follows from the next byte boundary. Each
+# is decoded with bulk copies and fills rather than by unranking.
+KIND_STORED = 0  # the raw bytes
+KIND_RUN = 1  # a single byte value: the value, then the number of bytes
+KIND_ZERO = 2  # all zero bytes: the number of bytes
+KIND_SMALL_ALPHABET = 3  # a few byte values: their number, the values, the number of bytes, then packed symbol indices
+KIND_REFERENCE = 4  # a copy of an earlier window (see dedupe): the distance back to it, in windows
+KIND_NAMES = {KIND_STORED: 'stored', KIND_RUN: 'run', KIND_ZERO: 'zero', KIND_SMALL_ALPHABET: 'small alphabet',
+              KIND_REFERENCE: 'reference'}
+RANKED = 'ranked'
+SPECIAL_WINDOW_BIT = 0x80
+
+# The largest number of distinct byte values of a small-alphabet window (so at most 2 bits per symbol).
+MAX_SMALL_ALPHABET_SIZE = 4
+
+
+def marker(kind: int) -> bytes:
+    """
+    Gets the first byte of a special window of the supplied kind.
+
+    :param kind: the kind of interest.
+    :return: the first byte.
+    """
+    return bytes([SPECIAL_WINDOW_BIT | kind])
+
+
+def kind_name(payload: bytes, special_windows: bool) -> str:
+    """
+    Gets the name of the encoding of a compressed window, for reporting.
+
+    :param payload: the compressed window.
+    :param special_windows: whether special window encodings are enabled.
+    :return: the name of the encoding, e.g., 'ranked' or 'run'.
+    """
+    if special_windows and payload and payload[0] & SPECIAL_WINDOW_BIT:
+        return KIND_NAMES.get(payload[0] & ~SPECIAL_WINDOW_BIT, 'unknown')
+    return RANKED
+
+
+def bits_per_symbol(alphabet_size: int) -> int:
+    """
+    Gets the number of bits per symbol index of a small-alphabet window.
+
+    :param alphabet_size: the number of distinct byte values.
+    :return: the number of bits per symbol index.
+    """
+    return (alphabet_size - 1).bit_length()
+
+
+def small_alphabet_size(num_bytes: int, alphabet_size: int) -> int:
+    """
+    Computes the number of bytes of a small-alphabet window.
+
+    :param num_bytes: the number of bytes of the window.
+    :param alphabet_size: the number of distinct byte values.
+    :return: the number of bytes of the encoding.
+    """
+    return 2 + alphabet_size + len(util.encode_varint(num_bytes)) + -(-num_bytes * bits_per_symbol(alphabet_size) // 8)
+
+
+def encode_stored(input_bytes: bytes) -> bytes:
+    """
+    Encodes a stored window.
+
+    :param input_bytes: the bytes of the window.
+    :return: the encoded window.
+    """
+    return marker(KIND_STORED) + input_bytes
+
+
+def encode_run(num_bytes: int, byte_val: int) -> bytes:
+    """
+    Encodes a window of a single byte value, as a zero window if the value is zero.
+
+    :param num_bytes: the number of bytes of the window.
+    :param byte_val: the byte value.
+    :return: the encoded window.
+    """
+    if not byte_val:
+        return marker(KIND_ZERO) + util.encode_varint(num_bytes)
+    return marker(KIND_RUN) + bytes([byte_val]) + util.encode_varint(num_bytes)
+
+
+def encode_small_alphabet(window: np.ndarray, byte_vals: list) -> bytes:
+    """
+    Encodes a window of a few distinct byte values as fixed-width indices into the list of values.
+
+    :param window: the bytes of the window.
+    :param byte_vals: the byte values present in the window, in ascending order.
+    :return: the encoded window.
+    """
+    width = bits_per_symbol(len(byte_vals))
+    symbols = np.searchsorted(np.array(byte_vals, dtype=np.uint8), window).astype(np.uint8)
+    bits = np.unpackbits(symbols[:, np.newaxis], axis=1)[:, 8 - width:]
+    return marker(KIND_SMALL_ALPHABET) + bytes([len(byte_vals), *byte_vals]) + util.encode_varint(len(window)) + \
+        np.packbits(bits).tobytes()
+
+
+def encode_reference(distance: int) -> bytes:
+    """
+    Encodes a back-reference to an earlier window.
+
+    :param distance: the distance back to the window, in windows.
+    :return: the encoded window.
+    """
+    return marker(KIND_REFERENCE) + util.encode_varint(distance)
+
+
+def is_reference(payload: bytes) -> bool:
+    """
+    Determines whether a special window is a back-reference.
+
+    :param payload: the encoded window.
+    :return: True if the window is a back-reference.
+    """
+    return payload[0] & ~SPECIAL_WINDOW_BIT == KIND_REFERENCE
+
+
+def decode_reference(payload: bytes) -> int:
+    """
+    Decodes a back-reference to an earlier window.
+
+    :param payload: the encoded window.
+    :return: the distance back to the window, in windows.
+    """
+    return util.decode_varint(payload, 1)[0]
+
+
+def decode(payload: bytes, out) -> (int, list):
+    """
+    Decodes a special window straight into a buffer.
+
+    :param payload: the encoded window.
+    :param out: the writable buffer to write the window to, from its start.
+    :return: the number of bytes written and the byte values present in the window (in ascending order).
+    :raises ValueError: if the buffer is too small for the window or the kind is unknown (back-references are resolved
+    by the decompressor instead).
+    """
+    payload = memoryview(payload)
+    kind = payload[0] & ~SPECIAL_WINDOW_BIT
+    if kind == KIND_STORED:
+        raw_bytes = payload[1:]
+        num_bytes = len(raw_bytes)
+        window = output_array(out, num_bytes)
+        window[:] = np.frombuffer(raw_bytes, dtype=np.uint8)
+        return num_bytes, np.flatnonzero(np.bincount(window, minlength=256)).tolist()
+    if kind == KIND_RUN or kind == KIND_ZERO:
+        byte_val, start = (payload[1], 2) if kind == KIND_RUN else (0, 1)
+        num_bytes, _ = util.decode_varint(payload, start)
+        output_array(out, num_bytes).fill(byte_val)
+        return num_bytes, [byte_val] if num_bytes else []
+    if kind == KIND_SMALL_ALPHABET:
+        alphabet_size = payload[1]
+        byte_vals = np.frombuffer(payload[2:2 + alphabet_size], dtype=np.uint8)
+        num_bytes, start = util.decode_varint(payload, 2 + alphabet_size)
+        width = bits_per_symbol(alphabet_size)
+        bits = np.unpackbits(np.frombuffer(payload[start:], dtype=np.uint8), count=num_bytes * width)
+        symbols = bits if width == 1 else (bits[0::2] << 1) | bits[1::2]
+        np.take(byte_vals, symbols, out=output_array(out, num_bytes))
+        return num_bytes, byte_vals.tolist()
+    raise ValueError(f'Unknown window kind: {kind}')
+
+
+def window_length(payload: bytes) -> int:
+    """
+    Gets the number of bytes of a special window without decoding it.
+
+    :param payload: the encoded window.
+    :return: the number of bytes of the window.
+    :raises ValueError: if the kind is unknown or the window is a back-reference (whose length is that of the window it
+    refers to).
+    """
+    kind = payload[0] & ~SPECIAL_WINDOW_BIT
+    if kind == KIND_STORED:
+        return len(payload) - 1
+    if kind == KIND_RUN or kind == KIND_ZERO:
+        return util.decode_varint(payload, 2 if kind == KIND_RUN else 1)[0]
+    if kind == KIND_SMALL_ALPHABET:
+        return util.decode_varint(payload, 2 + payload[1])[0]
+    raise ValueError(f'Unknown window kind: {kind}')
+
+
+def output_array(out, num_bytes: int) -> np.ndarray:
+    """
+    Views the start of a buffer as an array of bytes.
+
+    :param out: the writable buffer of interest.
+    :param num_bytes: the number of bytes required.
+    :return: the array.
+    :raises ValueError: if the buffer is too small.
+    """
+    if len(out) < num_bytes:
+        raise ValueError('Output buffer too small!')
+    return np.frombuffer(out, dtype=np.uint8, count=num_bytes)
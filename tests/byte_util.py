@@ -21,3 +21,12 @@ def random_sparse_bytes(n: int) -> bytearray:
         if random.randint(1, 10) > 7:
             result[i] = random.randint(0, 255)
     return result
+
+
+def skewed_bytes(n: int, alphabet_size: int) -> bytes:
+    # Zipf-like byte frequencies over the first alphabet_size values, so the alphabet is skewed as in real data.
+    return bytes(random.choices(range(alphabet_size), k=n, weights=[1 / (rank + 1) for rank in range(alphabet_size)]))
+
+
+def random_index_set(num_bits: int, k: int) -> list:
+    return sorted(random.sample(range(num_bits), k))
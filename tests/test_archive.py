@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+import archive
+import byte_util
+import codec
+
+
+def make_tree(root) -> dict:
+    contents = {
+        'tree/a.bin': bytes(byte_util.random_sparse_bytes(5000)),
+        'tree/empty': b'',
+        'tree/sub/b.txt': b'hello, world\n' * 300,
+        'tree/sub/deeper/c.bin': os.urandom(1500),
+    }
+    for name, data in contents.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return contents
+
+
+def test_member_names():
+    assert archive.member_name('/abs/path/file') == 'abs/path/file'
+    assert archive.member_name('./dir//x/../file') == 'dir/file'
+    assert archive.member_name('../../up/file') == 'up/file'
+    for name in ('', '/etc/passwd', 'a/../../b', 'a//b'):
+        with pytest.raises(ValueError):
+            archive.extraction_path('out', name)
+    assert archive.extraction_path('out', 'a/b') == os.path.join('out', 'a', 'b')
+
+
+def test_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    contents = make_tree(tmp_path)
+    members = archive.member_paths(['tree', 'tree/a.bin'])
+    assert [name for name, _ in members] == sorted(contents)
+    archives = {}
+    for jobs in (1, 3):
+        archive_path = tmp_path / f'archive_{jobs}'
+        member_table = archive.create_archive(archive_path, members, jobs, {'window_size': 1000,
+                                                                            'windows_per_checkpoint': 2})
+        assert member_table.names == archive.read_members(archive_path).names
+        archives[jobs] = archive_path.read_bytes()
+        output_dir = tmp_path / f'extracted_{jobs}'
+        extracted = archive.extract_archive(archive_path, output_dir, jobs=jobs)
+        assert extracted.uncompressed_sizes == [len(contents[name]) for name in extracted.names]
+        for name, data in contents.items():
+            assert (output_dir / name).read_bytes() == data
+            assert archive.read_member(archive_path, name) == data
+    assert archives[1] == archives[3]
+    member_table = archive.read_members(tmp_path / 'archive_1')
+    i = member_table.find('tree/sub/b.txt')
+    start = member_table.compressed_offsets[i]
+    assert codec.decompress(archives[1][start:start + member_table.compressed_sizes[i]]) == contents['tree/sub/b.txt']
+
+
+def test_extract_named_members(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    contents = make_tree(tmp_path)
+    archive_path = tmp_path / 'archive'
+    archive.create_archive(archive_path, archive.member_paths(['tree']))
+    extracted = archive.extract_archive(archive_path, tmp_path / 'out', ['tree/sub/b.txt', 'tree/empty'], jobs=2)
+    assert extracted.names == ['tree/sub/b.txt', 'tree/empty']
+    assert (tmp_path / 'out/tree/sub/b.txt').read_bytes() == contents['tree/sub/b.txt']
+    assert not (tmp_path / 'out/tree/a.bin').exists()
+    with pytest.raises(KeyError):
+        archive.extract_archive(archive_path, tmp_path / 'out', ['missing'])
+
+
+def test_corrupt_archives(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_tree(tmp_path)
+    archive_path = tmp_path / 'archive'
+    archive.create_archive(archive_path, archive.member_paths(['tree']))
+    archive_bytes = archive_path.read_bytes()
+    (tmp_path / 'truncated').write_bytes(archive_bytes[:-20])
+    (tmp_path / 'not_archive').write_bytes(codec.compress(b'abc'))
+    for path in (tmp_path / 'truncated', tmp_path / 'not_archive'):
+        with pytest.raises(ValueError):
+            archive.read_members(path)
+    with pytest.raises(FileNotFoundError):
+        archive.member_paths(['missing'])
+
+
+def test_member_name_collisions(tmp_path, monkeypatch):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'a/x').write_bytes(b'outer')
+    (tmp_path / 'work/a').mkdir(parents=True)
+    (tmp_path / 'work/a/x').write_bytes(b'inner')
+    monkeypatch.chdir(tmp_path / 'work')
+    assert archive.member_paths(['a/x', './a/x', 'a//x', 'a']) == [('a/x', 'a/x')]  # the same file, named thrice
+    with pytest.raises(ValueError):
+        archive.member_paths(['a/x', '../a/x'])  # different files, both named 'a/x'
+
+
+def test_progress_skips_empty_members(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    num_bytes = sum(len(data) for data in make_tree(tmp_path).values())
+    archive_path = tmp_path / 'archive'
+    steps = []
+    archive.create_archive(archive_path, archive.member_paths(['tree']), progress=steps.append)
+    assert 0 not in steps and sum(steps) == num_bytes
+    steps = []
+    archive.extract_archive(archive_path, tmp_path / 'out', progress=steps.append)
+    assert 0 not in steps and sum(steps) == num_bytes
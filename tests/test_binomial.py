@@ -5,7 +5,28 @@ from binomial import Binomial
 
 def test_get():
     max_n = 256
-    c = Binomial(max_n)
+    c = Binomial(min_cached_k=2)
     for n in range(0, max_n):
         for k in range(0, max_n):  # tests legitimate vals (k <= N) & illegitimate vals (k > N)
             assert c.get(n, k) == math.comb(n, k)
+    assert c.misses > 0
+    assert c.evictions == 0
+
+
+def test_get_cached():
+    c = Binomial(min_cached_k=2)
+    assert c.get(4096, 700) == math.comb(4096, 700)
+    assert c.get(4096, 701) == math.comb(4096, 701)  # derived from its neighbour
+    assert c.get(4096, 3396) == math.comb(4096, 700)  # symmetry
+    assert c.stats()['hits'] == 1
+    assert c.stats()['misses'] == 2
+    assert c.stats()['rows'] == 1
+
+
+def test_get_evicts_least_recently_used_row():
+    c = Binomial(max_cache_bytes=1024, min_cached_k=2)
+    for n in range(1000, 1010):
+        assert c.get(n, 400) == math.comb(n, 400)
+    assert c.evictions > 0
+    assert c.cache_bytes <= 1024 or c.stats()['rows'] == 1
+    assert 1009 in c.rows and 1000 not in c.rows
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+from bitarray import bitarray
+
+import util
+from bit_stream import BitReader, BitWriter
+
+
+def test_write_matches_bitstrings():
+    random.seed(74)
+    fields = [(random.getrandbits(width), width) for width in (1, 9, 0, 3, 64, 13, 4000, 7, 1)]
+    writer = BitWriter()
+    expected = bitarray()
+    for value, width in fields:
+        writer.write(value, width)
+        if width:
+            expected.extend(util.int_to_bitstring(value, width))
+    assert len(writer) == len(expected)
+    assert writer.tobytes() == expected.tobytes()
+
+
+def test_roundtrip():
+    random.seed(42)
+    fields = [(random.getrandbits(width), width) for width in (random.randint(0, 300) for _ in range(200))]
+    writer = BitWriter()
+    for value, width in fields:
+        writer.write(value, width)
+    reader = BitReader(writer.tobytes())
+    for value, width in fields:
+        assert reader.read(width) == value
+
+
+def test_read_bit():
+    reader = BitReader(bytes([0b10100000]))
+    assert [reader.read_bit() for _ in range(4)] == [1, 0, 1, 0]
+
+
+def test_read_truncated():
+    reader = BitReader(bytes(2))
+    reader.read(10)
+    with pytest.raises(ValueError):
+        reader.read(7)
@@ -0,0 +1,49 @@
+import math
+import random
+
+import pytest
+
+from bit_stream import BitReader, BitWriter
+from block_ranking import BINOMIALS, MAX_BLOCK_SIZE, read_blocks, write_blocks
+
+
+def test_binomials():
+    for n in range(MAX_BLOCK_SIZE + 1):
+        for k in range(MAX_BLOCK_SIZE + 1):
+            assert BINOMIALS[n][k] == math.comb(n, k)
+    assert max(max(row) for row in BINOMIALS) < 1 << 63
+
+
+def test_roundtrip():
+    random.seed(8)
+    for num_bits, k, block_bits in ((1, 1, 32), (100, 0, 32), (100, 100, 64), (1000, 37, 32), (4096, 700, 64),
+                                    (250, 249, 64)):
+        index_set = sorted(random.sample(range(num_bits), k))
+        writer = BitWriter()
+        write_blocks(writer, index_set, num_bits, block_bits)
+        writer.write(0b101, 3)  # a following field must be read back intact
+        reader = BitReader(writer.tobytes())
+        assert sorted(read_blocks(reader, num_bits, k, block_bits)) == index_set
+        assert reader.read(3) == 0b101
+
+
+def test_empty_blocks_are_cheap():
+    writer = BitWriter()
+    write_blocks(writer, [0], 4096, 32)  # one block count and rank; the rest is inferred
+    assert len(writer) == 1 + 5  # a 1-bit count, as only one position remains, and a rank in [0, 32)
+    assert read_blocks(BitReader(writer.tobytes()), 4096, 1, 32) == [0]
+
+
+def test_corrupt_blocks():
+    writer = BitWriter()
+    writer.write(33, 6)  # a block count beyond the 32 positions of the block
+    with pytest.raises(ValueError):
+        read_blocks(BitReader(writer.tobytes() + bytes(16)), 4096, 40, 32)
+    writer = BitWriter()
+    writer.write(1, 2)
+    writer.write(31, 5)  # a valid rank in [0, (32, 1)) ...
+    writer.write(31, 5)  # ... then one beyond [0, (31, 1)) in the final, shorter block
+    with pytest.raises(ValueError):
+        read_blocks(BitReader(writer.tobytes()), 63, 2, 32)
+    with pytest.raises(ValueError):
+        read_blocks(BitReader(bytes(16)), 40, 50, 32)  # more positions than bits
@@ -1,7 +1,10 @@
 import math
 import random
+import zlib
 
-from bytes_analyser import BytesAnalyser
+import pytest
+
+from bytes_analyser import BytesAnalyser, DIGEST_BLAKE2B, DIGEST_CRC32
 
 
 def test_compute_md5_hex_empty():
@@ -44,3 +47,32 @@ def test_compute_shannon_entropy_low():
     random.shuffle(vals)
     analyser.update(bytes(vals))
     assert math.isclose(analyser.compute_shannon_entropy(), 1.584962500721156)
+
+
+def test_compute_digest_hex_crc32():
+    analyser = BytesAnalyser(DIGEST_CRC32)
+    analyser.update(b'The quick brown fox ')
+    analyser.update(memoryview(b'jumps over the lazy dog'))
+    assert analyser.compute_digest_hex() == f'{zlib.crc32(b"The quick brown fox jumps over the lazy dog"):08x}'
+    assert len(analyser.compute_digest_bytes()) == 4
+
+
+def test_compute_digest_bytes_blake2b():
+    analyser = BytesAnalyser(DIGEST_BLAKE2B)
+    analyser.update(b'The quick brown fox jumps over the lazy dog')
+    assert len(analyser.compute_digest_bytes()) == 16
+    with pytest.raises(ValueError):
+        analyser.compute_md5_hex()
+
+
+def test_uncounted_bytes():
+    analyser = BytesAnalyser(count_bytes=False)
+    analyser.update(b'xxxx')
+    assert analyser.num_bytes == 4
+    with pytest.raises(ValueError):
+        analyser.compute_shannon_entropy()
+
+
+def test_unsupported_digest():
+    with pytest.raises(ValueError):
+        BytesAnalyser('sha1')
@@ -0,0 +1,116 @@
+import io
+import mmap
+
+import pytest
+
+import byte_util
+import main
+import codec
+from codec import BinomialReader, BinomialWriter
+
+
+class UnseekableStream(io.RawIOBase):
+    """
+    A stream that can only be read sequentially, in small pieces, like a pipe.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self.data.read(min(len(buffer), 100))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def compress(input_bytes: bytes, **kwargs) -> bytes:
+    outfile = io.BytesIO()
+    with BinomialWriter(outfile, 1000, **kwargs) as writer:
+        for start in range(0, len(input_bytes), 777):
+            writer.write(input_bytes[start:start + 777])
+    return outfile.getvalue()
+
+
+def test_writer_matches_compress_file(tmp_path):
+    input_path = tmp_path / 'input'
+    compressed_path = tmp_path / 'compressed'
+    input_bytes = bytes(byte_util.random_sparse_bytes(12345))
+    input_path.write_bytes(input_bytes)
+    main.compress_file(input_path, compressed_path, 1000, windows_per_frame=3, windows_per_checkpoint=2)
+    assert compress(input_bytes, windows_per_frame=3, windows_per_checkpoint=2) == compressed_path.read_bytes()
+    input_bytes = bytes(byte_util.random_sparse_bytes(150000)) + bytes(5000)
+    input_path.write_bytes(input_bytes)
+    main.compress_file(input_path, compressed_path, 1000, windows_per_checkpoint=5, level=2, jobs=2)
+    assert compress(input_bytes, windows_per_checkpoint=5, level=2) == compressed_path.read_bytes()
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'windows_per_checkpoint': 4}, {'block_bits': 64},
+                                    {'windows_per_checkpoint': 4, 'digest': 'crc32'},
+                                    {'windows_per_checkpoint': 4, 'level': 3}, {'densest_last': False},
+                                    {'windows_per_checkpoint': 4, 'dedupe_windows': 2}])
+def test_roundtrip(kwargs):
+    input_bytes = bytes(byte_util.random_sparse_bytes(30000))
+    input_bytes += input_bytes[:10000]
+    reader = BinomialReader(UnseekableStream(compress(input_bytes, **kwargs)))
+    chunks = []
+    while chunk := reader.read(500):
+        assert len(chunk) <= 500
+        chunks.append(chunk)
+    assert b''.join(chunks) == input_bytes
+    assert reader.read() == b''
+
+
+def test_empty_roundtrip():
+    assert BinomialReader(io.BytesIO(compress(b''))).read() == b''
+
+
+def test_corrupt_digest():
+    compressed_bytes = bytearray(compress(bytes(byte_util.random_sparse_bytes(5000))))
+    compressed_bytes[-1] ^= 1
+    with pytest.raises(ValueError):
+        BinomialReader(io.BytesIO(compressed_bytes)).read()
+
+
+def test_truncated():
+    compressed_bytes = compress(bytes(byte_util.random_sparse_bytes(5000)))
+    with pytest.raises(ValueError):
+        BinomialReader(io.BytesIO(compressed_bytes[:-20])).read()
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'windows_per_frame': 2, 'windows_per_checkpoint': 3}, {'block_bits': 32},
+                                    {'digest': 'blake2b'}, {'windows_per_checkpoint': 3, 'level': 2}])
+def test_one_shot_matches_writer(kwargs):
+    input_bytes = bytes(byte_util.random_sparse_bytes(12345))
+    compressed_bytes = codec.compress(memoryview(input_bytes), 1000, **kwargs)
+    assert compressed_bytes == compress(input_bytes, **kwargs)
+    assert codec.decompress(compressed_bytes) == input_bytes
+
+
+def test_one_shot_into_buffers():
+    input_bytes = bytes(byte_util.random_sparse_bytes(12345))
+    compressed_buffer = bytearray(len(input_bytes) + 100)
+    num_compressed_bytes = codec.compress_into(input_bytes, compressed_buffer)
+    assert compressed_buffer[:num_compressed_bytes] == codec.compress(input_bytes)
+    with mmap.mmap(-1, len(input_bytes)) as decompressed_buffer:
+        assert codec.decompress_into(memoryview(compressed_buffer)[:num_compressed_bytes],
+                                     decompressed_buffer) == len(input_bytes)
+        assert decompressed_buffer[:] == input_bytes
+    assert codec.decompress(codec.compress(b'')) == b''
+
+
+def test_one_shot_errors():
+    input_bytes = bytes(byte_util.random_sparse_bytes(5000))
+    compressed_bytes = codec.compress(input_bytes)
+    with pytest.raises(ValueError):
+        codec.compress_into(input_bytes, bytearray(100))
+    with pytest.raises(ValueError):
+        codec.decompress_into(compressed_bytes, bytearray(len(input_bytes) - 1))
+    with pytest.raises(ValueError):
+        codec.decompress(compressed_bytes[:-20])
+    corrupt_bytes = bytearray(compressed_bytes)
+    corrupt_bytes[-1] ^= 1
+    with pytest.raises(ValueError):
+        codec.decompress(corrupt_bytes)
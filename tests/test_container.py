@@ -0,0 +1,139 @@
+import io
+
+import pytest
+
+from bytes_analyser import BytesAnalyser
+from container import EXTENDED_MAGIC_BYTES, Header, MAGIC_BYTES, SeekIndex
+
+
+def roundtrip(header: Header) -> (bytes, Header):
+    outfile = io.BytesIO()
+    header.write(outfile, BytesAnalyser())
+    return outfile.getvalue(), Header.read(io.BytesIO(outfile.getvalue()), BytesAnalyser())
+
+
+def test_legacy_header():
+    persisted, header = roundtrip(Header(1024))
+    assert persisted == MAGIC_BYTES + b'\x04\x00'
+    assert header.window_size == 1024
+    assert header.windows_per_frame == 0
+    assert not header.is_frame_start(0)
+
+
+def test_framed_header():
+    persisted, header = roundtrip(Header(512, 16))
+    assert header.window_size == 512
+    assert header.windows_per_frame == 16
+    assert header.is_frame_start(0)
+    assert not header.is_frame_start(15)
+    assert header.is_frame_start(32)
+
+
+def test_blocked_header():
+    persisted, header = roundtrip(Header(1024, 0, 0, 64))
+    assert header.window_size == 1024
+    assert header.block_bits == 64
+
+
+def test_digest_header():
+    persisted, header = roundtrip(Header(1024, digest='crc32'))
+    assert persisted[:6] == EXTENDED_MAGIC_BYTES
+    assert header.digest == 'crc32'
+    assert header.digest_size == 4
+    _, header = roundtrip(Header(1024))
+    assert header.digest == 'md5'
+    assert header.digest_size == 16
+
+
+def test_special_windows_header():
+    persisted, header = roundtrip(Header(1024, special_windows=True))
+    assert persisted[:6] == EXTENDED_MAGIC_BYTES
+    assert header.special_windows
+    assert not roundtrip(Header(1 << 16))[1].special_windows
+
+
+def test_adaptive_windows_header():
+    persisted, header = roundtrip(Header(1024, adaptive_windows=True))
+    assert persisted[:6] == EXTENDED_MAGIC_BYTES
+    assert header.adaptive_windows
+    assert not roundtrip(Header(1024, special_windows=True))[1].adaptive_windows
+    with pytest.raises(ValueError):
+        Header(1024, windows_per_frame=4, adaptive_windows=True)
+
+
+def test_densest_last_header():
+    persisted, header = roundtrip(Header(1024, densest_last=True))
+    assert persisted[:6] == EXTENDED_MAGIC_BYTES
+    assert header.densest_last and not header.adaptive_windows
+    assert not roundtrip(Header(1024, special_windows=True))[1].densest_last
+
+
+def test_dedupe_header():
+    persisted, header = roundtrip(Header(1024, 8, 4, special_windows=True, dedupe_windows=300))
+    assert persisted[:6] == EXTENDED_MAGIC_BYTES
+    assert header.dedupe_windows == 300
+    assert header.is_dedupe_reset(0) and header.is_dedupe_reset(4) and header.is_dedupe_reset(8)
+    assert not header.is_dedupe_reset(6)
+    assert not roundtrip(Header(1024, 8, 4, special_windows=True))[1].is_dedupe_reset(0)
+    with pytest.raises(ValueError):
+        Header(1024, dedupe_windows=16)
+    with pytest.raises(ValueError):
+        Header(1024, special_windows=True, adaptive_windows=True, dedupe_windows=16)
+
+
+def test_unsupported_block_bits():
+    persisted, _ = roundtrip(Header(1024, 0, 0, 32))
+    with pytest.raises(ValueError):
+        Header.read(io.BytesIO(persisted[:-1] + b'\x30'), BytesAnalyser())
+
+
+def test_varint_header():
+    persisted, header = roundtrip(Header(1 << 20, 300))
+    assert persisted[6] == 2
+    assert header.window_size == 1 << 20
+    assert header.windows_per_frame == 300
+    assert header.varint_framing
+    assert header.record_extent(header.frame_record(bytes(200)), 0) == (2, 202)
+
+
+def test_fixed_width_header():
+    persisted = EXTENDED_MAGIC_BYTES + b'\x01' + b'\x04\x00' + b'\x00\x01' + b'\x00\x10'
+    header = Header.read(io.BytesIO(persisted), BytesAnalyser())
+    assert header.window_size == 1024
+    assert header.windows_per_frame == 16
+    assert not header.varint_framing
+    assert header.record_extent(header.frame_record(bytes(200)), 0) == (2, 202)
+
+
+def test_incorrect_format():
+    with pytest.raises(ValueError):
+        Header.read(io.BytesIO(b'gzip!!\x04\x00'), BytesAnalyser())
+
+
+def test_indexed_header():
+    persisted, header = roundtrip(Header(256, 0, 8))
+    assert header.window_size == 256
+    assert header.windows_per_frame == 0
+    assert header.windows_per_checkpoint == 8
+
+
+def test_seek_index():
+    seek_index = SeekIndex(4)
+    seek_index.add(10, 0, set())
+    seek_index.add(300, 4096, {0, 13, 255})
+    outfile = io.BytesIO(b'window records')
+    outfile.seek(0, io.SEEK_END)
+    seek_index.write(outfile, BytesAnalyser())
+    assert len(outfile.getvalue()) == len(b'window records') + seek_index.footer_size
+
+    infile = io.BytesIO(outfile.getvalue())
+    persisted_index = SeekIndex.read(infile, 4)
+    assert infile.tell() == 0
+    assert persisted_index.compressed_offsets == [10, 300]
+    assert persisted_index.uncompressed_offsets == [0, 4096]
+    assert persisted_index.existence_states[0].count(1) == 0
+    assert persisted_index.existence_states[1].search(1) == [0, 13, 255]
+    assert persisted_index.uncompressed_size == 0
+    assert persisted_index.find(0) == 0
+    assert persisted_index.find(4095) == 0
+    assert persisted_index.find(5000) == 1
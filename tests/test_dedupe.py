@@ -0,0 +1,54 @@
+import os
+import random
+
+import pytest
+
+import dedupe
+
+
+def test_index_and_cache_in_lockstep():
+    windows = [os.urandom(100) for _ in range(6)]
+    random.seed(7)
+    index = dedupe.WindowIndex(3)
+    cache = dedupe.WindowCache(3)
+    num_references = 0
+    for window in random.choices(windows, k=500):
+        distance = index.find(window)
+        if distance is None:
+            cache.add(window)
+        else:
+            assert cache.get(distance) == window
+            num_references += 1
+    assert 0 < num_references < 500
+    assert len(index.window_numbers) == len(cache.windows) == 3
+
+
+def test_least_recently_used_eviction():
+    index = dedupe.WindowIndex(2)
+    assert [index.find(window) for window in (b'a', b'b', b'a', b'c', b'a', b'b')] == [None, None, 2, None, 4, None]
+
+
+def test_clear():
+    index = dedupe.WindowIndex(4)
+    cache = dedupe.WindowCache(4)
+    assert index.find(b'abc') is None
+    cache.add(b'abc')
+    index.clear()
+    cache.clear()
+    assert index.find(b'abc') is None
+    with pytest.raises(ValueError):
+        cache.get(1)
+
+
+def test_invalid_reference():
+    cache = dedupe.WindowCache(2)
+    cache.add(b'abc')
+    for distance in (0, 2):
+        with pytest.raises(ValueError):
+            cache.get(distance)
+    assert cache.get(1) == b'abc'
+
+
+def test_byte_values():
+    assert dedupe.byte_values(b'hello') == sorted(set(b'hello'))
+    assert dedupe.byte_values(b'') == []
@@ -0,0 +1,27 @@
+import byte_util
+import frames
+import util
+from container import Header
+from window_compressor import WindowCompressor
+
+
+def test_compress_windows():
+    window_size = 256
+    input_bytes = byte_util.random_sparse_bytes(5 * window_size + 17)
+    existence_index_set = set()
+    compressor = WindowCompressor(window_size)
+    expected = b''
+    for start in range(0, len(input_bytes), window_size):
+        compressed_bytes = compressor.process(input_bytes[start:start + window_size], existence_index_set)
+        expected += len(compressed_bytes).to_bytes(util.NUM_BYTES_FOR_PERSISTED_PARAMETERS, 'big') + compressed_bytes
+    assert frames.compress_windows(Header(window_size), input_bytes, set()) == expected
+
+
+def test_compression_tasks_are_independent():
+    window_size = 128
+    input_bytes = byte_util.random_sparse_bytes(12 * window_size)
+    batches = [input_bytes[i:i + 4 * window_size] for i in range(0, len(input_bytes), 4 * window_size)]
+    header = Header(window_size)
+    serial = frames.compress_windows(header, input_bytes, set())
+    tasks = frames.compression_tasks(batches, header)
+    assert b''.join(records for _, records in frames.ordered_map(frames.compress_windows, tasks, 2)) == serial
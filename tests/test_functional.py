@@ -1,8 +1,19 @@
+import argparse
+import io
+import os
 import random
+import sys
+from collections import Counter
+
+import pytest
 
 import byte_util
+import codec
 import main
 import util
+from bytes_analyser import BytesAnalyser
+from container import MAX_LEGACY_WINDOW_SIZE, Header, SeekIndex
+from stats import Stats
 from window_compressor import WindowCompressor
 from window_decompressor import WindowDecompressor
 
@@ -11,10 +22,277 @@ def test_roundtrips():
     existence_index_set = set()
     existence_bitarray = util.empty_bitarray(256)
     for i in range(25):
-        n = random.randint(main.DEFAULT_WINDOW_SIZE, main.MAX_WINDOW_SIZE)
+        n = random.randint(main.DEFAULT_WINDOW_SIZE, MAX_LEGACY_WINDOW_SIZE)
         input_bytes = byte_util.random_sparse_bytes(n)
         compressor = WindowCompressor(n)
         compressed_bytes = compressor.process(input_bytes, existence_index_set)
         decompressor = WindowDecompressor(n)
         decompressed_bytes = decompressor.process(compressed_bytes, existence_bitarray)
         assert decompressed_bytes == input_bytes
+
+
+def test_file_roundtrips(tmp_path):
+    input_path = tmp_path / 'input'
+    input_path.write_bytes(byte_util.random_sparse_bytes(40000))
+    outputs = []
+    for windows_per_frame, jobs in ((0, 1), (0, 3), (4, 1), (4, 3)):
+        compressed_path = tmp_path / f'compressed_{windows_per_frame}_{jobs}'
+        decompressed_path = tmp_path / f'decompressed_{windows_per_frame}_{jobs}'
+        main.compress_file(input_path, compressed_path, 1024, windows_per_frame, jobs)
+        main.decompress_file(compressed_path, decompressed_path)
+        assert decompressed_path.read_bytes() == input_path.read_bytes()
+        outputs.append(compressed_path.read_bytes())
+    assert outputs[0] == outputs[1]
+    assert outputs[2] == outputs[3]
+
+
+def test_block_ranking_roundtrips(tmp_path):
+    input_path = tmp_path / 'input'
+    input_path.write_bytes(byte_util.random_sparse_bytes(20000))
+    for block_bits in (32, 64):
+        compressed_path = tmp_path / f'compressed_{block_bits}'
+        decompressed_path = tmp_path / f'decompressed_{block_bits}'
+        main.compress_file(input_path, compressed_path, 1000, block_bits=block_bits)
+        main.decompress_file(compressed_path, decompressed_path)
+        assert decompressed_path.read_bytes() == input_path.read_bytes()
+
+
+def test_large_window_roundtrips(tmp_path):
+    input_path = tmp_path / 'input'
+    input_path.write_bytes(byte_util.random_sparse_bytes(150000))
+    for block_bits in (0, 64):
+        compressed_path = tmp_path / f'compressed_{block_bits}'
+        decompressed_path = tmp_path / f'decompressed_{block_bits}'
+        main.compress_file(input_path, compressed_path, 1 << 16, windows_per_checkpoint=1, block_bits=block_bits)
+        assert compressed_path.read_bytes()[6] == 2  # format version
+        main.decompress_file(compressed_path, decompressed_path)
+        assert decompressed_path.read_bytes() == input_path.read_bytes()
+        assert main.decompress_range(compressed_path, 70000, 100) == input_path.read_bytes()[70000:70100]
+
+
+def test_decompress_range(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = bytes(byte_util.random_sparse_bytes(30000))
+    input_path.write_bytes(input_bytes)
+    for windows_per_frame, windows_per_checkpoint in ((0, 0), (0, 3), (2, 4)):
+        compressed_path = tmp_path / f'compressed_{windows_per_frame}_{windows_per_checkpoint}'
+        main.compress_file(input_path, compressed_path, 1000, windows_per_frame,
+                           windows_per_checkpoint=windows_per_checkpoint)
+        decompressed_path = tmp_path / f'decompressed_{windows_per_frame}_{windows_per_checkpoint}'
+        main.decompress_file(compressed_path, decompressed_path)
+        assert decompressed_path.read_bytes() == input_bytes
+        for start, length in ((0, 10), (999, 2), (3000, 4000), (12345, 1), (29000, 5000), (40000, 10)):
+            assert main.decompress_range(compressed_path, start, length) == input_bytes[start:start + length]
+
+
+def test_parse_range(tmp_path, monkeypatch):
+    assert main.parse_range('0:10') == (0, 10)
+    assert main.parse_range('12345:0') == (12345, 0)
+    for text in ('abc', '5', '1:2:3', '-1:5', '5:-1', ':'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            main.parse_range(text)
+    input_path = tmp_path / 'input'
+    input_path.write_bytes(bytes(100))
+    monkeypatch.setattr(sys, 'argv', ['main.py', '-r', '1:2:3', str(input_path)])
+    with pytest.raises(SystemExit) as e:
+        main.main()
+    assert e.value.code == 2  # a usage error rather than a traceback
+
+
+def test_parallel_decompression(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = bytes(byte_util.random_sparse_bytes(20000))
+    input_path.write_bytes(input_bytes)
+    compressed_path = tmp_path / 'compressed'
+    main.compress_file(input_path, compressed_path, 512, windows_per_checkpoint=5)
+    for jobs in (1, 3):
+        decompressed_path = tmp_path / f'decompressed_{jobs}'
+        d_in_analyser, d_out_analyser = main.decompress_file(compressed_path, decompressed_path, jobs)
+        assert decompressed_path.read_bytes() == input_bytes
+        assert d_out_analyser.num_bytes == len(input_bytes)
+        assert (d_in_analyser is None) == (jobs > 1)  # the input is only read again if progress or stats are wanted
+    compressed_bytes = bytearray(compressed_path.read_bytes())
+    with open(compressed_path, 'rb') as compressed_file:
+        header = Header.read(compressed_file, BytesAnalyser(count_bytes=False))
+        footer_size = SeekIndex.read(compressed_file, header.windows_per_checkpoint).footer_size
+    compressed_bytes[-footer_size - 1] ^= 1  # the last byte of the published digest
+    corrupt_path = tmp_path / 'corrupt'
+    corrupt_path.write_bytes(compressed_bytes)
+    for jobs in (1, 3):
+        with pytest.raises(ValueError):
+            main.decompress_file(corrupt_path, tmp_path / f'corrupt_{jobs}', jobs)
+    compressed_bytes = codec.compress(input_bytes, 512)
+    # Without the last byte of the payload, the last record runs into the digest.
+    corrupt_path.write_bytes(compressed_bytes[:-header.digest_size - 1] + compressed_bytes[-header.digest_size:])
+    with pytest.raises(ValueError, match='Truncated'):
+        main.decompress_file(corrupt_path, tmp_path / 'truncated')
+
+
+def test_parallel_decompression_needs_seek_index(tmp_path, monkeypatch, capsys):
+    input_bytes = bytes(byte_util.random_sparse_bytes(5000))
+    for windows_per_checkpoint in (0, 2):
+        compressed_path = tmp_path / f'compressed_{windows_per_checkpoint}{main.COMPRESSED_EXT}'
+        compressed_path.write_bytes(codec.compress(input_bytes, 512, windows_per_checkpoint=windows_per_checkpoint))
+        monkeypatch.setattr(sys, 'argv', ['main.py', '-d', '-k', '-j', '2', str(compressed_path)])
+        main.main()
+        assert (tmp_path / f'compressed_{windows_per_checkpoint}').read_bytes() == input_bytes
+        assert ('needs a seek index' in capsys.readouterr().err) == (not windows_per_checkpoint)
+
+
+def test_digest_roundtrips(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = bytes(byte_util.random_sparse_bytes(20000))
+    input_path.write_bytes(input_bytes)
+    for digest in ('blake2b', 'crc32'):
+        compressed_path = tmp_path / f'compressed_{digest}'
+        main.compress_file(input_path, compressed_path, 1000, windows_per_checkpoint=4, digest=digest)
+        for jobs in (1, 2):
+            decompressed_path = tmp_path / f'decompressed_{digest}_{jobs}'
+            main.decompress_file(compressed_path, decompressed_path, jobs)
+            assert decompressed_path.read_bytes() == input_bytes
+        assert main.decompress_range(compressed_path, 5000, 100) == input_bytes[5000:5100]
+
+
+def test_large_header_fields(tmp_path, monkeypatch):
+    input_bytes = bytes(byte_util.random_sparse_bytes(3000))
+    input_path = tmp_path / 'input'
+    input_path.write_bytes(input_bytes)
+    compressed_path = tmp_path / f'input{main.COMPRESSED_EXT}'
+    for option, attribute in (('-f', 'windows_per_frame'), ('-i', 'windows_per_checkpoint')):
+        monkeypatch.setattr(sys, 'argv', ['main.py', '-k', option, '70000', str(input_path)])
+        main.main()
+        with open(compressed_path, 'rb') as compressed_file:
+            assert getattr(Header.read(compressed_file, BytesAnalyser(count_bytes=False)), attribute) == 70000
+        assert codec.decompress(compressed_path.read_bytes()) == input_bytes
+
+
+def test_special_windows(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = os.urandom(5000) + bytes(byte_util.random_sparse_bytes(5000))
+    input_path.write_bytes(input_bytes)
+    for special_windows in (False, True):
+        compressed_path = tmp_path / f'compressed_{special_windows}'
+        decompressed_path = tmp_path / f'decompressed_{special_windows}'
+        main.compress_file(input_path, compressed_path, 1000, windows_per_checkpoint=3, special_windows=special_windows)
+        main.decompress_file(compressed_path, decompressed_path)
+        assert decompressed_path.read_bytes() == input_bytes
+        assert main.decompress_range(compressed_path, 4500, 1000) == input_bytes[4500:5500]
+    assert (tmp_path / 'compressed_True').stat().st_size < (tmp_path / 'compressed_False').stat().st_size
+
+
+def test_window_counts(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = (os.urandom(1000) + bytes(2000) + b'\x07' * 1000 + b'ACGT' * 250 +
+                   bytes(byte_util.random_sparse_bytes(1000)))
+    input_path.write_bytes(input_bytes)
+    compressed_path = tmp_path / 'compressed'
+    compression_counts = Counter()
+    main.compress_file(input_path, compressed_path, 1000, windows_per_checkpoint=2, window_counts=compression_counts)
+    assert compression_counts == Counter({'stored': 1, 'zero': 2, 'run': 1, 'small alphabet': 1, 'ranked': 1})
+    for jobs in (1, 2):
+        decompression_counts = Counter()
+        main.decompress_file(compressed_path, tmp_path / f'decompressed_{jobs}', jobs, window_counts=decompression_counts)
+        assert decompression_counts == compression_counts
+        assert (tmp_path / f'decompressed_{jobs}').read_bytes() == input_bytes
+
+
+def test_stats(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = bytes(byte_util.random_sparse_bytes(5000)) + bytes(1000)
+    input_path.write_bytes(input_bytes)
+    plain_path = tmp_path / 'plain'
+    main.compress_file(input_path, plain_path, 1000, windows_per_checkpoint=2)
+    for jobs in (1, 2):
+        compressed_path = tmp_path / f'compressed_{jobs}'
+        compression_stats = Stats()
+        main.compress_file(input_path, compressed_path, 1000, jobs=jobs, windows_per_checkpoint=2,
+                           stats=compression_stats)
+        assert compressed_path.read_bytes() == plain_path.read_bytes()
+        assert compression_stats.counts['windows'] == 6
+        assert compression_stats.counts['special_windows'] == 1
+        assert sum(compression_stats.histograms['k'].values()) == compression_stats.counts['bitsets']
+        assert {'analysis', 'bucketing', 'reduction', 'ranking', 'packing', 'write', 'total'} <= \
+            set(compression_stats.seconds)
+        decompression_stats = Stats()
+        main.decompress_file(compressed_path, tmp_path / f'decompressed_{jobs}', jobs, stats=decompression_stats)
+        assert (tmp_path / f'decompressed_{jobs}').read_bytes() == input_bytes
+        assert decompression_stats.counts['windows'] == 6
+        assert decompression_stats.counts['bitsets'] == compression_stats.counts['bitsets']
+        assert {'unranking', 'rehydration', 'special'} <= set(decompression_stats.seconds)
+
+
+def test_buffer_sizes(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = bytes(byte_util.random_sparse_bytes(10000)) + os.urandom(3000)
+    input_path.write_bytes(input_bytes)
+    compressed_path = tmp_path / 'compressed'
+    main.compress_file(input_path, compressed_path, 1000, buffer_size=1)
+    for buffer_size in (1, 2500, 1 << 20):
+        decompressed_path = tmp_path / f'decompressed_{buffer_size}'
+        main.decompress_file(compressed_path, decompressed_path, buffer_size=buffer_size)
+        assert decompressed_path.read_bytes() == input_bytes
+
+
+def test_pipelined_drivers(tmp_path):
+    input_path = tmp_path / 'input'
+    input_bytes = bytes(byte_util.random_sparse_bytes(20000)) + os.urandom(3000)
+    input_path.write_bytes(input_bytes)
+    compressed = {}
+    for queue_depth in (0, 1, 4):
+        compressed_path = tmp_path / f'compressed_{queue_depth}'
+        main.compress_file(input_path, compressed_path, 1000, queue_depth=queue_depth)
+        compressed[queue_depth] = compressed_path.read_bytes()
+        stream = io.BytesIO()
+        main.compress_stream(io.BytesIO(input_bytes), stream, 1000, buffer_size=777, queue_depth=queue_depth)
+        assert stream.getvalue() == compressed[queue_depth] == compressed[0]
+        decompressed_path = tmp_path / f'decompressed_{queue_depth}'
+        main.decompress_file(compressed_path, decompressed_path, buffer_size=2500, queue_depth=queue_depth)
+        assert decompressed_path.read_bytes() == input_bytes
+        stream = io.BytesIO()
+        in_analyser, out_analyser = main.decompress_stream(io.BytesIO(compressed[0]), stream, buffer_size=777,
+                                                           queue_depth=queue_depth)
+        assert stream.getvalue() == input_bytes
+        assert in_analyser.num_bytes == len(compressed[0]) and out_analyser.num_bytes == len(input_bytes)
+
+
+def test_dedupe(tmp_path):
+    input_path = tmp_path / 'input'
+    windows = [bytes(byte_util.random_sparse_bytes(1000)) for _ in range(4)]
+    input_bytes = b''.join(windows[i] for i in (0, 1, 0, 2, 1, 3, 0, 0, 1, 2)) + windows[3][:500]
+    input_path.write_bytes(input_bytes)
+    plain_path = tmp_path / 'plain'
+    main.compress_file(input_path, plain_path, 1000, windows_per_checkpoint=4)
+    for jobs in (1, 2):
+        compressed_path = tmp_path / f'compressed_{jobs}'
+        window_counts = Counter()
+        stats = Stats()
+        main.compress_file(input_path, compressed_path, 1000, jobs=jobs, windows_per_checkpoint=4,
+                           window_counts=window_counts, stats=stats, dedupe_windows=3)
+        assert compressed_path.stat().st_size < plain_path.stat().st_size
+        assert window_counts['reference'] == stats.counts['references'] == 2  # none across checkpoints
+        stream = io.BytesIO()
+        main.compress_stream(io.BytesIO(input_bytes), stream, 1000, windows_per_checkpoint=4, dedupe_windows=3)
+        assert stream.getvalue() == compressed_path.read_bytes()
+        decompressed_path = tmp_path / f'decompressed_{jobs}'
+        main.decompress_file(compressed_path, decompressed_path, jobs)
+        assert decompressed_path.read_bytes() == input_bytes
+        for start, length in ((0, 10), (6500, 1000), (9000, 2000)):
+            assert main.decompress_range(compressed_path, start, length) == input_bytes[start:start + length]
+
+
+def test_stdout_reports_input_digest(tmp_path, monkeypatch, capsysbinary):
+    input_bytes = bytes(byte_util.random_sparse_bytes(5000))
+    for digest in ('blake2b', 'crc32'):
+        compressed_bytes = codec.compress(input_bytes, digest=digest)
+        compressed_path = tmp_path / f'compressed_{digest}{main.COMPRESSED_EXT}'
+        compressed_path.write_bytes(compressed_bytes)
+        monkeypatch.setattr(sys, 'argv', ['main.py', '-d', '-c', '-v', str(compressed_path)])
+        main.main()
+        captured = capsysbinary.readouterr()
+        assert captured.out == input_bytes
+        analyser = BytesAnalyser(digest)
+        analyser.update(compressed_bytes)
+        assert f'Input:: {digest.upper()}: {analyser.compute_digest_hex()};'.encode() in captured.err
+        stream = io.BytesIO()
+        in_analyser, _ = main.decompress_stream(io.BytesIO(compressed_bytes), stream)
+        assert in_analyser.compute_digest_hex() == analyser.compute_digest_hex()
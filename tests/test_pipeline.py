@@ -0,0 +1,80 @@
+import io
+import os
+
+import pytest
+
+from pipeline import PipelinedReader, PipelinedWriter, pipelined_input, pipelined_output
+from stats import Stats
+
+
+class FailingStream(io.RawIOBase):
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, buffer):
+        raise OSError('read failed')
+
+    def write(self, data):
+        raise OSError('write failed')
+
+
+def test_reader_preserves_order():
+    data = os.urandom(10000)
+    with PipelinedReader(io.BytesIO(data), 7, queue_depth=2) as reader:
+        assert reader.read(1) == data[:1]
+        assert reader.read(1000) == data[1:1001]
+        assert reader.read() == data[1001:]
+        assert reader.read(10) == b''
+
+
+def test_reader_raises_stream_errors():
+    with PipelinedReader(FailingStream(), 10) as reader:
+        with pytest.raises(OSError, match='read failed'):
+            reader.read(1)
+
+
+def test_reader_closes_early():
+    with PipelinedReader(io.BytesIO(bytes(1000)), 1, queue_depth=1) as reader:
+        assert reader.read(1) == b'\x00'
+    assert reader.closed
+
+
+def test_writer_preserves_order():
+    data = os.urandom(10000)
+    outfile = io.BytesIO()
+    buffer = bytearray(100)
+    with PipelinedWriter(outfile, queue_depth=2) as writer:
+        for offset in range(0, len(data), len(buffer)):
+            buffer[:] = data[offset:offset + len(buffer)]
+            writer.write(buffer)  # the buffer is reused at once
+        writer.flush()
+        assert outfile.getvalue() == data
+    assert outfile.getvalue() == data
+
+
+def test_writer_raises_stream_errors():
+    writer = PipelinedWriter(FailingStream(), queue_depth=1)
+    with pytest.raises(OSError, match='write failed'):
+        for _ in range(10):
+            writer.write(b'abc')
+        writer.close()
+    assert writer.error is not None
+
+
+def test_stats():
+    stats = Stats()
+    outfile = io.BytesIO()
+    with PipelinedReader(io.BytesIO(bytes(100)), 10, stats=stats) as reader, \
+            PipelinedWriter(outfile, stats=stats) as writer:
+        writer.write(reader.read())
+    assert set(stats.seconds) == {'reader_read', 'reader_blocked', 'compute_blocked_on_input',
+                                  'compute_blocked_on_output', 'writer_blocked', 'writer_write'}
+
+
+def test_no_threads():
+    infile, outfile = io.BytesIO(), io.BytesIO()
+    with pipelined_input(infile, 10, 0) as reader, pipelined_output(outfile, 0) as writer:
+        assert reader is infile and writer is outfile
@@ -0,0 +1,36 @@
+import os
+
+import byte_util
+import segmentation
+from window_compressor import WindowCompressor
+
+
+def test_candidate_sizes():
+    assert segmentation.candidate_sizes(1024, 0) == [1024]
+    assert segmentation.candidate_sizes(1024, 3) == [128, 256, 512, 1024]
+    assert segmentation.candidate_sizes(1000, 6) == [125, 250, 500, 1000]
+    assert segmentation.candidate_sizes(64, 6) == [16, 32, 64]
+
+
+def test_fixed_windows():
+    compressor = WindowCompressor(1000, special_windows=True)
+    assert segmentation.window_lengths(compressor, bytes(3500), set()) == [1000, 1000, 1000, 500]
+    assert segmentation.window_lengths(compressor, b'', set(), 3) == []
+
+
+def test_adaptive_windows():
+    compressor = WindowCompressor(1024, special_windows=True)
+    input_bytes = bytes(1000) + os.urandom(3000) + b'abcd' * 2000 + os.urandom(100)
+    for level in range(1, segmentation.MAX_LEVEL + 1):
+        lengths = segmentation.window_lengths(compressor, input_bytes, set(), level)
+        assert sum(lengths) == len(input_bytes)
+        assert all(0 < length <= 1024 for length in lengths)
+        assert all(length in segmentation.candidate_sizes(1024, level) for length in lengths[:-1])
+    assert len(segmentation.window_lengths(compressor, input_bytes, set(), 4)) > -(-len(input_bytes) // 1024)
+
+
+def test_whole_runs_end_with_whole_windows():
+    compressor = WindowCompressor(256, special_windows=True)
+    input_bytes = bytes(byte_util.random_sparse_bytes(2000)) + bytes(560)
+    lengths = segmentation.window_lengths(compressor, input_bytes, set(), 3)
+    assert sum(lengths) == len(input_bytes) and lengths[-1] == 256
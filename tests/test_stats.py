@@ -0,0 +1,39 @@
+import json
+import time
+
+from stats import Stats
+
+
+def test_time_and_counts():
+    stats = Stats()
+    start = time.perf_counter()
+    end = stats.time('ranking', start)
+    assert stats.seconds['ranking'] == end - start
+    stats.count('windows')
+    stats.count('rank_bits', 10)
+    assert stats.counts == {'windows': 1, 'rank_bits': 10}
+
+
+def test_histograms():
+    stats = Stats()
+    for value in (0, 1, 2, 3, 4, 1023, 1024):
+        stats.observe('k', value)
+    assert stats.histograms['k'] == {0: 1, 1: 1, 2: 2, 3: 1, 10: 1, 11: 1}
+
+
+def test_merge_and_write(tmp_path):
+    stats = Stats()
+    stats.count('windows', 2)
+    stats.observe('k', 5)
+    other = Stats()
+    other.count('windows', 3)
+    other.observe('k', 6)
+    other.time('unranking', time.perf_counter())
+    stats.merge(other)
+    path = tmp_path / 'stats.json'
+    stats.write(path, {'window_kinds': {'ranked': 5}})
+    persisted = json.loads(path.read_text())
+    assert persisted['counts'] == {'windows': 5}
+    assert persisted['histograms'] == {'k': {'3': 2}}
+    assert set(persisted['seconds']) == {'unranking'}
+    assert persisted['window_kinds'] == {'ranked': 5}
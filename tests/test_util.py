@@ -1,3 +1,5 @@
+import math
+
 import gmpy2
 from bitarray import bitarray
 
@@ -109,3 +111,21 @@ def test_falling_factorial():
     assert util.falling_factorial(5, 5) == 120
     assert util.falling_factorial(5, 6) == 0
     assert util.falling_factorial(5, 42) == 0
+
+
+def test_natural_log():
+    assert math.isclose(util.natural_log(1), 0.0)
+    assert math.isclose(util.natural_log(1000), math.log(1000))
+    assert math.isclose(util.natural_log(1 << 5000), 5000 * math.log(2))
+
+
+def test_log_binomial():
+    assert math.isclose(util.log_binomial(4096, 700), math.log(math.comb(4096, 700)))
+
+
+def test_varint():
+    for val in (0, 1, 127, 128, 300, 65535, 1 << 20, (1 << 64) + 3):
+        encoded = util.encode_varint(val)
+        assert len(encoded) == max(1, -(-val.bit_length() // 7))
+        assert util.decode_varint(b'xx' + encoded, 2) == (val, 2 + len(encoded))
+    assert util.encode_varint(300) == b'\xac\x02'
@@ -1,5 +1,14 @@
+import math
+import random
+
+import numpy as np
+
 import byte_util
-from window_compressor import WindowCompressor
+import util
+import window_kinds
+from window_compressor import (WindowCompressor, index_set_to_compression_index, index_set_to_compression_index_split,
+                               min_split_k, reduced_index_sets)
+from window_decompressor import WindowDecompressor
 
 
 def test_process_same_bytes():
@@ -19,3 +28,82 @@ def test_process_blocky():
                    byte_util.same_bytes(32, 107))
     compressed_bytes = compressor.process(input_bytes, existence_index_set)
     assert compressed_bytes == b'\x81\x1b \xaa\xb4\x1a\x00\x00\x00\x00\x00\x0c\xb7d\xf9\'\xd8!"\xc0\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x082\xdd\x93\xe4\x9f`\x84\x8a'
+
+
+def test_special_windows():
+    random.seed(15)
+    n = 1024
+    compressor = WindowCompressor(n, special_windows=True)
+    decompressor = WindowDecompressor(n, special_windows=True)
+    existence_index_set = set()
+    existence_bitarray = util.empty_bitarray(256)
+    incompressible_bytes = random.randbytes(n)
+    for input_bytes in (incompressible_bytes, byte_util.random_sparse_bytes(n), incompressible_bytes[:100]):
+        input_bytes = bytes(input_bytes)
+        compressed_bytes = compressor.process(input_bytes, existence_index_set)
+        is_stored = compressed_bytes == window_kinds.encode_stored(input_bytes)
+        assert is_stored == (input_bytes[0] == incompressible_bytes[0])
+        assert decompressor.process(compressed_bytes, existence_bitarray) == input_bytes
+        assert util.get_index_set(existence_bitarray) == sorted(existence_index_set)
+
+
+def test_estimate_num_bits():
+    n = 1024
+    compressor = WindowCompressor(n, special_windows=True)
+    for input_bytes in (bytes(byte_util.random_sparse_bytes(n)), bytes(byte_util.same_bytes(n, 13))):
+        byte_counts = np.bincount(np.frombuffer(input_bytes, dtype=np.uint8), minlength=256)
+        estimate = compressor.estimate_num_bits(byte_counts, np.flatnonzero(byte_counts).tolist(), set())
+        num_bits = 8 * len(compressor.process(input_bytes, set()))
+        assert estimate <= num_bits < estimate + 16
+
+
+def test_densest_last():
+    random.seed(21)
+    n = 1024
+    text = bytes(random.choices(b'    eetaoin\n', k=n))
+    for block_bits in (0, 64):
+        compressor = WindowCompressor(n, block_bits=block_bits, densest_last=True)
+        decompressor = WindowDecompressor(n, block_bits=block_bits, densest_last=True)
+        existence_index_set = set()
+        existence_bitarray = util.empty_bitarray(256)
+        for input_bytes in (text, bytes(byte_util.random_sparse_bytes(n)), text[:300], b'\x07' * 50, b''):
+            compressed_bytes = compressor.process(input_bytes, existence_index_set)
+            assert decompressor.process(compressed_bytes, existence_bitarray) == input_bytes
+    byte_counts = np.bincount(np.frombuffer(text, dtype=np.uint8), minlength=256)
+    byte_vals = np.flatnonzero(byte_counts).tolist()
+    ordered_vals, densest = WindowCompressor(n, densest_last=True).emission_order(byte_counts, byte_vals)
+    assert ordered_vals[-1] == ord(' ') == byte_vals[densest] and sorted(ordered_vals) == byte_vals
+    assert len(WindowCompressor(n, densest_last=True).process(text, set())) <= \
+        len(WindowCompressor(n).process(text, set()))
+    compressor = WindowCompressor(n, special_windows=True, densest_last=True)
+    estimate = compressor.estimate_num_bits(byte_counts, byte_vals, set())
+    assert estimate <= 8 * len(compressor.process(text, set())) < estimate + 16
+
+
+def test_index_set_to_compression_index_split():
+    random.seed(7)
+    for num_bits, k in ((64, 1), (64, 2), (300, 40), (1024, 512), (4096, 1500), (4096, 4096)):
+        for index_set in (sorted(random.sample(range(num_bits), k)), list(range(k - 1)) + [num_bits - 1]):
+            expected = sum(math.comb(position, j) for j, position in enumerate(index_set, 1))
+            assert index_set_to_compression_index_split(index_set) == expected
+
+
+def test_min_split_k():
+    assert [min_split_k(num_bits) for num_bits in (256, 1024, 4096, 16384, 65536)] == [512, 512, 640, 1280, 2560]
+    random.seed(8)
+    for num_bits, k in ((4096, 639), (4096, 640), (4096, 700), (16384, 1300)):  # either side of the threshold
+        index_set = sorted(random.sample(range(num_bits - 1), k - 1)) + [num_bits - 1]
+        expected = sum(math.comb(position, j) for j, position in enumerate(index_set, 1))
+        assert index_set_to_compression_index(index_set) == expected
+
+
+def test_reduced_index_sets():
+    random.seed(10)
+    input_bytes = bytes(random.choices(b'abcdz', k=500))
+    byte_vals = sorted(set(input_bytes))
+    unclaimed = list(range(len(input_bytes)))
+    expected = []
+    for b in byte_vals:
+        expected.append([i for i, position in enumerate(unclaimed) if input_bytes[position] == b])
+        unclaimed = [position for position in unclaimed if input_bytes[position] != b]
+    assert reduced_index_sets(np.frombuffer(input_bytes, dtype=np.uint8), byte_vals) == expected
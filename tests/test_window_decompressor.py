@@ -1,6 +1,13 @@
+import math
+import random
+
+import pytest
+
 import byte_util
 import util
-from window_decompressor import WindowDecompressor
+from bit_stream import BitWriter
+from window_compressor import WindowCompressor, index_set_to_compression_index
+from window_decompressor import WindowDecompressor, compression_index_to_bitarray, compression_index_to_index_set
 
 
 def test_process_same_bytes():
@@ -11,6 +18,15 @@ def test_process_same_bytes():
     assert decompressed_bytes == byte_util.same_bytes(1024, 13)
 
 
+def test_window_length():
+    compressor = WindowCompressor(1000, special_windows=True)
+    decompressor = WindowDecompressor(1000, special_windows=True)
+    for input_bytes in (bytes(byte_util.random_sparse_bytes(1000)), bytes(byte_util.random_sparse_bytes(123)),
+                        bytes(999), b'\x07' * 10, b'ab' * 300, bytes(range(256))):
+        assert decompressor.window_length(compressor.process(input_bytes, set())) == len(input_bytes)
+    assert WindowDecompressor(1000).window_length(WindowCompressor(1000).process(b'abc' * 100, set())) == 300
+
+
 def test_process_blocky():
     compressed_bytes = b'\x81\x1b \xaa\xb4\x1a\x00\x00\x00\x00\x00\x0c\xb7d\xf9\'\xd8!"\xc0\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x082\xdd\x93\xe4\x9f`\x84\x8a'
     decompressor = WindowDecompressor(128)
@@ -20,3 +36,34 @@ def test_process_blocky():
                                   byte_util.same_bytes(32, 3) +
                                   byte_util.same_bytes(32, 230) +
                                   byte_util.same_bytes(32, 107))
+
+
+def test_compression_index_to_bitarray():
+    for num_bits in (1, 2, 17, 256, 4096):
+        for k in sorted({0, 1, min(2, num_bits), num_bits // 7, num_bits // 2, num_bits - 1, num_bits}):
+            index_set = sorted(random.sample(range(num_bits), k))
+            expected = util.empty_bitarray(num_bits)
+            expected[index_set] = 1
+            compression_index = index_set_to_compression_index(index_set)
+            assert compression_index_to_bitarray(compression_index, k, num_bits) == expected
+
+
+def test_corrupt_compression_index():
+    for index, k_val, num_bits in ((10, 2, 5), (1, 3, 2), (5, 1, 4), (1 << 40, 3, 64)):
+        with pytest.raises(ValueError):
+            compression_index_to_index_set(index, k_val, num_bits)
+
+
+def test_corrupt_window():
+    existence_count = 2
+    existence_rank = index_set_to_compression_index([ord('A'), ord('B')])
+    for k in (9, 8):  # more positions than the window, then none left for the inferred byte value
+        writer = BitWriter()
+        writer.write(1, 1)  # a full window of 8 bytes
+        writer.write(existence_count, 9)
+        writer.write(existence_rank, util.num_bits_required_to_represent(math.comb(256, existence_count)))
+        writer.write(4, 4)  # the width of each k
+        writer.write(k, 4)
+        writer.write(0, 8)
+        with pytest.raises(ValueError, match='corrupt window'):
+            WindowDecompressor(8).process(writer.tobytes(), util.empty_bitarray(256))
@@ -0,0 +1,67 @@
+import random
+
+import numpy as np
+import pytest
+
+import byte_util
+import util
+import window_kinds
+from window_compressor import WindowCompressor
+from window_decompressor import WindowDecompressor
+
+
+def roundtrip(input_bytes: bytes, existence_index_set: set, existence_bitarray) -> bytes:
+    n = 1024
+    compressed_bytes = WindowCompressor(n, special_windows=True).process(input_bytes, existence_index_set)
+    assert WindowDecompressor(n, special_windows=True).process(compressed_bytes, existence_bitarray) == input_bytes
+    assert util.get_index_set(existence_bitarray) == sorted(existence_index_set)
+    return compressed_bytes
+
+
+def test_run_and_zero_windows():
+    existence_index_set = set()
+    existence_bitarray = util.empty_bitarray(256)
+    for n, value, kind in ((1024, 13, 'run'), (1024, 0, 'zero'), (7, 255, 'run'), (1, 0, 'zero')):
+        compressed_bytes = roundtrip(bytes(byte_util.same_bytes(n, value)), existence_index_set, existence_bitarray)
+        assert compressed_bytes == window_kinds.encode_run(n, value)
+        assert window_kinds.kind_name(compressed_bytes, True) == kind
+        assert existence_index_set == {value}
+
+
+def test_small_alphabet_windows():
+    existence_index_set = {1, 2, 3}
+    existence_bitarray = util.empty_bitarray(256)
+    existence_bitarray[[1, 2, 3]] = 1
+    # Evenly used alphabets of 2 or 4 values fill their symbol indices, so ranking cannot beat them; skewed or
+    # 3-value alphabets are ranked.
+    for alphabet, kind in ((b'\x00\xff', 'small alphabet'), (b'ACGT', 'small alphabet'), (b'xyz\x00', 'small alphabet'),
+                           (b'xyz', 'ranked'), (b'AAAC', 'ranked')):
+        input_bytes = (alphabet * 1000)[:1000]
+        compressed_bytes = roundtrip(input_bytes, existence_index_set, existence_bitarray)
+        assert window_kinds.kind_name(compressed_bytes, True) == kind
+        assert len(compressed_bytes) <= window_kinds.small_alphabet_size(1000, len(set(alphabet)))
+    random.seed(16)
+    for alphabet in (b'\x00\xff', b'ACGT', b'xyz'):
+        roundtrip(bytes(random.choices(alphabet, k=1000)), existence_index_set, existence_bitarray)
+
+
+def test_kind_name():
+    assert window_kinds.kind_name(b'\x81\x01', False) == window_kinds.RANKED
+    assert window_kinds.kind_name(b'\x01\x01', True) == window_kinds.RANKED
+    assert window_kinds.kind_name(window_kinds.encode_stored(b'abc'), True) == 'stored'
+
+
+def test_decode_errors():
+    with pytest.raises(ValueError):
+        window_kinds.decode(window_kinds.encode_run(100, 7), bytearray(99))
+    with pytest.raises(ValueError):
+        window_kinds.decode(window_kinds.marker(0x7f), bytearray(10))
+
+
+def test_encode_small_alphabet():
+    window = np.frombuffer(b'abba' * 3, dtype=np.uint8)
+    encoded = window_kinds.encode_small_alphabet(window, [ord('a'), ord('b')])
+    assert encoded == b'\x83\x02ab\x0c\x66\x60'
+    out = bytearray(12)
+    assert window_kinds.decode(encoded, out) == (12, [ord('a'), ord('b')])
+    assert out == b'abba' * 3